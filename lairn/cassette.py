@@ -0,0 +1,158 @@
+"""Record and replay of LLM exchanges and HTTP fetches.
+
+In record mode every chat model call sent by the ``LLMGateway`` and every page fetched with
+``http_get`` is appended to a cassette, a gzip-compressed JSON lines file, together with its
+latency. In replay mode the same requests are answered from the cassette, after the recorded
+latency multiplied by ``latency_scale`` (0 answers at once), and a request that is not on the
+cassette raises ``CassetteMissError`` instead of going to the network. Replay goes through the
+gateway's concurrency and rate limits, cache and single flight like real requests, so recorded
+production workloads can be re-run offline to measure changes to them.
+
+A request recorded several times, e.g. the same prompt without a response cache, is answered with
+its recordings in the recorded order, the last one repeated once they are used up.
+
+Enable it with ``--record``/``--replay`` of the CLI or with ``LAIRN_CASSETTE``,
+``LAIRN_CASSETTE_MODE`` (``record`` or ``replay``) and ``LAIRN_CASSETTE_LATENCY_SCALE``.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, TypeVar
+
+from loguru import logger
+
+from lairn import config
+
+MODES = ("record", "replay")
+
+T = TypeVar("T")
+
+
+class CassetteMissError(KeyError):
+    """A request in replay mode that is not on the cassette."""
+
+
+def request_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path: str | Path, mode: str = "replay", latency_scale: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode}, expected one of {', '.join(MODES)}")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str], deque] = defaultdict(deque)
+
+        if mode == "record":
+            # Every entry is appended as its own gzip member, so a cassette of an interrupted run is readable
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_bytes(b"")
+        else:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._entries[(entry["kind"], entry["key"])].append(entry)
+            logger.info(
+                f"Replaying {sum(map(len, self._entries.values()))} recorded requests from {self.path}"
+            )
+
+    def _record(self, kind: str, key: str, response: Any, latency: float):
+        line = json.dumps(
+            {"kind": kind, "key": key, "latency": latency, "response": response},
+            ensure_ascii=False,
+            default=str,
+        )
+        with self._lock, gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def _next(self, kind: str, key: str) -> dict:
+        with self._lock:
+            entries = self._entries.get((kind, key))
+            if not entries:
+                raise CassetteMissError(f"No recorded {kind} request {key[:12]} on {self.path}")
+            return entries.popleft() if len(entries) > 1 else entries[0]
+
+    async def arun(
+        self,
+        kind: str,
+        key: str,
+        call: Callable[[], Awaitable[T]],
+        dump: Callable[[T], Any],
+        load: Callable[[Any], T],
+    ) -> T:
+        """Result of ``call``, recorded or replayed, ``dump`` and ``load`` convert it to and from JSON."""
+        if self.mode == "replay":
+            entry = self._next(kind, key)
+            if self.latency_scale:
+                await asyncio.sleep(entry["latency"] * self.latency_scale)
+            return load(entry["response"])
+
+        start = time.monotonic()
+        result = await call()
+        self._record(kind, key, dump(result), time.monotonic() - start)
+        return result
+
+    def run(
+        self, kind: str, key: str, call: Callable[[], T], dump: Callable[[T], Any], load: Callable[[Any], T]
+    ) -> T:
+        if self.mode == "replay":
+            entry = self._next(kind, key)
+            if self.latency_scale:
+                time.sleep(entry["latency"] * self.latency_scale)
+            return load(entry["response"])
+
+        start = time.monotonic()
+        result = call()
+        self._record(kind, key, dump(result), time.monotonic() - start)
+        return result
+
+
+CASSETTE: Cassette | None = (
+    Cassette(config.CASSETTE, config.CASSETTE_MODE, config.CASSETTE_LATENCY_SCALE)
+    if config.CASSETTE
+    else None
+)
+
+
+def use_cassette(path: str | Path | None, mode: str = "replay", latency_scale: float = 1.0):
+    """Record to or replay from the cassette at ``path`` from now on, ``None`` goes back to the network."""
+    global CASSETTE
+    CASSETTE = Cassette(path, mode, latency_scale) if path is not None else None
+
+
+def replaying() -> bool:
+    return CASSETTE is not None and CASSETTE.mode == "replay"
+
+
+@dataclass
+class RecordedResponse:
+    """The parts of a ``requests.Response`` the crawlers use."""
+
+    url: str
+    status_code: int
+    text: str
+
+
+def http_get(url: str, cookies: dict | None = None) -> Any:
+    """``requests.get`` that goes through the cassette if one is in use."""
+    import requests
+
+    if CASSETTE is None:
+        return requests.get(url, cookies=cookies)
+    return CASSETTE.run(
+        "http",
+        request_key("GET", url, cookies),
+        lambda: requests.get(url, cookies=cookies),
+        lambda response: {"url": response.url, "status_code": response.status_code, "text": response.text},
+        lambda entry: RecordedResponse(**entry),
+    )
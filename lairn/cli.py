@@ -0,0 +1,494 @@
+"""Command line interface of the lairn pipelines.
+
+Every command runs its work in a single event loop, so all subjects or weeks of one invocation share
+the concurrency and rate limits of the ``LLMGateway``. Heavy modules are imported inside the
+commands to keep ``lairn --help`` fast.
+"""
+
+import asyncio
+from contextlib import nullcontext
+from datetime import date, timedelta
+from pathlib import Path
+
+import click
+from loguru import logger
+
+CURRICULA_DIR = "Schullehrplan_Grundschule"
+SUMMARIES_DIR = "Schullehrplan_Grundschule_Zusammenfassungen"
+DEFAULT_YEARS = "Schuljahre 1-2"
+
+
+def _main_dir() -> Path:
+    from lairn import config
+
+    return config.MAIN_DIR
+
+
+def _years_dir(years: str) -> Path:
+    return _main_dir() / SUMMARIES_DIR / years
+
+
+def _run(ctx: click.Context, coro, priority: str | None = None):
+    """Run ``coro`` in one event loop and print the LLM usage of the command.
+
+    LLM requests are sent with the ``--priority`` class, else with ``priority``, else with
+    ``LLM_PRIORITY``. Failures of a fan-out end the command only after all other jobs finished and
+    wrote their outputs.
+    """
+    from lairn.fanout import FanOutError
+    from lairn.llm.gateway import llm_priority
+    from lairn.llm.telemetry import TELEMETRY
+
+    try:
+        priority = ctx.obj["priority"] or priority
+        with llm_priority(priority) if priority else nullcontext():
+            result = asyncio.run(coro)
+    except FanOutError as e:
+        click.echo(TELEMETRY.summary())
+        raise click.ClickException(f"{e}\nRun the command again to retry only the failed ones.") from e
+    click.echo(TELEMETRY.summary())
+    if ctx.obj["dry_run"]:
+        click.echo("Dry run: no requests were sent and no outputs were written.")
+    return result
+
+
+def _write_output(ctx: click.Context, path: Path, text: str):
+    if ctx.obj["dry_run"]:
+        logger.info(f"Dry run, not writing {path}")
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    logger.info(f"Wrote {path}")
+
+
+def _parse_week(value: str) -> date:
+    from lairn.reporting.week_summarizer import parse_week
+
+    try:
+        return parse_week(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+@click.group()
+@click.option("--concurrency", type=int, default=None, help="Maximum concurrent LLM requests, 0 for no limit")
+@click.option("--rpm", type=int, default=None, help="Maximum LLM requests per minute, 0 for no limit")
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Answer repeated LLM requests from responses stored in this directory",
+)
+@click.option("--model", default=None, help="Chat model, defaults to LLM from the environment")
+@click.option(
+    "--hedge-percentile",
+    type=float,
+    default=None,
+    help="Send a duplicate of requests slower than this latency percentile of their stage, 0 disables it",
+)
+@click.option(
+    "--hedge-budget", type=float, default=None, help="Maximum duplicate requests per request, e.g. 0.05"
+)
+@click.option(
+    "--routing",
+    default=None,
+    help="Route requests to models by stage and prompt size: default, a JSON policy file or off",
+)
+@click.option(
+    "--priority",
+    type=click.Choice(["interactive", "normal", "backfill"]),
+    default=None,
+    help="Priority class of LLM requests, by default backfill for bulk jobs and interactive for single weeks",
+)
+@click.option("--dry-run", is_flag=True, help="Only count tokens and estimate the cost, send no requests")
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Record all LLM requests and HTTP fetches to this cassette",
+)
+@click.option(
+    "--replay",
+    type=click.Path(dir_okay=False, exists=True, path_type=Path),
+    default=None,
+    help="Answer LLM requests and HTTP fetches from this cassette, without network access",
+)
+@click.option(
+    "--latency-scale",
+    type=float,
+    default=1.0,
+    show_default=True,
+    help="Factor for the recorded latencies when replaying, 0 replays without delay",
+)
+@click.pass_context
+def cli(
+    ctx,
+    concurrency,
+    rpm,
+    cache_dir,
+    model,
+    hedge_percentile,
+    hedge_budget,
+    routing,
+    priority,
+    dry_run,
+    record,
+    replay,
+    latency_scale,
+):
+    """lairn: AI-assisted learning pipelines."""
+    from lairn.llm.gateway import GATEWAY
+
+    if record and replay:
+        raise click.UsageError("Use either --record or --replay")
+    if record or replay:
+        from lairn.cassette import use_cassette
+
+        use_cassette(record or replay, "record" if record else "replay", latency_scale)
+
+    if routing is not None:
+        from lairn.llm.routing import use_routing
+
+        use_routing(routing)
+
+    GATEWAY.configure(
+        concurrency=concurrency,
+        rpm=rpm,
+        cache_dir=cache_dir,
+        dry_run=dry_run or None,
+        hedge_percentile=hedge_percentile,
+        hedge_budget=hedge_budget,
+    )
+    ctx.obj = {"model": model, "dry_run": GATEWAY.dry_run, "priority": priority}
+
+
+@cli.command()
+@click.option("--pdf-dir", type=click.Path(file_okay=False, path_type=Path), default=None)
+@click.option("--years", default=DEFAULT_YEARS, help="Directory of the summaries below the summaries dir")
+@click.option("--force", is_flag=True, help="Overwrite existing summaries")
+@click.pass_context
+def summarize(ctx, pdf_dir, years, force):
+    """Summarize the curriculum PDFs."""
+    from lairn.curriculum.summarize_curriculum import CurriculumSummarizer
+    from lairn.fanout import fan_out
+
+    pdf_dir = pdf_dir or _main_dir() / CURRICULA_DIR
+    out_dir = _years_dir(years)
+
+    async def run():
+        summarizer = CurriculumSummarizer(model_name=ctx.obj["model"])
+
+        async def summarize_pdf(pdf_path: Path):
+            out_path = out_dir / pdf_path.with_suffix(".txt").name
+            if out_path.is_file() and not force:
+                return
+            _write_output(ctx, out_path, await summarizer.summarize_curriculum_pdf(pdf_path))
+
+        outcome = await fan_out(sorted(pdf_dir.glob("*.pdf")), summarize_pdf)
+        outcome.raise_for_failures("curriculum PDFs")
+
+    _run(ctx, run(), priority="backfill")
+
+
+@cli.command()
+@click.option("--years", default=DEFAULT_YEARS, help="Directory of the summaries below the summaries dir")
+@click.option("--force", is_flag=True, help="Overwrite existing curricula")
+@click.pass_context
+def parse(ctx, years, force):
+    """Parse the curriculum summaries into structured curricula."""
+    from lairn.curriculum.curriculum_parser import CurriculumParser
+    from lairn.fanout import fan_out
+
+    summaries_dir = _years_dir(years)
+
+    async def run():
+        parser = CurriculumParser(model_name=ctx.obj["model"])
+
+        async def parse_summary(summary_path: Path):
+            out_path = (summaries_dir / "pydantic" / summary_path.name).with_suffix(".json")
+            if out_path.is_file() and not force:
+                return
+            curriculum = await parser.parse_curriculum(summary_path.read_text())
+            _write_output(ctx, out_path, curriculum.json())
+
+        outcome = await fan_out(sorted(summaries_dir.glob("*.txt")), parse_summary)
+        outcome.raise_for_failures("curriculum summaries")
+
+    _run(ctx, run(), priority="backfill")
+
+
+@cli.command()
+@click.option("--years", default=DEFAULT_YEARS, help="Directory of the summaries below the summaries dir")
+@click.option("--num-examples", type=int, default=5, help="Examples per learning target")
+@click.option("--subject", "subjects", multiple=True, help="Only these subjects (repeatable)")
+@click.option("--force", is_flag=True, help="Overwrite existing examples")
+@click.pass_context
+def examples(ctx, years, num_examples, subjects, force):
+    """Generate learning examples for every learning target."""
+    from lairn.curriculum.generate_learning_examples import (
+        LearningExampleGenerator,
+        results_to_markdown_string,
+    )
+    from lairn.curriculum.load import load_curricula
+    from lairn.curriculum.models import LearningTargetExamples
+    from lairn.fanout import Checkpoint, fan_out
+
+    years_dir = _years_dir(years)
+    curricula = load_curricula(years_dir / "pydantic")
+
+    async def run():
+        generator = LearningExampleGenerator(model_name=ctx.obj["model"])
+
+        async def generate(subject: str):
+            out_path = years_dir / "Beispiele" / f"{subject}.md"
+            if out_path.is_file() and not force:
+                return
+            # Examples of finished targets survive failures of others, a rerun only requests the rest.
+            # The checkpoint only exists while the last run of the subject failed, also a forced one.
+            checkpoint = None
+            if not ctx.obj["dry_run"]:
+                checkpoint = Checkpoint(
+                    out_path.with_name(f".{subject}.partial.jsonl"), LearningTargetExamples
+                )
+            results = await generator.create_examples(
+                curriculum=curricula[subject], num_examples=num_examples, batched=True, checkpoint=checkpoint
+            )
+            _write_output(ctx, out_path, results_to_markdown_string(subject, results))
+            if checkpoint is not None:
+                checkpoint.clear()
+
+        outcome = await fan_out(subjects or curricula, generate)
+        outcome.raise_for_failures("subjects")
+
+    _run(ctx, run(), priority="backfill")
+
+
+@cli.command()
+@click.option("--years", default=DEFAULT_YEARS, help="Directory of the summaries below the summaries dir")
+@click.option("--num-questions", type=int, default=10, help="Questions per quiz")
+@click.option("--subject", "subjects", multiple=True, help="Only these subjects (repeatable)")
+@click.option("--force", is_flag=True, help="Overwrite existing quizzes")
+@click.pass_context
+def quizzes(ctx, years, num_questions, subjects, force):
+    """Generate a starter multiple choice quiz per subject."""
+    from lairn.curriculum.load import load_curricula
+    from lairn.curriculum.quiz import generate_multiple_choice_question
+    from lairn.fanout import fan_out
+    from lairn.learn_artifact import load_evaluations
+    from lairn.llm.chat import create_chat_model
+
+    years_dir = _years_dir(years)
+    curricula = load_curricula(years_dir / "pydantic")
+    evaluations = load_evaluations(_main_dir() / "artifacts")
+
+    async def run():
+        model = create_chat_model(ctx.obj["model"])
+
+        async def generate(subject: str):
+            out_path = years_dir / "Starter Quizze" / f"{subject}.md"
+            if out_path.is_file() and not force:
+                return
+            quiz = await generate_multiple_choice_question(
+                model, subject, curricula[subject].str_format(), evaluations[subject], num_questions
+            )
+            _write_output(ctx, out_path, quiz.str_fmt())
+
+        outcome = await fan_out(subjects or curricula, generate)
+        outcome.raise_for_failures("quizzes")
+
+    _run(ctx, run(), priority="backfill")
+
+
+@cli.command()
+@click.argument("weeks", nargs=-1)
+@click.option("--weeks-ago", type=int, multiple=True, help="Week relative to the current one (repeatable)")
+@click.option("--all", "all_weeks", is_flag=True, help="Every week with logs or activities")
+@click.option("--force", is_flag=True, help="Summarize even if the inputs of a week are unchanged")
+@click.pass_context
+def week(ctx, weeks, weeks_ago, all_weeks, force):
+    """Summarize the given WEEKS (2024-W27 or any date of the week), last week by default.
+
+    Weeks whose logs, activities, prompts and model are unchanged since their saved summary are
+    skipped without calling the LLM.
+    """
+    from lairn.fanout import fan_out
+    from lairn.reporting.watcher import WatchedWeekSummarizer, WeekWatcher
+
+    # Load logs and activities once for all weeks
+    watcher = WeekWatcher()
+    watcher.build_index()
+
+    today = date.today()
+    mondays = [_parse_week(value) for value in weeks]
+    mondays += [_parse_week(str(today - timedelta(weeks=n))) for n in weeks_ago]
+    if all_weeks:
+        mondays += watcher.weeks()
+    if not mondays:
+        mondays = [_parse_week(str(today - timedelta(weeks=1)))]
+    out_dir = watcher.WEEKLY_SUMMARIES_PATH
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    async def run():
+        summarizer = WatchedWeekSummarizer(watcher, model_name=ctx.obj["model"])
+
+        async def summarize(start_date: date) -> bool:
+            year, week_number, _ = start_date.isocalendar()
+            try:
+                summary = await summarizer.aupdate_week(
+                    start_date, out_dir, force=force, save=not ctx.obj["dry_run"]
+                )
+            except ValueError as e:
+                logger.warning(f"Skipping week {year}-W{week_number}: {e}")
+                return False
+            return summary is not None
+
+        outcome = await fan_out(sorted(mondays), summarize)
+        updated = sum(outcome.results.values())
+        click.echo(f"Summarized {updated} of {len(outcome.results)} weeks, the others are unchanged or empty")
+        outcome.raise_for_failures("weeks")
+
+    # Bulk runs over all weeks must not hold up on-demand summaries of single weeks
+    _run(ctx, run(), priority="backfill" if all_weeks else "interactive")
+
+
+@cli.command()
+@click.argument("level", type=click.Choice(["month", "term", "year"]))
+@click.argument("days", nargs=-1, type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option("--force", is_flag=True, help="Rebuild even if the weekly summaries are unchanged")
+@click.pass_context
+def report(ctx, level, days, force):
+    """Build the LEVEL reports of the periods containing DAYS (today by default) from weekly summaries.
+
+    Run `lairn week --all` first to bring the weekly summaries up to date.
+    """
+    from lairn.fanout import fan_out
+    from lairn.reporting.period_report import Period, PeriodReporter
+
+    if ctx.obj["dry_run"]:
+        raise click.UsageError("report saves every level it builds, estimate the weeks with week --dry-run")
+    periods = {Period.of(level, day.date()) for day in days} or {Period.of(level, date.today())}
+
+    async def run():
+        reporter = PeriodReporter(model_name=ctx.obj["model"])
+        outcome = await fan_out(periods, lambda period: reporter.areport(period, force))
+        for period, period_report in outcome.results.items():
+            if period_report is None:
+                click.echo(f"No weekly summaries for {period.level} {period.label}")
+            else:
+                click.echo(period_report.str_fmt())
+        outcome.raise_for_failures("reports")
+
+    _run(ctx, run())
+
+
+@cli.command()
+@click.option("--debounce", type=float, default=5.0, help="Seconds without file events before updating")
+@click.option("--poll-interval", type=float, default=2.0, help="Seconds between scans when polling")
+@click.option("--polling", is_flag=True, help="Poll even if watchfiles is installed")
+@click.pass_context
+def watch(ctx, debounce, poll_interval, polling):
+    """Re-summarize the weeks of new or changed logs and activities until interrupted."""
+    from lairn.reporting.watcher import WeekWatcher
+
+    if ctx.obj["dry_run"]:
+        raise click.UsageError("watch runs until interrupted, estimate single weeks with week --dry-run")
+    watcher = WeekWatcher(
+        debounce=debounce, poll_interval=poll_interval, force_polling=polling, model_name=ctx.obj["model"]
+    )
+    try:
+        _run(ctx, watcher.run())
+    except KeyboardInterrupt:
+        from lairn.llm.telemetry import TELEMETRY
+
+        click.echo(TELEMETRY.summary())
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", type=int, default=8080)
+@click.option("--refresh-interval", type=float, default=2.0, help="Minimum seconds between data reloads")
+@click.pass_context
+def serve(ctx, host, port, refresh_interval):
+    """Serve summaries, curricula and activities over HTTP."""
+    from lairn.server import serve
+
+    if ctx.obj["dry_run"]:
+        raise click.UsageError("serve saves summaries, estimate single weeks with week --dry-run")
+    serve(host=host, port=port, refresh_interval=refresh_interval, model_name=ctx.obj["model"])
+
+
+@cli.command()
+@click.argument("query", nargs=-1, required=True)
+@click.option(
+    "--source",
+    "sources",
+    multiple=True,
+    type=click.Choice(["log", "artifact", "sofatutor", "video"]),
+    help="Only search these sources, repeatable",
+)
+@click.option("--start", type=click.DateTime(["%Y-%m-%d"]), default=None, help="Earliest date")
+@click.option("--end", type=click.DateTime(["%Y-%m-%d"]), default=None, help="Latest date")
+@click.option("--limit", type=int, default=20, show_default=True)
+@click.option("--raw", is_flag=True, help="Pass the query to SQLite FTS5 as it is")
+def search(query, sources, start, end, limit, raw):
+    """Full-text search over logs, artifacts, Sofatutor activities and videos."""
+    from lairn.context_mixin import ContextMixinClassLevel2
+
+    import sqlite3
+
+    try:
+        hits = ContextMixinClassLevel2().search(
+            " ".join(query),
+            sources=list(sources),
+            start_date=start and start.date(),
+            end_date=end and end.date(),
+            limit=limit,
+            raw=raw,
+        )
+    except sqlite3.OperationalError as e:
+        raise click.BadParameter(f"Invalid FTS5 query: {e}", param_hint="QUERY")
+    for hit in hits:
+        click.echo(f"{hit.score:6.2f}  {hit.source:<9} {hit.date or '':<10}  {hit.title}")
+        click.echo(f"        {' '.join(hit.snippet.split())}")
+    if not hits:
+        click.echo("No matches")
+
+
+@cli.group()
+def sofatutor():
+    """Sofatutor activities and video catalogue."""
+
+
+@sofatutor.command()
+@click.option("--force", is_flag=True, help="Overwrite existing activities")
+@click.pass_context
+def ingest(ctx, force):
+    """Parse the "Mein Sofa" exports into activities."""
+    from lairn.integrations.sofatutor.ingest import ingest_exports
+
+    if ctx.obj["dry_run"]:
+        raise click.UsageError("ingest does not call the LLM, there is nothing to estimate")
+    written = ingest_exports(skip_existing=not force)
+    click.echo(f"Wrote {written} activities")
+    if written:
+        from lairn.context_mixin import ContextMixinClassLevel2
+
+        ContextMixinClassLevel2().search_index().close()
+
+
+@sofatutor.command()
+@click.option("--extract-only", is_flag=True, help="Only rebuild the video sheet from crawled pages")
+@click.pass_context
+def crawl(ctx, extract_only):
+    """Crawl the Sofatutor video catalogue and rebuild the video sheet."""
+    from lairn.integrations.sofatutor.manual_crawler import crawl_sofatutor, extract_videos
+
+    if ctx.obj["dry_run"]:
+        raise click.UsageError("crawl does not call the LLM, there is nothing to estimate")
+    if not extract_only:
+        crawl_sofatutor()
+    extract_videos()
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,34 +1,52 @@
 from datetime import date
+from functools import cache
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import tiktoken
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_core.documents import Document
+from lairn import config
 
-from lairn.config import LLM, STUDENT_BIRTH_DATE
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
 
 
-def load_pdf_pages(pdf_path: str | Path) -> list[Document]:
+def load_pdf_pages(pdf_path: str | Path) -> list["Document"]:
+    from langchain_community.document_loaders import PyPDFLoader
+
     loader = PyPDFLoader(pdf_path)
     return loader.load_and_split()
 
 
-def count_tokens(text: str, model: str = LLM) -> int:
-    encoding = tiktoken.encoding_for_model(model)
+@cache
+def _encoding(model: str):
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Unknown to tiktoken, e.g. the offline fake model
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    encoding = _encoding(model or config.LLM)
     num_tokens = len(encoding.encode(text))
     return num_tokens
 
 
 def get_student_age_today() -> int:
-    today = date.today()
+    return get_student_age_on(date.today())
+
+
+def get_student_age_on(day: date) -> int:
+    student_birth_date = config.STUDENT_BIRTH_DATE
     return (
-        today.year
-        - STUDENT_BIRTH_DATE.year
+        day.year
+        - student_birth_date.year
         - (
-            (today.month, today.day)
+            (day.month, day.day)
             < (
-                STUDENT_BIRTH_DATE.month,
-                STUDENT_BIRTH_DATE.day,
+                student_birth_date.month,
+                student_birth_date.day,
             )
         )
     )
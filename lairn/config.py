@@ -1,18 +1,80 @@
+"""Configuration from environment variables and the ``.env`` file.
+
+Settings are resolved on first access (PEP 562), so importing a module that only needs ``LLM``
+neither requires ``STUDENT_BIRTH_DATE`` nor pays for parsing it.
+"""
+
 import os
-from datetime import date
-from dateutil import parser
+from functools import cache
 from pathlib import Path
 
-from dotenv import load_dotenv
 
-load_dotenv()
+@cache
+def _load_dotenv():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def _env(name: str, default: str | None = None) -> str | None:
+    _load_dotenv()
+    return os.environ.get(name, default)
+
+
+def _main_dir() -> Path:
+    main_dir = _env("MAIN_DIR")
+    assert main_dir is not None, "Please set MAIN_DIR in .env file."
+    return Path(main_dir)
+
+
+def _student_birth_date():
+    from dateutil import parser
+
+    student_birth_date = _env("STUDENT_BIRTH_DATE")
+    assert student_birth_date is not None, "Please set STUDENT_BIRTH_DATE in .env file."
+    return parser.parse(student_birth_date).date()
+
+
+_SETTINGS = {
+    "OPENAI_API_KEY": lambda: _env("OPENAI_API_KEY"),
+    "LLM": lambda: _env("LLM", "gpt-4o-mini"),
+    "OUTPUT_LANGUAGE": lambda: _env("OUTPUT_LANGUAGE", "de"),
+    "PROMPT_LAYOUT": lambda: _env("PROMPT_LAYOUT", "default"),
+    "NATIVE_STRUCTURED_OUTPUT": lambda: _env("NATIVE_STRUCTURED_OUTPUT", "false").lower() == "true",
+    "LLM_TELEMETRY_DIR": lambda: _env("LLM_TELEMETRY_DIR"),
+    "TRACE_FILE": lambda: _env("LAIRN_TRACE_FILE"),
+    "FAKE_LLM_LATENCY": lambda: float(_env("FAKE_LLM_LATENCY", "0")),
+    "LLM_CONCURRENCY": lambda: int(_env("LLM_CONCURRENCY", "8")),
+    "LLM_RPM": lambda: int(_env("LLM_RPM", "0")),
+    "LLM_CACHE_DIR": lambda: _env("LLM_CACHE_DIR"),
+    "LLM_DRY_RUN": lambda: _env("LLM_DRY_RUN", "false").lower() == "true",
+    "LLM_HEDGE_PERCENTILE": lambda: float(_env("LLM_HEDGE_PERCENTILE", "0")),
+    "LLM_HEDGE_BUDGET": lambda: float(_env("LLM_HEDGE_BUDGET", "0.05")),
+    "LLM_PRIORITY": lambda: _env("LLM_PRIORITY", "normal"),
+    "LLM_ROUTING": lambda: _env("LLM_ROUTING"),
+    "CASSETTE": lambda: _env("LAIRN_CASSETTE"),
+    "CASSETTE_MODE": lambda: _env("LAIRN_CASSETTE_MODE", "replay"),
+    "CASSETTE_LATENCY_SCALE": lambda: float(_env("LAIRN_CASSETTE_LATENCY_SCALE", "1")),
+    "COMPACT_LOGS": lambda: _env("COMPACT_LOGS", "true").lower() == "true",
+    "GLOSSARY_MAX_TOKENS": lambda: int(_env("GLOSSARY_MAX_TOKENS", "0")),
+    "MAIN_DIR": _main_dir,
+    "STUDENT_BIRTH_DATE": _student_birth_date,
+}
+
+
+def __getattr__(name: str):
+    if name not in _SETTINGS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = _SETTINGS[name]()
+    globals()[name] = value
+    return value
+
 
+def refresh():
+    """Forget resolved settings, so that changed environment variables take effect on next access."""
+    for name in _SETTINGS:
+        globals().pop(name, None)
 
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", None)
-LLM = os.environ.get("LLM", "gpt-4o-mini")
-OUTPUT_LANGUAGE = os.environ.get("OUTPUT_LANGUAGE", "de")
-MAIN_DIR = Path(os.environ.get("MAIN_DIR"))
 
-STUDENT_BIRTH_DATE = os.environ.get("STUDENT_BIRTH_DATE", None)
-assert STUDENT_BIRTH_DATE is not None, "Please set STUDENT_BIRTH_DATE in .env file."
-STUDENT_BIRTH_DATE = parser.parse(STUDENT_BIRTH_DATE).date()
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_SETTINGS])
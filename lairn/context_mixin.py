@@ -1,49 +1,137 @@
-from lairn.common import get_student_age_today
-from lairn.config import MAIN_DIR
-from lairn.curriculum.load import load_curricula
-from lairn.curriculum.models import Curriculum
-from lairn.integrations.sofatutor import SOFA_DIR
-from lairn.integrations.sofatutor.activity_list_parser import load_activities, SofatutorLearningActivity
-from lairn.learn_artifact import load_evaluations, LearnLogArtifact, load_artifacts
-from lairn.learn_log import LearnLogMessage, load_logs
+from datetime import date
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from lairn import config
+from lairn.integrations import sofatutor
+
+if TYPE_CHECKING:
+    from lairn.curriculum.models import Curriculum
+    from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity
+    from lairn.learn_artifact import LearnLogArtifact
+    from lairn.learn_log import LearnLogMessage
+    from lairn.reporting.coverage import CoverageMatrix
+    from lairn.search import SearchHit, SearchIndex
 
 
 class ContextMixinClassLevel2:
-    CURRICULA_PATH = MAIN_DIR / "Schullehrplan_Grundschule_Zusammenfassungen" / "Schuljahre 1-2" / "pydantic"
-    ARTIFACTS_PATH = MAIN_DIR / "artifacts"
-    LOGS_PATH = MAIN_DIR / "slack_log_messages"
-    SOFA_PATH = SOFA_DIR / "activities"
-    ADDITIONAL_EXPLANATIONS_PATH = MAIN_DIR / "additional_explanations.md"
+    # Paths and loaders are resolved on use, so that subclasses can be imported without MAIN_DIR
+    # and without importing the parsers of every data source.
+
+    @property
+    def CURRICULA_PATH(self) -> Path:
+        return config.MAIN_DIR / "Schullehrplan_Grundschule_Zusammenfassungen" / "Schuljahre 1-2" / "pydantic"
+
+    @property
+    def ARTIFACTS_PATH(self) -> Path:
+        return config.MAIN_DIR / "artifacts"
+
+    @property
+    def LOGS_PATH(self) -> Path:
+        return config.MAIN_DIR / "slack_log_messages"
+
+    @property
+    def SOFA_PATH(self) -> Path:
+        return sofatutor.SOFA_DIR / "activities"
+
+    @property
+    def ADDITIONAL_EXPLANATIONS_PATH(self) -> Path:
+        return config.MAIN_DIR / "additional_explanations.md"
+
+    @property
+    def COVERAGE_PATH(self) -> Path:
+        return config.MAIN_DIR / "coverage"
+
+    @property
+    def WEEKLY_SUMMARIES_PATH(self) -> Path:
+        return config.MAIN_DIR / "weekly_summaries"
+
+    @property
+    def PERIOD_REPORTS_PATH(self) -> Path:
+        return config.MAIN_DIR / "period_reports"
+
+    @property
+    def SEARCH_INDEX_PATH(self) -> Path:
+        return config.MAIN_DIR / "search_index.sqlite"
 
     @property
     def student_age(self) -> int:
+        from lairn.common import get_student_age_today
+
         return get_student_age_today()
 
-    def load_curricula(self) -> dict[str, Curriculum]:
+    def student_age_on(self, day: date) -> int:
+        from lairn.common import get_student_age_on
+
+        return get_student_age_on(day)
+
+    def load_curricula(self) -> dict[str, "Curriculum"]:
+        from lairn.curriculum.load import load_curricula
+
         return load_curricula(self.CURRICULA_PATH)
 
-    def load_evaluations(self) -> dict[str, LearnLogArtifact]:
+    def load_evaluations(self) -> dict[str, "LearnLogArtifact"]:
+        from lairn.learn_artifact import load_evaluations
+
         return load_evaluations(self.ARTIFACTS_PATH)
 
-    def load_artifacts(self, must_include_tags: list[str] | None = None) -> list[LearnLogArtifact]:
+    def load_artifacts(self, must_include_tags: list[str] | None = None) -> list["LearnLogArtifact"]:
+        from lairn.learn_artifact import load_artifacts
+
         return load_artifacts(self.ARTIFACTS_PATH, must_include_tags)
 
-    def load_logs(self) -> list[LearnLogMessage]:
+    def load_logs(self) -> list["LearnLogMessage"]:
+        from lairn.learn_log import load_logs
+
         return load_logs(self.LOGS_PATH)
 
-    def load_sofa_activities(self) -> list[SofatutorLearningActivity]:
+    def load_sofa_activities(self) -> list["SofatutorLearningActivity"]:
+        from lairn.integrations.sofatutor.activity_list_parser import load_activities
+
         return load_activities(self.SOFA_PATH)
 
     def load_additional_explanations(self) -> str:
         with open(self.ADDITIONAL_EXPLANATIONS_PATH, "r") as f:
             return f.read()
 
+    def load_coverage(self) -> "CoverageMatrix | None":
+        from lairn.reporting.coverage import CoverageMatrix
+
+        if not (self.COVERAGE_PATH / "coverage.json").exists():
+            return None
+        return CoverageMatrix.load(self.COVERAGE_PATH)
+
+    def update_coverage(self) -> "CoverageMatrix":
+        """Update the persisted coverage matrix to the current logs and activities and save it."""
+        from lairn.reporting.coverage import CoverageEngine
+
+        engine = CoverageEngine(self.load_curricula())
+        matrix = engine.update(self.load_coverage(), self.load_logs(), self.load_sofa_activities())
+        matrix.save(self.COVERAGE_PATH)
+        return matrix
+
+    def search_index(self) -> "SearchIndex":
+        """The full-text search index, updated with the files changed since its last update."""
+        from lairn.search import SearchIndex, default_sources
+
+        index = SearchIndex(self.SEARCH_INDEX_PATH, default_sources(self))
+        index.update()
+        return index
+
+    def search(self, query: str, **kwargs) -> list["SearchHit"]:
+        """Ranked logs, artifacts, activities and videos matching ``query``, see ``SearchIndex.search``."""
+        index = self.search_index()
+        try:
+            return index.search(query, **kwargs)
+        finally:
+            index.close()
+
     def load_defaults(
         self,
     ) -> tuple[
-        dict[str, Curriculum],
-        dict[str, LearnLogArtifact],
-        list[LearnLogMessage],
-        list[SofatutorLearningActivity],
+        dict[str, "Curriculum"],
+        dict[str, "LearnLogArtifact"],
+        list["LearnLogMessage"],
+        list["SofatutorLearningActivity"],
     ]:
         return self.load_curricula(), self.load_evaluations(), self.load_logs(), self.load_sofa_activities()
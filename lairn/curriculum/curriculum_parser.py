@@ -1,33 +1,44 @@
 import asyncio
 from pathlib import Path
 
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
-
 from lairn.config import LLM, OUTPUT_LANGUAGE
 from lairn.curriculum.models import Curriculum
-from lairn.curriculum.prompts import PT_CURRICULUM_PARSER
+from lairn.curriculum.prompts import PT_CURRICULUM_PARSER, PT_CURRICULUM_PARSER_PREFIX_STABLE
+from lairn.llm.chat import create_chat_model
+from lairn.llm.prompt_layout import select_prompt
+from lairn.llm.structured import structured_chain
+from lairn.llm.telemetry import stage_config
+from lairn.tracing import traced
 
 from loguru import logger
 
 
 class CurriculumParser:
-    def __init__(self, model_name: str | None = None):
+    def __init__(
+        self,
+        model_name: str | None = None,
+        prompt_layout: str | None = None,
+        native_structured_output: bool | None = None,
+    ):
         self.model_name = model_name or LLM
+        self.prompt_layout = prompt_layout
+        self.native_structured_output = native_structured_output
 
-        self.model = ChatOpenAI(model_name=self.model_name, temperature=0.0)
+        self.model = create_chat_model(self.model_name)
 
+    @traced()
     async def parse_curriculum(self, curriculum_summary: str) -> Curriculum:
         logger.info(f"Parsing curriculum {curriculum_summary.splitlines()[0]}")
-        # Set up a parser + inject instructions into the prompt template.
-        parser = PydanticOutputParser(pydantic_object=Curriculum)
-
-        chain = PT_CURRICULUM_PARSER | self.model | parser
+        prompt = select_prompt(PT_CURRICULUM_PARSER, PT_CURRICULUM_PARSER_PREFIX_STABLE, self.prompt_layout)
+        chain, response_format = structured_chain(
+            prompt, self.model, Curriculum, self.native_structured_output
+        )
 
         return await chain.ainvoke(
             {
                 "summary": curriculum_summary,
-                "response_format": parser.get_format_instructions(),
+                "response_format": response_format,
                 "response_language": OUTPUT_LANGUAGE,
-            }
+            },
+            config=stage_config("parse"),
         )
@@ -1,29 +1,52 @@
 import asyncio
 
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
-
+from lairn.common import count_tokens
 from lairn.config import LLM, OUTPUT_LANGUAGE
-from lairn.curriculum.models import LearningTargetExamples, Curriculum
-from lairn.curriculum.prompts import PT_GENERATE_LEARNING_EXAMPLES
+from lairn.curriculum.models import LearningTargetExamples, Curriculum, LearningTargetExamplesBatch
+from lairn.curriculum.prompts import (
+    PT_GENERATE_LEARNING_EXAMPLES,
+    PT_GENERATE_LEARNING_EXAMPLES_PREFIX_STABLE,
+    PT_GENERATE_LEARNING_EXAMPLES_BATCH,
+    PT_GENERATE_LEARNING_EXAMPLES_BATCH_PREFIX_STABLE,
+)
+from lairn.fanout import Checkpoint, fan_out
+from lairn.llm.chat import create_chat_model
+from lairn.llm.prompt_layout import select_prompt
+from lairn.llm.structured import structured_chain
+from lairn.llm.telemetry import stage_config
+from lairn.tracing import traced
 
 from loguru import logger
 
+# Rough output size estimates used to split batches before the output token budget is exceeded
+TOKENS_PER_EXAMPLE = 60
+TOKENS_PER_TARGET_OVERHEAD = 30
+
 
 class LearningExampleGenerator:
-    def __init__(self, model_name: str | None = None):
+    def __init__(
+        self,
+        model_name: str | None = None,
+        prompt_layout: str | None = None,
+        native_structured_output: bool | None = None,
+    ):
         self.model_name = model_name or LLM
+        self.prompt_layout = prompt_layout
+        self.native_structured_output = native_structured_output
 
-        self.model = ChatOpenAI(model_name=self.model_name, temperature=0.0)
+        self.model = create_chat_model(self.model_name)
 
+    @traced()
     async def _generate_examples_for_single_target(
         self, curriculum: Curriculum, section: str, learning_target: str, num_examples: int
     ) -> LearningTargetExamples:
         logger.info(f"Handling learning target: {learning_target} of section: {section}")
-        # Set up a parser + inject instructions into the prompt template.
-        parser = PydanticOutputParser(pydantic_object=LearningTargetExamples)
-
-        chain = PT_GENERATE_LEARNING_EXAMPLES | self.model | parser
+        prompt = select_prompt(
+            PT_GENERATE_LEARNING_EXAMPLES, PT_GENERATE_LEARNING_EXAMPLES_PREFIX_STABLE, self.prompt_layout
+        )
+        chain, response_format = structured_chain(
+            prompt, self.model, LearningTargetExamples, self.native_structured_output
+        )
 
         examples = await chain.ainvoke(
             {
@@ -33,24 +56,173 @@ class LearningExampleGenerator:
                 "curriculum": curriculum.str_format(section_subset=section),
                 "section": section,
                 "learning_target": learning_target,
-                "response_format": parser.get_format_instructions(),
+                "response_format": response_format,
                 "response_language": OUTPUT_LANGUAGE,
-            }
+            },
+            config=stage_config("examples"),
         )
         return examples
 
+    def _split_targets(
+        self, learning_targets: list[str], num_examples: int, max_output_tokens: int
+    ) -> list[list[str]]:
+        """Split learning targets into batches whose estimated output fits ``max_output_tokens``."""
+        if not learning_targets:
+            return []
+
+        batches = [[]]
+        batch_tokens = 0
+        for learning_target in learning_targets:
+            target_tokens = (
+                num_examples * TOKENS_PER_EXAMPLE
+                + TOKENS_PER_TARGET_OVERHEAD
+                + count_tokens(learning_target, self.model_name)
+            )
+            if batches[-1] and batch_tokens + target_tokens > max_output_tokens:
+                batches.append([])
+                batch_tokens = 0
+            batches[-1].append(learning_target)
+            batch_tokens += target_tokens
+        return batches
+
+    @traced()
+    async def _generate_examples_for_target_batch(
+        self, curriculum: Curriculum, section: str, learning_targets: list[str], num_examples: int
+    ) -> list[LearningTargetExamples]:
+        logger.info(f"Handling {len(learning_targets)} learning targets of section: {section}")
+        prompt = select_prompt(
+            PT_GENERATE_LEARNING_EXAMPLES_BATCH,
+            PT_GENERATE_LEARNING_EXAMPLES_BATCH_PREFIX_STABLE,
+            self.prompt_layout,
+        )
+        chain, response_format = structured_chain(
+            prompt, self.model, LearningTargetExamplesBatch, self.native_structured_output
+        )
+
+        batch = await chain.ainvoke(
+            {
+                "grades": curriculum.grades_formatted,
+                "subject": curriculum.subject,
+                "num_examples": num_examples,
+                "curriculum": curriculum.str_format(section_subset=section),
+                "section": section,
+                "learning_targets": "\n".join(f"  {i}. {lt}" for i, lt in enumerate(learning_targets, 1)),
+                "response_format": response_format,
+                "response_language": OUTPUT_LANGUAGE,
+            },
+            config=stage_config("examples"),
+        )
+
+        # Map results back to the requested targets by their number, the model may not copy the texts
+        # verbatim. Targets the model skipped are requested singly.
+        returned = {}
+        for examples in batch.learning_targets:
+            if 1 <= examples.number <= len(learning_targets):
+                returned.setdefault(
+                    examples.number - 1,
+                    LearningTargetExamples(
+                        section=section,
+                        learning_target=learning_targets[examples.number - 1],
+                        examples=examples.examples,
+                    ),
+                )
+        missing = [i for i in range(len(learning_targets)) if i not in returned]
+        if missing:
+            logger.warning(
+                f"Learning targets missing in batch response, requesting singly: "
+                f"{[learning_targets[i] for i in missing]}"
+            )
+            singles = await asyncio.gather(
+                *[
+                    self._generate_examples_for_single_target(
+                        curriculum, section, learning_targets[i], num_examples
+                    )
+                    for i in missing
+                ]
+            )
+            returned.update(zip(missing, singles))
+        return [returned[i] for i in range(len(learning_targets))]
+
+    @traced()
     async def create_examples(
-        self, curriculum: Curriculum, num_examples: int = 5
+        self,
+        curriculum: Curriculum,
+        num_examples: int = 5,
+        batched: bool = False,
+        max_output_tokens: int = 4096,
+        checkpoint: Checkpoint[LearningTargetExamples] | None = None,
     ) -> list[LearningTargetExamples]:
+        """Generate examples for every learning target of the curriculum.
+
+        With ``batched=True``, all learning targets of a section are requested in one call, so the
+        section curriculum is sent once per section instead of once per target. Sections whose
+        estimated output exceeds ``max_output_tokens`` are split into several calls.
+
+        Failed calls are retried once and raise a ``FanOutError`` if they fail again. With a
+        ``checkpoint``, the examples of every finished call are saved to it, and learning targets
+        already in it are not requested again.
+        """
         logger.info(f"Generating learning examples for curriculum with subject {curriculum.subject}")
 
-        tasks = []
+        done = checkpoint.load() if checkpoint is not None else {}
+        jobs = []
         for section in curriculum.sections:
-            logger.info(f"Handling section: {section.title}")
-            for learning_target in section.learning_targets:
-                task = self._generate_examples_for_single_target(
-                    curriculum, section.title, learning_target, num_examples
+            learning_targets = [
+                learning_target
+                for learning_target in section.learning_targets
+                if _target_key(section.title, learning_target) not in done
+            ]
+            logger.info(
+                f"Handling section: {section.title}, {len(learning_targets)} targets without examples"
+            )
+            if batched:
+                for batch in self._split_targets(learning_targets, num_examples, max_output_tokens):
+                    jobs.append((section.title, tuple(batch)))
+            else:
+                jobs.extend((section.title, (learning_target,)) for learning_target in learning_targets)
+
+        async def run(job: tuple[str, tuple[str, ...]]) -> list[LearningTargetExamples]:
+            section, learning_targets = job
+            if batched:
+                return await self._generate_examples_for_target_batch(
+                    curriculum, section, list(learning_targets), num_examples
+                )
+            return [
+                await self._generate_examples_for_single_target(
+                    curriculum, section, learning_targets[0], num_examples
                 )
-                tasks.append(task)
+            ]
+
+        def save(job: tuple[str, tuple[str, ...]], results: list[LearningTargetExamples]):
+            section, learning_targets = job
+            for learning_target, examples in zip(learning_targets, results):
+                key = _target_key(section, learning_target)
+                done[key] = examples
+                if checkpoint is not None:
+                    checkpoint.save(key, examples)
+
+        outcome = await fan_out(jobs, run, on_result=save)
+        outcome.raise_for_failures(f"example requests for {curriculum.subject}")
+        return [
+            done[_target_key(section.title, learning_target)]
+            for section in curriculum.sections
+            for learning_target in section.learning_targets
+        ]
+
+
+def _target_key(section: str, learning_target: str) -> str:
+    return f"{section}\n{learning_target}"
+
+
+def results_to_markdown_string(subject: str, results: list[LearningTargetExamples]) -> str:
+    md_str = f"# {subject}\n\n"
+    section = ""
+    for res in results:
+        if res.section != section:
+            md_str += f"\n## {res.section}\n\n"
+            section = res.section
 
-        return await asyncio.gather(*tasks)
+        md_str += f"\n### {res.learning_target}\n\n"
+        for example in res.examples:
+            md_str += f"  - {example}\n"
+    return md_str
@@ -1,8 +1,10 @@
 from pathlib import Path
 
 from lairn.curriculum.models import Curriculum
+from lairn.tracing import traced
 
 
+@traced()
 def load_curricula(path: Path) -> dict[str, Curriculum]:
     if not isinstance(path, Path):
         path = Path(path)
@@ -82,3 +82,13 @@ class LearningTargetExamples(BaseModel):
         description="Examples for learning and exercising activities that can be "
         "done in the home schooling context to achieve the learning target"
     )
+
+
+class NumberedLearningTargetExamples(LearningTargetExamples):
+    number: int = Field(description="The number of the learning target in the list of requested targets")
+
+
+class LearningTargetExamplesBatch(BaseModel):
+    learning_targets: list[NumberedLearningTargetExamples] = Field(
+        description="The examples for each of the requested learning targets"
+    )
@@ -184,3 +184,316 @@ PT_GENERATE_LEARNING_EXAMPLES = PromptTemplate(
         "response_language",
     ],
 )
+
+
+PT_GENERATE_LEARNING_EXAMPLES_BATCH = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Expert home schooling learning assistant
+
+    You receive a curriculum summary for grades {grades} for the subject {subject} which includes a number
+    of learning targets. For each of the learning targets listed separately, provide {num_examples} examples
+    for learning and exercising activities that can be done in the home schooling context. Make sure the
+    examples have a balance between screen and off-screen activities, if possible. Return exactly one entry
+    per listed learning target with the number of the learning target in the list.
+
+    |USER|
+
+    ## Full school subject curriculum
+
+    {curriculum}
+    
+    # Section
+    
+    {section}
+    
+    ## Learning targets: provide examples for each of these targets!
+    
+    {learning_targets}
+
+    ## Response format
+
+    {response_format}
+
+    ## Response language
+
+    {response_language}
+
+""",
+    input_variables=[
+        "grades",
+        "subject",
+        "num_examples",
+        "curriculum",
+        "section",
+        "learning_targets",
+        "response_format",
+        "response_language",
+    ],
+)
+
+
+# Prefix-stable layouts: static instructions, response format and large shared context come
+# first, the variables that change from call to call come last.
+
+PT_PARSE_CURRICULUM_STRUCTURE_PREFIX_STABLE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Expert school curriculum interpreter
+
+    You are an expert school curriculum interpreter. Your task is to define what
+    subject a given school curriculum document is about and what the overall
+    structure of the document is given the preface content of a PDF.
+    
+    You determine:
+      - The school subject the document is about
+      - The structure of the document as defined by the table of contents
+
+    ## Response format
+
+    {response_format}
+    
+    ## Response language
+    
+    {response_language}
+
+    |USER|
+
+    ## Preface content of the document
+
+    {preface_content}
+
+""",
+    input_variables=["preface_content", "response_format", "response_language"],
+)
+
+
+PT_SUMMARIZE_CURRICULUM_PAGE_PREFIX_STABLE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Expert school curriculum summarizer
+
+    You are an expert school curriculum summarizer. Your task is to extract the
+    most important information from a text section of a detailed school
+    curriculum and summarize it in a way that is easy to understand. You should
+    determine what skills a student is supposed to have established at what
+    point in time. What are the learning objectives and what are the key
+    milestones?
+
+    ## Response format
+
+      - Respond as a normal string
+      - Be concise and structured
+      
+    ## Response language
+    
+    {response_language}
+
+    |USER|
+    
+    ## Overall school subject and structure of the document
+    
+    {doc_structure}
+    
+    ## Page number
+    
+    {page_number}
+    
+    ## Content of the current page
+
+    {page_content}
+
+""",
+    input_variables=[
+        "doc_structure",
+        "page_number",
+        "page_content",
+        "response_language",
+    ],
+)
+
+PT_WRITE_SUBJECT_OVERVIEW_PREFIX_STABLE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Expert school curriculum summarizer
+
+    You receive an automatically generated summary of the state curriculum for a school subject, which 
+    is very detailed. Write a shortened list of learning objectives, separated for grades 1 to 2, and grades 
+    3 to 4. Your overview should allow parents who are homeschooling to compare their child's learning 
+    progress with the curriculum and derive what should be learned in the coming weeks.
+
+    ## Response language
+
+    {response_language}
+
+    |USER|
+
+    ## School subject
+
+    {subject}
+
+    ## Summary of school subject curriculum
+    
+    {summary}
+
+""",
+    input_variables=[
+        "subject",
+        "summary",
+        "response_language",
+    ],
+)
+
+
+PT_CURRICULUM_PARSER_PREFIX_STABLE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Curriculum parser
+
+    Convert the given curriculum summary into the output format.
+    
+    ## Response format
+
+    {response_format}
+
+    ## Response language
+
+    {response_language}
+
+    |USER|
+
+    ## Summary of school subject curriculum
+
+    {summary}
+
+""",
+    input_variables=[
+        "summary",
+        "response_format",
+        "response_language",
+    ],
+)
+
+
+PT_GENERATE_LEARNING_EXAMPLES_PREFIX_STABLE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Expert home schooling learning assistant
+
+    You receive a curriculum summary for a school subject which includes a number of learning targets.
+    Provide the requested number of examples for learning and exercising activities that can be done in
+    the home schooling context for exactly one of these targets provided to you separately. Make sure
+    the examples have a balance between screen and off-screen activities, if possible.
+
+    ## Response format
+
+    {response_format}
+
+    ## Response language
+
+    {response_language}
+
+    |USER|
+
+    ## Subject
+
+    {subject}
+
+    ## Grades
+
+    {grades}
+
+    ## Number of examples to provide
+
+    {num_examples}
+
+    ## Full school subject curriculum
+
+    {curriculum}
+    
+    # Section
+    
+    {section}
+    
+    ## Learning target: provide examples for this target!
+    
+    {learning_target}
+
+""",
+    input_variables=[
+        "grades",
+        "subject",
+        "num_examples",
+        "curriculum",
+        "section",
+        "learning_target",
+        "response_format",
+        "response_language",
+    ],
+)
+
+
+PT_GENERATE_LEARNING_EXAMPLES_BATCH_PREFIX_STABLE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Expert home schooling learning assistant
+
+    You receive a curriculum summary for a school subject which includes a number of learning targets.
+    For each of the learning targets listed separately, provide the requested number of examples for
+    learning and exercising activities that can be done in the home schooling context. Make sure the
+    examples have a balance between screen and off-screen activities, if possible. Return exactly one
+    entry per listed learning target with the number of the learning target in the list.
+
+    ## Response format
+
+    {response_format}
+
+    ## Response language
+
+    {response_language}
+
+    |USER|
+
+    ## Subject
+
+    {subject}
+
+    ## Grades
+
+    {grades}
+
+    ## Number of examples to provide per learning target
+
+    {num_examples}
+
+    ## Full school subject curriculum
+
+    {curriculum}
+    
+    # Section
+    
+    {section}
+    
+    ## Learning targets: provide examples for each of these targets!
+    
+    {learning_targets}
+
+""",
+    input_variables=[
+        "grades",
+        "subject",
+        "num_examples",
+        "curriculum",
+        "section",
+        "learning_targets",
+        "response_format",
+        "response_language",
+    ],
+)
@@ -0,0 +1,256 @@
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import PromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field, ValidationError, root_validator, validator
+from loguru import logger
+
+from lairn.llm.prompt_layout import select_prompt
+from lairn.llm.structured import structured_chain
+from lairn.llm.telemetry import stage_config
+from lairn.tracing import traced
+
+PT_GENERATE_MULTIPLE_CHOICE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Experte für spannende, anregende Prüfungsaufgaben für die Grundschule
+
+    Mein Sohn ist 7 und würde nun in die zweite Klasse der Grundschule in 
+    Deutschland kommen. Er wird zu Hause unterrichtet. Du erhältst eine 
+    Auflistung der Lernziele des Lehrplans für {subject}, sowie die Beurteilung
+    seiner Klassenlehrerin für dieses Fach vom Ende der ersten Klasse.
+    
+    Generiere {num_questions} Multiple-Choice-Fragen, die auf dem Lehrplan
+    basieren und die Lernziele des Lehrplans abdecken. Sei kreativ und verwende
+    zum Beispiel Bilder aus der Welt von Super Mario. Beziehe die Beurteilung
+    seiner Lehrerin mit ein, um seine eventuellen Stärken und Schwächen zu 
+    berücksichtigen. 
+    
+    |USER|
+    
+    ## Lernziele des Lehrplans für {subject}
+    
+    {curriculum}
+    
+    ## Beurteilung der Lehrerin aus dem Abschlusszeugnis der ersten Klasse
+    
+    {evaluation}
+
+    ## Response format
+    
+      - Genau 4 Antwortmöglichkeiten pro Frage
+      - Genau eine Antwortmöglichkeit ist korrekt
+
+    {response_format}
+
+    ## Antwort Sprache
+
+    Deutsch
+
+""",
+    input_variables=[
+        "subject",
+        "num_questions",
+        "curriculum",
+        "evaluation",
+        "response_format",
+        "response_language",
+    ],
+)
+
+
+PT_GENERATE_MULTIPLE_CHOICE_PREFIX_STABLE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Experte für spannende, anregende Prüfungsaufgaben für die Grundschule
+
+    Mein Sohn ist 7 und würde nun in die zweite Klasse der Grundschule in 
+    Deutschland kommen. Er wird zu Hause unterrichtet. Du erhältst eine 
+    Auflistung der Lernziele des Lehrplans für ein Schulfach, sowie die Beurteilung
+    seiner Klassenlehrerin für dieses Fach vom Ende der ersten Klasse.
+    
+    Generiere die angegebene Anzahl an Multiple-Choice-Fragen, die auf dem Lehrplan
+    basieren und die Lernziele des Lehrplans abdecken. Sei kreativ und verwende
+    zum Beispiel Bilder aus der Welt von Super Mario. Beziehe die Beurteilung
+    seiner Lehrerin mit ein, um seine eventuellen Stärken und Schwächen zu 
+    berücksichtigen. 
+
+    ## Response format
+    
+      - Genau 4 Antwortmöglichkeiten pro Frage
+      - Genau eine Antwortmöglichkeit ist korrekt
+
+    {response_format}
+
+    ## Antwort Sprache
+
+    Deutsch
+    
+    |USER|
+
+    ## Anzahl der Fragen
+
+    {num_questions}
+    
+    ## Lernziele des Lehrplans für {subject}
+    
+    {curriculum}
+    
+    ## Beurteilung der Lehrerin aus dem Abschlusszeugnis der ersten Klasse
+    
+    {evaluation}
+
+""",
+    input_variables=[
+        "subject",
+        "num_questions",
+        "curriculum",
+        "evaluation",
+        "response_format",
+        "response_language",
+    ],
+)
+
+
+# Appended to the user part of the quiz prompt when only the missing questions of a quiz are generated
+PT_EXISTING_QUESTIONS = """
+    ## Bereits vorhandene Fragen
+
+    Diese Fragen sind schon im Quiz. Wiederhole keine von ihnen, auch nicht mit anderen Worten.
+
+    {existing_questions}
+
+"""
+
+
+class MultipleChoiceQuizQuestion(BaseModel):
+    question: str
+    answers: list[str] = Field(description="The possible answers to the question")
+    answer_key: int = Field(description="The index of the correct answer in the answers list")
+
+    @validator("answers")
+    def check_answers_length(cls, v):
+        if len(v) != 4:
+            raise ValueError("There must be exactly 4 answers")
+        return v
+
+    @validator("answer_key")
+    def check_answer_key(cls, v, values):
+        if "answers" in values and (v < 0 or v >= len(values["answers"])):
+            raise ValueError("answer_key must be a valid index in answers")
+        return v
+
+    def str_fmt(self) -> str:
+        formatted_answers = []
+        for i, answer in enumerate(self.answers):
+            if i == self.answer_key:
+                formatted_answers.append(f"*{answer}*")
+            else:
+                formatted_answers.append(answer)
+
+        formatted_answers_str = "\n  - ".join(formatted_answers)
+        return f"## {self.question}\n  - {formatted_answers_str}"
+
+
+class MultipleChoiceQuiz(BaseModel):
+    subject: str = Field(description="The school subject the quiz is for")
+    questions: list[MultipleChoiceQuizQuestion] = Field(description="The multiple choice quiz questions")
+    num_questions: int = Field(description="The number of questions in the quiz")
+
+    @root_validator(skip_on_failure=True)
+    def check_num_questions(cls, values):
+        # A field validator on "questions" never sees num_questions, which is declared after it.
+        if len(values["questions"]) != values["num_questions"]:
+            raise ValueError("The number of questions must match num_questions")
+        return values
+
+    def str_fmt(self) -> str:
+        formatted_questions = [question.str_fmt() for question in self.questions]
+        return f"# {self.subject}\n\n" + "\n\n".join(formatted_questions)
+
+
+def _valid_questions(questions: list) -> list[MultipleChoiceQuizQuestion]:
+    valid = []
+    for question in questions:
+        try:
+            valid.append(MultipleChoiceQuizQuestion.parse_obj(question))
+        except ValidationError:
+            continue
+    return valid
+
+
+def _question_key(question: MultipleChoiceQuizQuestion) -> str:
+    return " ".join(question.question.casefold().split())
+
+
+def _unique_questions(questions: list[MultipleChoiceQuizQuestion]) -> list[MultipleChoiceQuizQuestion]:
+    """Questions without repetitions of an earlier question text, ignoring case and whitespace."""
+    unique = {}
+    for question in questions:
+        unique.setdefault(_question_key(question), question)
+    return list(unique.values())
+
+
+@traced()
+async def generate_multiple_choice_question(
+    model: BaseChatModel,
+    subject: str,
+    curriculum: str,
+    evaluation: str,
+    num_questions: int,
+    native_structured_output: bool | None = None,
+) -> MultipleChoiceQuiz:
+    prompt = select_prompt(PT_GENERATE_MULTIPLE_CHOICE, PT_GENERATE_MULTIPLE_CHOICE_PREFIX_STABLE)
+    inputs = {
+        "subject": subject,
+        "num_questions": num_questions,
+        "curriculum": curriculum,
+        "evaluation": evaluation,
+        "response_language": "Deutsch",
+    }
+
+    async def regenerate_missing_questions(data: dict, error: Exception) -> MultipleChoiceQuiz | None:
+        """Keep the valid questions of an invalid quiz and only generate the missing ones."""
+        if not isinstance(data, dict):
+            return None
+        questions = _unique_questions(_valid_questions(data.get("questions") or []))[:num_questions]
+
+        num_missing = num_questions - len(questions)
+        if num_missing > 0:
+            logger.info(f"Generating {num_missing} missing of {num_questions} questions for {subject}")
+            missing_prompt = PromptTemplate(
+                template=prompt.template + PT_EXISTING_QUESTIONS,
+                input_variables=[*prompt.input_variables, "existing_questions"],
+            )
+            chain, response_format = structured_chain(
+                missing_prompt, model, MultipleChoiceQuiz, native_structured_output
+            )
+            missing = await chain.ainvoke(
+                {
+                    **inputs,
+                    "num_questions": num_missing,
+                    "existing_questions": "\n".join(f"  - {question.question}" for question in questions),
+                    "response_format": response_format,
+                },
+                config=stage_config("quiz", repair=True),
+            )
+            # Questions the model repeated anyway do not count
+            questions = _unique_questions(questions + missing.questions)[:num_questions]
+
+        if len(questions) != num_questions:
+            return None
+        return MultipleChoiceQuiz(subject=subject, questions=questions, num_questions=num_questions)
+
+    chain, response_format = structured_chain(
+        prompt,
+        model,
+        MultipleChoiceQuiz,
+        native_structured_output,
+        regenerate_items=regenerate_missing_questions,
+    )
+
+    questions = await chain.ainvoke(
+        {**inputs, "response_format": response_format}, config=stage_config("quiz")
+    )
+
+    return questions
@@ -1,67 +1,90 @@
-import asyncio
 from pathlib import Path
 
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
-
 from lairn.common import load_pdf_pages
 from lairn.config import LLM, OUTPUT_LANGUAGE
 from lairn.curriculum.models import SchoolCurriculumDocumentCharacteristics, CurriculumSummary
 from lairn.curriculum.prompts import (
     PT_SUMMARIZE_CURRICULUM_PAGE,
+    PT_SUMMARIZE_CURRICULUM_PAGE_PREFIX_STABLE,
     PT_PARSE_CURRICULUM_STRUCTURE,
+    PT_PARSE_CURRICULUM_STRUCTURE_PREFIX_STABLE,
     PT_WRITE_SUBJECT_OVERVIEW,
+    PT_WRITE_SUBJECT_OVERVIEW_PREFIX_STABLE,
 )
+from lairn.fanout import fan_out
+from lairn.llm.chat import create_chat_model
+from lairn.llm.prompt_layout import select_prompt
+from lairn.llm.structured import structured_chain
+from lairn.llm.telemetry import stage_config
+from lairn.tracing import span, traced
 
 from loguru import logger
 
 
 class CurriculumSummarizer:
-    def __init__(self, model_name: str | None = None):
+    def __init__(
+        self,
+        model_name: str | None = None,
+        prompt_layout: str | None = None,
+        native_structured_output: bool | None = None,
+    ):
         self.model_name = model_name or LLM
+        self.prompt_layout = prompt_layout
+        self.native_structured_output = native_structured_output
 
-        self.model = ChatOpenAI(model_name=self.model_name, temperature=0.0)
+        self.model = create_chat_model(self.model_name)
 
+    @traced()
     async def _analyze_document_structure(
         self, preface_content: str
     ) -> SchoolCurriculumDocumentCharacteristics:
         logger.info("Analyzing document structure")
-        # Set up a parser + inject instructions into the prompt template.
-        parser = PydanticOutputParser(pydantic_object=SchoolCurriculumDocumentCharacteristics)
-
-        chain = PT_PARSE_CURRICULUM_STRUCTURE | self.model | parser
+        prompt = select_prompt(
+            PT_PARSE_CURRICULUM_STRUCTURE, PT_PARSE_CURRICULUM_STRUCTURE_PREFIX_STABLE, self.prompt_layout
+        )
+        chain, response_format = structured_chain(
+            prompt, self.model, SchoolCurriculumDocumentCharacteristics, self.native_structured_output
+        )
 
         return await chain.ainvoke(
             {
                 "preface_content": preface_content,
-                "response_format": parser.get_format_instructions(),
+                "response_format": response_format,
                 "response_language": OUTPUT_LANGUAGE,
-            }
+            },
+            config=stage_config("structure_analysis"),
         )
 
+    @traced()
     async def _summarize_curriculum_page(
         self, page_number: int, page_content: str, doc_structure: str
     ) -> str:
-        prompt = PT_SUMMARIZE_CURRICULUM_PAGE.format(
+        prompt = select_prompt(
+            PT_SUMMARIZE_CURRICULUM_PAGE, PT_SUMMARIZE_CURRICULUM_PAGE_PREFIX_STABLE, self.prompt_layout
+        ).format(
             doc_structure=doc_structure,
             page_number=page_number,
             page_content=page_content,
             response_language=OUTPUT_LANGUAGE,
         )
 
-        response = await self.model.ainvoke(prompt)
+        response = await self.model.ainvoke(prompt, config=stage_config("page_summary"))
         return response.content
 
+    @traced()
     async def _write_final_overview(self, summary: CurriculumSummary) -> str:
-        prompt = PT_WRITE_SUBJECT_OVERVIEW.format(
+        prompt = select_prompt(
+            PT_WRITE_SUBJECT_OVERVIEW, PT_WRITE_SUBJECT_OVERVIEW_PREFIX_STABLE, self.prompt_layout
+        ).format(
             subject=summary.subject,
             summary=summary,
             response_language=OUTPUT_LANGUAGE,
         )
 
-        response = await self.model.ainvoke(prompt)
+        response = await self.model.ainvoke(prompt, config=stage_config("overview"))
         return response.content
 
+    @traced()
     async def summarize_curriculum_pdf(
         self,
         pdf_path: str | Path,
@@ -70,7 +93,8 @@ class CurriculumSummarizer:
         page_separator: str = "\n\n",
     ) -> str:
         logger.info(f"Summarizing curriculum PDF: {pdf_path}")
-        pages = load_pdf_pages(pdf_path)
+        with span("load_pdf_pages", path=pdf_path):
+            pages = load_pdf_pages(pdf_path)
 
         preface_content = page_separator.join([page.page_content for page in pages[:n_preface_pages]])
         doc_structure = await self._analyze_document_structure(preface_content)
@@ -81,11 +105,16 @@ class CurriculumSummarizer:
         async def summarize_page(page):
             page_num = page.metadata["page"] + 1 - page_number_offset
             logger.info(f"Treating page {page_num}")
-            summary = await self._summarize_curriculum_page(page_num, page.page_content, doc_structure_fmt)
+            with span("summarize_page", page=page_num):
+                summary = await self._summarize_curriculum_page(
+                    page_num, page.page_content, doc_structure_fmt
+                )
             return dict(page_number=page_num, summary=summary)
 
-        tasks = [summarize_page(page) for page in pages[n_preface_pages:]]
-        summaries = await asyncio.gather(*tasks)
+        # Pages are retried on their own, so one failing page does not request all others again
+        outcome = await fan_out(range(n_preface_pages, len(pages)), lambda i: summarize_page(pages[i]))
+        outcome.raise_for_failures(f"pages of {Path(pdf_path).name}")
+        summaries = list(outcome.results.values())
 
         summaries = sorted(summaries, key=lambda x: x["page_number"])
         summaries = CurriculumSummary(
@@ -0,0 +1,127 @@
+"""Fail-isolated fan-out of async jobs with results persisted as they complete.
+
+``asyncio.gather`` raises the first error of a fan-out and the results of all other jobs are lost
+with it, even those that already finished. ``fan_out`` runs a job per item, hands every result to
+``on_result`` as soon as it is there, e.g. to write it to disk, and collects the errors of failed
+jobs instead of raising them. Only the failed items are run again, up to ``retries`` times, and
+the items that still fail are reported in the returned ``FanOutResult``. An item that failed with
+a ``FanOutError`` is not run again, its own fan-out already retried the jobs that failed in it, so
+retries of nested fan-outs do not multiply.
+
+For outputs that are only written once all jobs are done, a ``Checkpoint`` keeps the finished
+results in a JSON lines file, so the next run after a failure only redoes the missing ones.
+"""
+
+import asyncio
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Generic, Hashable, Iterable, Type, TypeVar
+
+from loguru import logger
+from pydantic import BaseModel
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+M = TypeVar("M", bound=BaseModel)
+
+
+class FanOutError(Exception):
+    """Some jobs of a fan-out failed, ``failures`` maps their items to the errors."""
+
+    def __init__(self, message: str, failures: dict):
+        super().__init__(message)
+        self.failures = failures
+
+
+@dataclass
+class FanOutResult(Generic[K, T]):
+    """Results of the succeeded items in the order of the items, and errors of the failed ones."""
+
+    results: dict[K, T] = field(default_factory=dict)
+    failures: dict[K, Exception] = field(default_factory=dict)
+
+    def raise_for_failures(self, description: str = "jobs"):
+        if self.failures:
+            details = "; ".join(f"{item}: {error!r}" for item, error in self.failures.items())
+            raise FanOutError(
+                f"{len(self.failures)} of {len(self.results) + len(self.failures)} {description} failed: "
+                f"{details}",
+                self.failures,
+            )
+
+
+async def fan_out(
+    items: Iterable[K],
+    run: Callable[[K], Awaitable[T]],
+    on_result: Callable[[K, T], Any] | None = None,
+    retries: int = 1,
+) -> FanOutResult[K, T]:
+    """Run ``run(item)`` for all items concurrently, retrying only the failed ones.
+
+    ``on_result`` is called with every result as soon as its job finished. An error raised by it
+    counts as a failure of the item, so the item is run again. Items failing with a ``FanOutError``
+    of a nested fan-out are not run again.
+    """
+    items = list(dict.fromkeys(items))
+    results: dict[K, T] = {}
+    failures: dict[K, Exception] = {}
+
+    async def attempt(item: K) -> tuple[K, Any, Exception | None]:
+        try:
+            result = await run(item)
+            if on_result is not None:
+                on_result(item, result)
+        except Exception as e:
+            return item, None, e
+        return item, result, None
+
+    pending = items
+    for round_number in range(retries + 1):
+        if round_number:
+            logger.warning(f"Retrying {len(pending)} failed of {len(items)} jobs, attempt {round_number + 1}")
+        # Failures of nested fan-outs stay failed, all others are run again
+        failures = {item: error for item, error in failures.items() if isinstance(error, FanOutError)}
+        for next_done in asyncio.as_completed([attempt(item) for item in pending]):
+            item, result, error = await next_done
+            if error is None:
+                results[item] = result
+            else:
+                logger.warning(f"Job {item} failed: {error!r}")
+                failures[item] = error
+        pending = [item for item, error in failures.items() if not isinstance(error, FanOutError)]
+        if not pending:
+            break
+
+    return FanOutResult(results={item: results[item] for item in items if item in results}, failures=failures)
+
+
+class Checkpoint(Generic[M]):
+    """Finished results of a fan-out by key, appended to a JSON lines file as they complete."""
+
+    def __init__(self, path: str | Path, model: Type[M]):
+        self.path = Path(path)
+        self.model = model
+
+    def load(self) -> dict[str, M]:
+        if not self.path.is_file():
+            return {}
+        results = {}
+        for line in self.path.read_text().splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line of a run that was killed while writing it
+                continue
+            results[entry["key"]] = self.model.model_validate(entry["result"])
+        return results
+
+    def save(self, key: str, result: M):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as f:
+            f.write(
+                json.dumps({"key": key, "result": result.model_dump(mode="json")}, ensure_ascii=False) + "\n"
+            )
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
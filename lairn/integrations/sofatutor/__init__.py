@@ -1,3 +1,7 @@
-from lairn.config import MAIN_DIR
+def __getattr__(name: str):
+    # Resolved lazily, so that importing the parsers does not require MAIN_DIR
+    if name == "SOFA_DIR":
+        from lairn.config import MAIN_DIR
 
-SOFA_DIR = MAIN_DIR / "sofatutor"
+        return MAIN_DIR / "sofatutor"
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,12 +4,10 @@ from datetime import date
 from functools import lru_cache
 from pathlib import Path
 
-import requests
-from dateutil import parser
-from bs4 import BeautifulSoup
 from pydantic import BaseModel, Field
 from slugify import slugify
 
+from lairn.tracing import traced
 
 # Replace German month names with English equivalents
 translations = {
@@ -38,12 +36,20 @@ def translate_date_string(date_string: str) -> str:
 
 
 def parse_date_string(date_string: str) -> date:
+    from dateutil import parser
+
     return parser.parse(translate_date_string(date_string), dayfirst=True).date()
 
 
 @lru_cache
+@traced()
 def parse_video_description(url: str) -> dict:
-    response = requests.get(url)
+    # Crawling dependencies are imported on use, loading parsed activities does not need them
+    from bs4 import BeautifulSoup
+
+    from lairn.cassette import http_get
+
+    response = http_get(url)
 
     if response.status_code == 200:
         webpage_content = response.text
@@ -108,7 +114,10 @@ def parse_activity_list_item(item) -> dict:
     return activity_dict
 
 
+@traced()
 def parse_html_file(file_path: Path) -> list[dict]:
+    from bs4 import BeautifulSoup
+
     with open(file_path, "r", encoding="utf-8") as file:
         html_content = file.read()
 
@@ -179,6 +188,7 @@ class SofatutorLearningActivity(BaseModel):
 """
 
 
+@traced()
 def load_activities(path: Path) -> list[SofatutorLearningActivity]:
     if not isinstance(path, Path):
         path = Path(path)
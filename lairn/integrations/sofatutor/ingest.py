@@ -0,0 +1,106 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple
+
+import pandas as pd
+from loguru import logger
+
+from lairn.integrations import sofatutor
+from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity, parse_html_file
+from lairn.tracing import traced
+
+TEST_STR = "?launchpad=test"
+SOFAHELD_STR = "practice_app"
+EXPORT_FILE_NAME = "Mein Sofa.html"
+
+
+@lru_cache
+def load_sofa_videos(parsed_dir: Path) -> pd.DataFrame:
+    # Read on first use, not on import: the sheet takes seconds to load
+    return pd.read_excel(parsed_dir / "sofatutor_videos.xlsx")
+
+
+@lru_cache
+def find_video_row(parsed_dir: Path, url: str) -> Tuple[int, pd.Series]:
+    df_sofa = load_sofa_videos(parsed_dir)
+    rows = df_sofa[df_sofa.url.str.contains(url)]
+    related_years = rows.year.unique()
+    return related_years, rows.iloc[0]
+
+
+def clean_string(input_string):
+    cleaned_string = re.sub(r"\n+", "\n", input_string)
+    cleaned_string = re.sub(r"\s+", " ", cleaned_string)
+
+    # Replace escaped quotation marks with slanted quotation marks
+    cleaned_string = cleaned_string.replace('"', "“")
+
+    # Replace newline characters with " | "
+    cleaned_string = cleaned_string.replace("\n", " | ")
+
+    # Remove any redundant sentence starting with "Teste dein Wissen"
+    cleaned_string = re.sub(r"\s*\|*\s*Teste dein Wissen.*?(\.|!|\?)", "", cleaned_string)
+
+    # Remove leading or trailing whitespace and extra separators
+    cleaned_string = cleaned_string.strip().strip("|")
+
+    return cleaned_string
+
+
+def parse_activity(data: dict, parsed_dir: Path) -> SofatutorLearningActivity:
+    """Complete an activity from the "Mein Sofa" export with the details of the crawled video."""
+    url = data["url"].strip()
+
+    if SOFAHELD_STR in url:
+        return SofatutorLearningActivity.model_validate(
+            {
+                **data,
+                "activity_type": "practice",
+                "related_years": None,
+                "year_type": None,
+                "topic_chain": None,
+                "description": None,
+            }
+        )
+
+    is_test = TEST_STR in url
+    related_years, video_details = find_video_row(parsed_dir, url.replace(TEST_STR, ""))
+    return SofatutorLearningActivity.model_validate(
+        {
+            **data,
+            "activity_type": "test" if is_test else "video",
+            "related_years": related_years,
+            "year_type": video_details["year_type"],
+            "topic_chain": video_details["topic_chain"],
+            "description": clean_string(video_details["description"]),
+        }
+    )
+
+
+@traced()
+def ingest_exports(
+    sofa_dir: Path | None = None, output_dir: Path | None = None, skip_existing: bool = True
+) -> int:
+    """Parse all "Mein Sofa" exports into activity files, returns the number of files written."""
+    sofa_dir = sofa_dir or sofatutor.SOFA_DIR
+    output_dir = output_dir or sofa_dir / "activities"
+    parsed_dir = sofa_dir / "sofatutor_parsed"
+
+    written = 0
+    for export_dir in (sofa_dir / "sofatutor_exports").glob("*export*"):
+        export = export_dir / EXPORT_FILE_NAME
+        if not export.is_file():
+            continue
+
+        logger.info("Parsing {}", export)
+        for data in parse_html_file(export):
+            activity = parse_activity(data, parsed_dir)
+
+            out_path = output_dir / activity.default_file_name
+            if out_path.is_file() and skip_existing:
+                continue
+
+            out_path.write_text(activity.json())
+            written += 1
+    return written
@@ -5,12 +5,13 @@ from time import sleep
 from typing import Literal
 
 import pandas as pd
-import requests
 import unmarkd
 from bs4 import BeautifulSoup
 from loguru import logger
 
+from lairn.cassette import http_get
 from lairn.integrations.sofatutor import SOFA_DIR
+from lairn.tracing import span, traced
 
 SOFATUTOR_URL = "https://www.sofatutor.com"
 
@@ -69,11 +70,9 @@ def get_cookie(subject: str, year: int, year_type: Literal["grade", "learn_year"
     return {"_sofatutor_subject_level": f"{YEAR_TYPE_DICT_DE[year_type]}-{year}-{subject}"}
 
 
+@traced()
 def _get_soup(url: str, cookie: dict | None = None) -> BeautifulSoup | None:
-    if cookie is None:
-        response = requests.get(url)
-    else:
-        response = requests.get(url, cookies=cookie)
+    response = http_get(url, cookies=cookie)
 
     if not response.status_code == 200:
         return None
@@ -114,6 +113,7 @@ def _clean_description(desc: str) -> str:
     return desc
 
 
+@traced()
 def _parse_video_page(url: str) -> dict:
     logger.info(f"Processing video page {url}")
     soup = _get_soup(url)
@@ -145,6 +145,7 @@ def _parse_video_page(url: str) -> dict:
     }
 
 
+@traced()
 def walk_lowest_level_topic_page(soup: BeautifulSoup) -> dict | None:
     topic = _get_content_structure_header(soup)
     if topic is None:
@@ -172,6 +173,7 @@ def walk_lowest_level_topic_page(soup: BeautifulSoup) -> dict | None:
     }
 
 
+@traced()
 def walk_topics(topic_href: str, cookie: dict) -> dict | None:
     logger.info(
         f"Processing {topic_href} with cookie {cookie['_sofatutor_subject_level'] if cookie else None}"
@@ -230,8 +232,9 @@ class SofatutorCrawler:
         else:
             raise ValueError("Only one of grade or learn_year must be provided")
 
+    @traced()
     def get_subjects(self) -> list[dict]:
-        response = requests.get(SOFATUTOR_URL)
+        response = http_get(SOFATUTOR_URL)
 
         if response.status_code == 200:
             webpage_content = response.text
@@ -250,8 +253,9 @@ class SofatutorCrawler:
 
         return subjects
 
+    @traced()
     def parse_sub_url(self, sub_url: str, cookie=dict) -> dict | None:
-        response = requests.get(sub_url + "?ref=videos")
+        response = http_get(sub_url + "?ref=videos")
 
         if not response.status_code == 200:
             return None
@@ -287,6 +291,7 @@ class SofatutorCrawler:
 
         return parsed
 
+    @traced()
     def crawl(self):
         subjects = self.get_subjects()
 
@@ -312,7 +317,8 @@ class SofatutorCrawler:
                     sub_url = self.get_sub_url(subject["url"], grade=grade)
                     cookie = get_cookie(subject_code, grade, year_type="grade")
 
-                    content = self.parse_sub_url(sub_url, cookie)
+                    with span("crawl_subject_year", subject=subject_str_, year=grade):
+                        content = self.parse_sub_url(sub_url, cookie)
 
                     if content is not None:
                         content["year"] = grade
@@ -335,7 +341,8 @@ class SofatutorCrawler:
                     sub_url = self.get_sub_url(subject["url"], learn_year=learn_year)
                     cookie = get_cookie(subject_code, learn_year, year_type="learn_year")
 
-                    content = self.parse_sub_url(sub_url, cookie)
+                    with span("crawl_subject_year", subject=subject_str_, year=learn_year):
+                        content = self.parse_sub_url(sub_url, cookie)
 
                     if content is not None:
                         content["year"] = learn_year
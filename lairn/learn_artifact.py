@@ -1,9 +1,16 @@
+import json
+import os
+from functools import cached_property
 from hashlib import sha256
 from pathlib import Path
 
+from loguru import logger
+
 # from langchain_core.pydantic_v1 import BaseModel, Field
 from pydantic import BaseModel, Field
 
+from lairn.tracing import traced
+
 
 class LearnLogArtifact(BaseModel):
     date: str = Field(
@@ -14,9 +21,9 @@ class LearnLogArtifact(BaseModel):
     tags: list[str] = Field(description="Tags that describe this artifact.")
     content: str = Field(description="The content of the artifact.")
 
-    @property
+    @cached_property
     def identifier(self) -> str:
-        """Return identifier composed of date, subject and SHA256 hash of content."""
+        """Return identifier composed of date, subject and SHA256 hash of content, computed once."""
         content_hash = sha256(self.content.encode()).hexdigest()[:8]
         return f"{self.date}_{self.school_subject}_{content_hash}"
 
@@ -30,21 +37,125 @@ Tags: {", ".join(self.tags)}
 """
 
 
-def load_artifacts(path: Path, must_include_tags: list[str] | None = None) -> list[LearnLogArtifact]:
-    if not isinstance(path, Path):
-        path = Path(path)
+# Name of the persisted catalog in an artifacts directory, without .json so it is not taken for an artifact
+CATALOG_FILE_NAME = ".artifact_catalog"
+
+
+class ArtifactCatalog:
+    """Catalog of the artifacts in a directory with an inverted index from tags to artifact files.
+
+    The catalog keeps the modification time and size, identifier, subject and tags of every artifact
+    file and is persisted next to the artifacts. Files with an unchanged signature are neither parsed
+    nor hashed again, and a query for tags intersects the file sets of the tags and only parses the
+    matching files. Parsed artifacts are kept in memory for the lifetime of the catalog.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: dict[str, dict] = {}
+        self.tag_index: dict[str, set[str]] = {}
+        self._artifacts: dict[str, tuple[list[int], LearnLogArtifact]] = {}
+        self._load()
+
+    @property
+    def catalog_path(self) -> Path:
+        return self.path / CATALOG_FILE_NAME
+
+    def _load(self):
+        try:
+            self.entries = json.loads(self.catalog_path.read_text())["entries"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self.entries = {}
+        self._index_tags()
+
+    def _save(self):
+        try:
+            self.catalog_path.write_text(json.dumps({"entries": self.entries}, ensure_ascii=False))
+        except OSError as e:
+            logger.warning(f"Could not save the artifact catalog {self.catalog_path}: {e}")
+
+    def _index_tags(self):
+        self.tag_index = {}
+        for file_name, entry in self.entries.items():
+            for tag in entry["tags"]:
+                self.tag_index.setdefault(tag, set()).add(file_name)
 
-    artifacts = []
-    for file in path.glob("*.json"):
-        with open(file, "r") as f:
+    def _parse(self, file_name: str, signature: list[int]) -> LearnLogArtifact:
+        with open(self.path / file_name, "r") as f:
             artifact = LearnLogArtifact.model_validate_json(f.read())
+        self._artifacts[file_name] = (signature, artifact)
+        return artifact
 
-        if must_include_tags is not None:
-            if not all(tag in artifact.tags for tag in must_include_tags):
+    def refresh(self):
+        """Bring the catalog up to date with the directory, parsing only new and changed files."""
+        signatures = {}
+        if self.path.is_dir():
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json") and entry.is_file():
+                        stat = entry.stat()
+                        signatures[entry.name] = [stat.st_mtime_ns, stat.st_size]
+
+        changed = False
+        for file_name in self.entries.keys() - signatures.keys():
+            del self.entries[file_name]
+            self._artifacts.pop(file_name, None)
+            changed = True
+        for file_name, signature in signatures.items():
+            entry = self.entries.get(file_name)
+            if entry is not None and entry["signature"] == signature:
                 continue
+            artifact = self._parse(file_name, signature)
+            self.entries[file_name] = {
+                "signature": signature,
+                "identifier": artifact.identifier,
+                "school_subject": artifact.school_subject,
+                "tags": artifact.tags,
+            }
+            changed = True
+
+        if changed:
+            self._index_tags()
+            self._save()
+
+    def files(self, must_include_tags: list[str] | None = None) -> list[str]:
+        """Names of the artifact files carrying all of ``must_include_tags``."""
+        if must_include_tags is None:
+            return sorted(self.entries)
+        file_sets = [self.tag_index.get(tag, set()) for tag in must_include_tags]
+        return sorted(set.intersection(*file_sets)) if file_sets else sorted(self.entries)
+
+    def artifact(self, file_name: str) -> LearnLogArtifact:
+        signature = self.entries[file_name]["signature"]
+        cached = self._artifacts.get(file_name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        return self._parse(file_name, signature)
+
+    def artifacts(self, must_include_tags: list[str] | None = None) -> list[LearnLogArtifact]:
+        return [self.artifact(file_name) for file_name in self.files(must_include_tags)]
+
+    def identifiers(self) -> dict[str, str]:
+        """Identifier of every artifact by file name, without reading the artifacts."""
+        return {file_name: entry["identifier"] for file_name, entry in self.entries.items()}
 
-        artifacts.append(artifact)
-    return artifacts
+
+_CATALOGS: dict[Path, ArtifactCatalog] = {}
+
+
+def artifact_catalog(path: Path) -> ArtifactCatalog:
+    """The refreshed catalog of the artifacts in ``path``, shared by all loaders in the process."""
+    path = Path(path)
+    if path not in _CATALOGS:
+        _CATALOGS[path] = ArtifactCatalog(path)
+    catalog = _CATALOGS[path]
+    catalog.refresh()
+    return catalog
+
+
+@traced()
+def load_artifacts(path: Path, must_include_tags: list[str] | None = None) -> list[LearnLogArtifact]:
+    return artifact_catalog(path).artifacts(must_include_tags)
 
 
 def load_evaluations(path: Path, class_level: int = 1) -> dict[str, LearnLogArtifact]:
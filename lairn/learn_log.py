@@ -5,6 +5,8 @@ from pathlib import Path
 
 from pydantic import BaseModel, Field, root_validator
 
+from lairn.tracing import traced
+
 
 def preprocess_text_field(text):
     # Escape unescaped quotation marks
@@ -58,6 +60,7 @@ class LearnLogMessage(BaseModel):
 """
 
 
+@traced()
 def load_logs(path: Path) -> list[LearnLogMessage]:
     if not isinstance(path, Path):
         path = Path(path)
@@ -0,0 +1,28 @@
+from langchain_core.language_models import BaseChatModel
+
+from lairn import cassette, config
+from lairn.llm.fake import FAKE_MODEL_NAME
+from lairn.llm.gateway import GATEWAY, GatewayChatModel
+from lairn.llm.telemetry import TELEMETRY
+
+
+def create_chat_model(model_name: str | None = None, temperature: float = 0.0) -> BaseChatModel:
+    """Create a chat model whose requests go through the ``LLMGateway``, with telemetry attached.
+
+    The model name ``fake`` (e.g. ``LLM=fake``) selects the offline ``FakeChatModel``.
+    """
+    model_name = model_name or config.LLM
+    if model_name == FAKE_MODEL_NAME:
+        from lairn.llm.fake import FakeChatModel
+
+        model = FakeChatModel(latency=config.FAKE_LLM_LATENCY)
+    else:
+        # The OpenAI client is slow to import and only needed once a model is created
+        from langchain_openai import ChatOpenAI
+
+        kwargs = {}
+        if cassette.replaying() and not config.OPENAI_API_KEY:
+            # Replayed requests never reach OpenAI, so replaying works without an API key
+            kwargs["api_key"] = "cassette-replay"
+        model = ChatOpenAI(model_name=model_name, temperature=temperature, **kwargs)
+    return GatewayChatModel(model=model, gateway=GATEWAY, callbacks=[TELEMETRY])
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import re
+import time
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+FAKE_MODEL_NAME = "fake"
+
+_SCHEMA_PATTERN = re.compile(r"```\s*(\{.*\})\s*```", re.DOTALL)
+
+FAKE_TEXT = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut "
+    "labore et dolore magna aliqua."
+)
+
+# Number of items of array properties whose validators require a length their JSON schemas do not declare
+VALIDATED_ITEM_COUNTS = {
+    # MultipleChoiceQuizQuestion.answers
+    "answers": 4,
+}
+
+
+def _resolve(schema: dict, root: dict) -> dict:
+    ref = schema.get("$ref")
+    if ref is None:
+        return schema
+    node = root
+    for part in ref.lstrip("#/").split("/"):
+        node = node[part]
+    return _resolve(node, root)
+
+
+def dummy_value(schema: dict, root: dict | None = None, num_items: int | None = None) -> Any:
+    """Build the smallest instance of a JSON schema that satisfies its declared constraints.
+
+    ``num_items`` overrides the number of items of an array.
+    """
+    root = root if root is not None else schema
+    schema = _resolve(schema, root)
+
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"]
+            return dummy_value(options[0] if options else schema[key][0], root)
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "null")
+    if schema_type == "object" or "properties" in schema:
+        return {
+            name: dummy_value(value, root, VALIDATED_ITEM_COUNTS.get(name))
+            for name, value in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        num_items = num_items or max(schema.get("minItems", 1), 1)
+        return [dummy_value(schema.get("items", {}), root) for _ in range(num_items)]
+    if schema_type == "integer":
+        return max(schema.get("minimum", 1), 1)
+    if schema_type == "number":
+        return float(max(schema.get("minimum", 1), 1))
+    if schema_type == "boolean":
+        return True
+    if schema_type == "null":
+        return None
+    if schema.get("format") == "date":
+        return "2024-01-01"
+    if schema.get("format") == "date-time":
+        return "2024-01-01T00:00:00"
+    return FAKE_TEXT[: max(schema.get("minLength", 0), 32)]
+
+
+def fake_content(prompt: str, response_format: dict | None = None) -> str:
+    """Dummy response to a prompt: an instance of the requested JSON schema, if any, else placeholder text."""
+    schema = None
+    if response_format and response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"]["schema"]
+    else:
+        match = _SCHEMA_PATTERN.search(prompt)
+        if match:
+            try:
+                schema = json.loads(match.group(1))
+            except json.JSONDecodeError:
+                schema = None
+    return json.dumps(dummy_value(schema), ensure_ascii=False) if schema else FAKE_TEXT
+
+
+class FakeChatModel(BaseChatModel):
+    """Offline chat model for profiling and dry runs.
+
+    Answers prompts that carry a JSON schema, either in the parser format instructions or as a
+    native ``response_format``, with a dummy instance of the schema, and all other prompts with
+    placeholder text. ``latency`` simulates the response time of the API.
+    """
+
+    latency: float = 0.0
+    model_name: str = FAKE_MODEL_NAME
+
+    @property
+    def _llm_type(self) -> str:
+        return "lairn-fake"
+
+    def _respond(self, messages: list[BaseMessage], response_format: dict | None) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        content = fake_content(prompt, response_format)
+
+        # Rough token counts, so that telemetry reports the token volume of a run
+        token_usage = {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4,
+        }
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=content))],
+            llm_output={"token_usage": token_usage, "model_name": self.model_name},
+        )
+
+    def _generate(
+        self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages, kwargs.get("response_format"))
+
+    async def _agenerate(
+        self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages, kwargs.get("response_format"))
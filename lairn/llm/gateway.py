@@ -0,0 +1,617 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+from loguru import logger
+
+from lairn import cassette, config
+from lairn.llm import routing
+from lairn.llm.telemetry import TELEMETRY, UNKNOWN_STAGE
+
+RATE_LIMIT_STAGE = "rate_limit"
+
+# Share of the API capacity a priority class gets while others wait, relative to each other
+PRIORITY_WEIGHTS = {"interactive": 16.0, "normal": 4.0, "backfill": 1.0}
+
+_PRIORITY: ContextVar[str | None] = ContextVar("llm_priority", default=None)
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    import openai
+
+    return isinstance(error, openai.RateLimitError)
+
+
+def _prompt_text(messages: list[BaseMessage]) -> str:
+    return "\n".join(str(message.content) for message in messages)
+
+
+class RateLimiter:
+    """Spaces request starts evenly to stay below ``rpm`` requests per minute, for async and sync callers."""
+
+    def __init__(self, rpm: int):
+        self.interval = 60.0 / rpm
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            return slot - now
+
+    async def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Hedger:
+    """Decides when a slow request gets a duplicate, from the latencies of recent requests per stage.
+
+    A request that has not finished after the ``percentile`` latency of the last ``window`` requests
+    of its stage is sent a second time, and the first response wins. Stages need ``min_samples``
+    requests before they are hedged. At most ``budget`` hedges per request are sent, e.g. 0.05 for
+    at most 5% extra requests, which bounds the extra cost.
+    """
+
+    def __init__(self, percentile: float, budget: float, window: int = 200, min_samples: int = 20):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self._latencies: dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+
+    def delay(self, stage: str) -> float | None:
+        """Seconds after which a request of ``stage`` is hedged, None if the stage has too few samples."""
+        latencies = self._latencies[stage]
+        if len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def observe(self, stage: str, latency: float):
+        self._latencies[stage].append(latency)
+
+    def spend(self) -> bool:
+        """Take a hedge from the budget, False if it is used up."""
+        if self.hedges + 1 > self.budget * self.requests:
+            return False
+        self.hedges += 1
+        return True
+
+
+def _check_priority(priority: str) -> str:
+    if priority not in PRIORITY_WEIGHTS:
+        raise ValueError(f"Unknown priority {priority}, expected one of {', '.join(PRIORITY_WEIGHTS)}")
+    return priority
+
+
+def current_priority() -> str:
+    """Priority class of the LLM requests of the current context, ``LLM_PRIORITY`` by default."""
+    return _PRIORITY.get() or _check_priority(config.LLM_PRIORITY)
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """Send the LLM requests of the code in the block, and of the tasks it starts, with ``priority``."""
+    token = _PRIORITY.set(_check_priority(priority))
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+class RequestPriority:
+    """Priority class of a request, raised while the request waits when a more urgent caller shares it."""
+
+    def __init__(self, priority: str):
+        self.priority = _check_priority(priority)
+        self._on_raise: Callable[[str], None] | None = None
+
+    def raise_to(self, priority: str):
+        if PRIORITY_WEIGHTS[_check_priority(priority)] <= PRIORITY_WEIGHTS[self.priority]:
+            return
+        self.priority = priority
+        if self._on_raise is not None:
+            self._on_raise(priority)
+
+
+class FairScheduler:
+    """Admits async requests to the API in weighted fair order of their priority classes.
+
+    Waiting requests are ordered by virtual finish times: every request of a class advances the
+    finish time of its class by ``1 / weight``, so while all classes wait, they are admitted in
+    proportion to their weights, and a request of a class that was idle overtakes the queue of the
+    others. A request is admitted once one of ``concurrency`` slots is free (0 for no limit) and the
+    rate limiter grants a start, and the next request is only picked at that moment, so an
+    interactive request waits for at most the requests already started, not for the whole backlog.
+    A request whose priority is raised while it waits is queued again in its new class.
+    """
+
+    def __init__(self, concurrency: int, rate_limiter: RateLimiter | None):
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.active = 0
+        self._queue: list[tuple[float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_times: dict[str, float] = defaultdict(float)
+        self._released = asyncio.Event()
+        self._dispatcher: asyncio.Task | None = None
+
+    async def _dispatch(self):
+        while self._queue:
+            if self.concurrency and self.active >= self.concurrency:
+                self._released.clear()
+                await self._released.wait()
+                continue
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            # Picked only now, requests that arrived while waiting for the slot compete as well
+            while self._queue:
+                finish_time, _, waiter = heapq.heappop(self._queue)
+                if not waiter.done():
+                    self._virtual_time = finish_time
+                    self.active += 1
+                    waiter.set_result(None)
+                    break
+        self._dispatcher = None
+
+    def _enqueue(self, priority: str, waiter: asyncio.Future):
+        start = max(self._virtual_time, self._finish_times[priority])
+        finish_time = start + 1.0 / PRIORITY_WEIGHTS[priority]
+        self._finish_times[priority] = finish_time
+        heapq.heappush(self._queue, (finish_time, next(self._sequence), waiter))
+
+    def _requeue(self, priority: str, waiter: asyncio.Future):
+        # The old entry stays in the heap and is skipped once the waiter was admitted
+        if not waiter.done():
+            self._enqueue(priority, waiter)
+
+    async def acquire(self, priority: str | RequestPriority):
+        if isinstance(priority, str):
+            priority = RequestPriority(priority)
+        waiter = asyncio.get_running_loop().create_future()
+        self._enqueue(priority.priority, waiter)
+        priority._on_raise = lambda raised: self._requeue(raised, waiter)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just before the caller was cancelled
+                self.release()
+            raise
+        finally:
+            priority._on_raise = None
+
+    def release(self):
+        self.active -= 1
+        self._released.set()
+
+    @asynccontextmanager
+    async def slot(self, priority: str | RequestPriority):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def dump_result(result: ChatResult) -> dict:
+    return {"content": result.generations[0].message.content, "llm_output": result.llm_output}
+
+
+def load_result(entry: dict, **flags: Any) -> ChatResult:
+    return ChatResult(
+        generations=[ChatGeneration(message=AIMessage(content=entry["content"]))],
+        llm_output={**(entry["llm_output"] or {}), **flags},
+    )
+
+
+class ResponseCache:
+    """Chat results on disk, keyed by model parameters, messages and call options."""
+
+    def __init__(self, cache_dir: str | Path):
+        self.cache_dir = Path(cache_dir)
+
+    @staticmethod
+    def key(model: BaseChatModel, messages: list[BaseMessage], stop: list[str] | None, kwargs: dict) -> str:
+        payload = {
+            "model": model._identifying_params,
+            "messages": [(message.type, message.content) for message in messages],
+            "stop": stop,
+            "kwargs": kwargs,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> ChatResult | None:
+        path = self._path(key)
+        if not path.is_file():
+            return None
+        return load_result(json.loads(path.read_text()), response_cache_hit=True)
+
+    def put(self, key: str, result: ChatResult):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(dump_result(result), ensure_ascii=False, default=str))
+        tmp_path.replace(path)
+
+
+class LLMGateway:
+    """Central execution path of all chat model calls.
+
+    Every model created by ``create_chat_model`` sends its requests through the gateway, which
+    applies a concurrency limit, a requests-per-minute limit, an on-disk response cache and rate
+    limit retries. Async requests wait for both limits in a ``FairScheduler``, in weighted fair
+    order of the priority class set with ``llm_priority``. Identical requests in flight at the same
+    time are sent once and share the response, at the most urgent priority of their callers.
+    Sync requests only wait for the rate limit: they block their thread and cannot be queued
+    with the async requests of an event loop, so they have no concurrency slot or priority, which
+    is fine for the scripts that send them one at a time. With a hedging percentile, async requests slower
+    than that percentile of their stage are sent a second time, within a budget of extra requests
+    (see ``Hedger``); the duplicate shares the concurrency slot of the original. In dry-run mode no
+    request is sent: the prompt tokens are counted and a dummy response of the requested format is
+    returned, so pipelines run through and telemetry reports the token volume and estimated cost.
+    Requests that are sent go to the cassette instead of the model while one is in use, see
+    ``lairn.cassette``.
+    """
+
+    def __init__(
+        self,
+        concurrency: int | None = None,
+        rpm: int | None = None,
+        cache_dir: str | Path | None = None,
+        dry_run: bool = False,
+        hedge_percentile: float = 0.0,
+        hedge_budget: float = 0.05,
+        max_rate_limit_retries: int = 5,
+        rate_limit_backoff: float = 5.0,
+    ):
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.rate_limit_backoff = rate_limit_backoff
+        self.concurrency = 0
+        self.rate_limiter: RateLimiter | None = None
+        self.cache: ResponseCache | None = None
+        self.dry_run = False
+        self.hedge_percentile = 0.0
+        self.hedge_budget = 0.05
+        self.hedger: Hedger | None = None
+        self._schedulers: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._in_flight: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.configure(
+            concurrency=concurrency,
+            rpm=rpm,
+            cache_dir=cache_dir,
+            dry_run=dry_run,
+            hedge_percentile=hedge_percentile,
+            hedge_budget=hedge_budget,
+        )
+
+    def configure(
+        self,
+        concurrency: int | None = None,
+        rpm: int | None = None,
+        cache_dir: str | Path | None = None,
+        dry_run: bool | None = None,
+        hedge_percentile: float | None = None,
+        hedge_budget: float | None = None,
+    ):
+        """Change settings, ``None`` keeps the current value. A limit or percentile of 0 disables it."""
+        if concurrency is not None:
+            self.concurrency = concurrency
+            self._schedulers = weakref.WeakKeyDictionary()
+        if rpm is not None:
+            self.rate_limiter = RateLimiter(rpm) if rpm > 0 else None
+            self._schedulers = weakref.WeakKeyDictionary()
+        if cache_dir is not None:
+            self.cache = ResponseCache(cache_dir)
+        if dry_run is not None:
+            self.dry_run = dry_run
+        if hedge_percentile is not None:
+            self.hedge_percentile = hedge_percentile
+        if hedge_budget is not None:
+            self.hedge_budget = hedge_budget
+        if hedge_percentile is not None or hedge_budget is not None:
+            self.hedger = (
+                Hedger(self.hedge_percentile, self.hedge_budget) if self.hedge_percentile > 0 else None
+            )
+
+    def scheduler(self) -> FairScheduler | None:
+        """Scheduler of the running event loop, None without concurrency and rate limits."""
+        if not self.concurrency and self.rate_limiter is None:
+            return None
+        # Schedulers are bound to an event loop, the CLI and scripts may run several loops
+        loop = asyncio.get_running_loop()
+        if loop not in self._schedulers:
+            self._schedulers[loop] = FairScheduler(self.concurrency, self.rate_limiter)
+        return self._schedulers[loop]
+
+    def _in_flight_requests(self) -> dict[str, tuple[asyncio.Task, RequestPriority]]:
+        return self._in_flight.setdefault(asyncio.get_running_loop(), {})
+
+    def _dry_run_result(self, model: BaseChatModel, messages: list[BaseMessage], kwargs: dict) -> ChatResult:
+        from lairn.common import count_tokens
+        from lairn.llm.fake import fake_content
+
+        model_name = getattr(model, "model_name", None) or config.LLM
+        prompt = _prompt_text(messages)
+        content = fake_content(prompt, kwargs.get("response_format"))
+        prompt_tokens = count_tokens(prompt, model_name)
+        completion_tokens = count_tokens(content, model_name)
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=content))],
+            llm_output={
+                "token_usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+                "model_name": model_name,
+                "dry_run": True,
+            },
+        )
+
+    async def _acall(
+        self,
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        stop: list[str] | None,
+        key: str,
+        kwargs: dict,
+    ) -> ChatResult:
+        """Send the request to the model, or to the cassette if one is in use."""
+        if cassette.CASSETTE is None:
+            return await model._agenerate(messages, stop=stop, **kwargs)
+        return await cassette.CASSETTE.arun(
+            "llm", key, lambda: model._agenerate(messages, stop=stop, **kwargs), dump_result, load_result
+        )
+
+    def _call(
+        self,
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        stop: list[str] | None,
+        key: str,
+        kwargs: dict,
+    ) -> ChatResult:
+        if cassette.CASSETTE is None:
+            return model._generate(messages, stop=stop, **kwargs)
+        return cassette.CASSETTE.run(
+            "llm", key, lambda: model._generate(messages, stop=stop, **kwargs), dump_result, load_result
+        )
+
+    async def _hedged(self, stage: str, call: Callable[[], Awaitable[ChatResult]]) -> ChatResult:
+        """Result of ``call``, sent a second time if it is slower than the hedging percentile of ``stage``."""
+        if self.hedger is None:
+            return await call()
+
+        self.hedger.requests += 1
+        start = time.monotonic()
+        delay = self.hedger.delay(stage)
+        if delay is None:
+            result = await call()
+            self.hedger.observe(stage, time.monotonic() - start)
+            return result
+
+        primary = asyncio.ensure_future(call())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.hedger.spend():
+            result = await primary
+            self.hedger.observe(stage, time.monotonic() - start)
+            return result
+
+        TELEMETRY.record_hedged_request(stage)
+
+        async def hedge():
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            return await call()
+
+        pending = {primary, asyncio.ensure_future(hedge())}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                failed = [task for task in done if task.exception() is not None]
+                if len(failed) < len(done):
+                    result = next(task for task in done if task.exception() is None).result()
+                    break
+                if not pending:
+                    # Both failed, the retry loop decides about the error of the original request
+                    raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        self.hedger.observe(stage, time.monotonic() - start)
+        return result
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Seconds to wait before retrying a rate limited request, re-raises all other errors."""
+        if attempt == self.max_rate_limit_retries or not _is_rate_limit_error(error):
+            raise error
+        wait = self.rate_limit_backoff * 2**attempt
+        logger.warning(f"Rate limit error, retrying in {wait:.0f} seconds")
+        TELEMETRY.record_retry(RATE_LIMIT_STAGE)
+        return wait
+
+    async def agenerate(
+        self,
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        stage: str = UNKNOWN_STAGE,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """Generate a response, identical concurrent requests share one call (single flight).
+
+        ``stage`` is the pipeline stage of the request, for the hedging percentiles.
+        """
+        if self.dry_run:
+            return self._dry_run_result(model, messages, kwargs)
+
+        key = ResponseCache.key(model, messages, stop, kwargs)
+        in_flight = self._in_flight_requests()
+        if key in in_flight:
+            task, priority = in_flight[key]
+            # An interactive caller must not wait at the priority of a backfill that sent the request
+            priority.raise_to(current_priority())
+            result = await asyncio.shield(task)
+            return ChatResult(
+                generations=result.generations, llm_output={**(result.llm_output or {}), "coalesced": True}
+            )
+
+        priority = RequestPriority(current_priority())
+        task = asyncio.ensure_future(self._agenerate(model, messages, stop, key, stage, priority, kwargs))
+        in_flight[key] = (task, priority)
+        task.add_done_callback(lambda _: in_flight.pop(key, None))
+        # Shielded, so that waiting duplicates still get the response if this caller is cancelled
+        return await asyncio.shield(task)
+
+    async def _agenerate(
+        self,
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        stop: list[str] | None,
+        key: str,
+        stage: str,
+        priority: RequestPriority,
+        kwargs: dict,
+    ) -> ChatResult:
+        if self.cache is not None and (cached := self.cache.get(key)) is not None:
+            return cached
+
+        scheduler = self.scheduler()
+
+        def call() -> Awaitable[ChatResult]:
+            return self._acall(model, messages, stop, key, kwargs)
+
+        for attempt in range(self.max_rate_limit_retries + 1):
+            try:
+                if scheduler is None:
+                    result = await self._hedged(stage, call)
+                else:
+                    async with scheduler.slot(priority):
+                        result = await self._hedged(stage, call)
+                break
+            except Exception as e:
+                await asyncio.sleep(self._backoff(attempt, e))
+
+        if self.cache is not None:
+            self.cache.put(key, result)
+        return result
+
+    def generate(
+        self, model: BaseChatModel, messages: list[BaseMessage], stop: list[str] | None = None, **kwargs: Any
+    ) -> ChatResult:
+        """Generate a response in the calling thread, only rate limited, see the class docstring."""
+        if self.dry_run:
+            return self._dry_run_result(model, messages, kwargs)
+
+        key = ResponseCache.key(model, messages, stop, kwargs)
+        if self.cache is not None and (cached := self.cache.get(key)) is not None:
+            return cached
+
+        for attempt in range(self.max_rate_limit_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire_sync()
+            try:
+                result = self._call(model, messages, stop, key, kwargs)
+                break
+            except Exception as e:
+                time.sleep(self._backoff(attempt, e))
+
+        if self.cache is not None:
+            self.cache.put(key, result)
+        return result
+
+
+class GatewayChatModel(BaseChatModel):
+    """Chat model that sends the requests of ``model`` through the ``LLMGateway``.
+
+    With a routing policy in use (see ``lairn.llm.routing``), a request may be sent to another
+    model than ``model`` depending on its stage, prompt size and whether it is a repair.
+    """
+
+    model: BaseChatModel
+    gateway: Any
+    _routed_models: dict[str, BaseChatModel] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.model._identifying_params
+
+    @property
+    def model_name(self) -> str | None:
+        return getattr(self.model, "model_name", None)
+
+    def _get_ls_params(self, stop: list[str] | None = None, **kwargs: Any):
+        return self.model._get_ls_params(stop=stop, **kwargs)
+
+    def _route(self, messages: list[BaseMessage], run_manager) -> tuple[BaseChatModel, str]:
+        """The model a request goes to and the stage of the request."""
+        metadata = run_manager.metadata if run_manager else {}
+        stage = metadata.get("stage", UNKNOWN_STAGE)
+        if routing.POLICY is None:
+            return self.model, stage
+
+        model_name = routing.POLICY.select(stage, _prompt_text(messages), bool(metadata.get("repair")))
+        if model_name is None or model_name == self.model_name:
+            return self.model, stage
+        if model_name not in self._routed_models:
+            # The copy shares client and settings with the model and only requests another model name
+            self._routed_models[model_name] = self.model.copy(update={"model_name": model_name})
+        logger.debug(f"Routing {stage} request to {model_name}")
+        return self._routed_models[model_name], stage
+
+    def _generate(
+        self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        model, _ = self._route(messages, run_manager)
+        return self.gateway.generate(model, messages, stop, **kwargs)
+
+    async def _agenerate(
+        self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any
+    ) -> ChatResult:
+        model, stage = self._route(messages, run_manager)
+        return await self.gateway.agenerate(model, messages, stop, stage=stage, **kwargs)
+
+
+GATEWAY = LLMGateway(
+    concurrency=config.LLM_CONCURRENCY,
+    rpm=config.LLM_RPM,
+    cache_dir=config.LLM_CACHE_DIR,
+    dry_run=config.LLM_DRY_RUN,
+    hedge_percentile=config.LLM_HEDGE_PERCENTILE,
+    hedge_budget=config.LLM_HEDGE_BUDGET,
+)
@@ -0,0 +1,24 @@
+from langchain_core.prompts import PromptTemplate
+
+from lairn.config import PROMPT_LAYOUT
+
+DEFAULT_LAYOUT = "default"
+PREFIX_STABLE_LAYOUT = "prefix_stable"
+
+
+def select_prompt(
+    default: PromptTemplate, prefix_stable: PromptTemplate, layout: str | None = None
+) -> PromptTemplate:
+    """Pick the template variant for the given prompt layout.
+
+    The prefix-stable variants put all static instructions and large shared context first and
+    the per-call variables last, so that fan-out requests share a byte-identical prompt prefix
+    that the provider can serve from its prompt cache.
+    """
+    layout = layout or PROMPT_LAYOUT
+    if layout == DEFAULT_LAYOUT:
+        return default
+    elif layout == PREFIX_STABLE_LAYOUT:
+        return prefix_stable
+    else:
+        raise ValueError(f"Unknown prompt layout: {layout}")
@@ -0,0 +1,199 @@
+import json
+import re
+from collections import Counter
+from typing import Any, Awaitable, Callable, Type
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableConfig
+from loguru import logger
+
+PT_REPAIR_STRUCTURED_OUTPUT = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # JSON output repair
+
+    A previous response was supposed to be a JSON object following the response format below, but it
+    failed validation. Fix only what the validation errors point to and keep everything else unchanged.
+    Respond with the corrected JSON object only.
+
+    ## Response format
+
+    {response_format}
+
+    |USER|
+
+    ## Validation errors
+
+    {errors}
+
+    ## Invalid response
+
+    {output}
+
+""",
+    input_variables=["response_format", "errors", "output"],
+)
+
+REPAIR_STATS = Counter()
+
+_CODE_FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA_PATTERN = re.compile(r",(\s*[}\]])")
+_OPENING_SMART_QUOTE_PATTERN = re.compile(r"([{\[,:]\s*)[“”„]")
+_CLOSING_SMART_QUOTE_PATTERN = re.compile(r"[“”](\s*[:,}\]])")
+
+
+class OutputRepairError(ValueError):
+    """Raised when a structured output could not be repaired.
+
+    ``data`` holds the decoded JSON of the last attempt if it was syntactically valid, so callers
+    can salvage the valid parts.
+    """
+
+    def __init__(self, message: str, data: Any | None = None):
+        super().__init__(message)
+        self.data = data
+
+
+def extract_json(text: str) -> str:
+    """Return the JSON object or list embedded in a response, dropping code fences and prose."""
+    fenced = _CODE_FENCE_PATTERN.search(text)
+    if fenced:
+        text = fenced.group(1)
+
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return text.strip()
+    start = min(starts)
+    end = max(text.rfind("}"), text.rfind("]"))
+    return text[start : end + 1] if end > start else text[start:]
+
+
+def remove_trailing_commas(text: str) -> str:
+    return _TRAILING_COMMA_PATTERN.sub(r"\1", text)
+
+
+def fix_quotes(text: str) -> str:
+    """Replace typographic quotes used as JSON string delimiters by plain double quotes.
+
+    Typographic quotes inside string values (common in German texts) are left untouched.
+    """
+    text = _OPENING_SMART_QUOTE_PATTERN.sub(r'\1"', text)
+    return _CLOSING_SMART_QUOTE_PATTERN.sub(r'"\1', text)
+
+
+LOCAL_FIXES = [extract_json, remove_trailing_commas, fix_quotes]
+
+
+def validate(schema: Type, data: Any):
+    """Validate decoded JSON against a pydantic v1 or v2 model."""
+    if hasattr(schema, "model_validate"):
+        return schema.model_validate(data)
+    return schema.parse_obj(data)
+
+
+class OutputRepairer:
+    """Parses structured model outputs and repairs them when they are malformed.
+
+    Repair escalates in three stages, each only if the previous one failed:
+
+      1. Local fixes: extract the JSON from the response, remove trailing commas and fix quotes.
+      2. Item regeneration: if the JSON is well-formed but fails validation, an optional
+         ``regenerate_items`` callback may rebuild only the failing parts (async only).
+      3. A short repair prompt with just the validation errors and the invalid output.
+    """
+
+    def __init__(
+        self,
+        model: BaseChatModel,
+        schema: Type,
+        response_format: str,
+        regenerate_items: Callable[[Any, Exception], Awaitable[Any | None]] | None = None,
+        max_llm_repairs: int = 1,
+    ):
+        self.model = model
+        self.schema = schema
+        self.response_format = response_format
+        self.regenerate_items = regenerate_items
+        self.max_llm_repairs = max_llm_repairs
+
+    def parse_locally(self, text: str) -> tuple[Any | None, Any | None, Exception | None]:
+        """Return ``(result, data, error)``: the validated result if any, the decoded JSON of the
+        most repaired variant, and the last error."""
+        data = None
+        error = None
+        for num_fixes in range(len(LOCAL_FIXES) + 1):
+            candidate = text
+            for fix in LOCAL_FIXES[:num_fixes]:
+                candidate = fix(candidate)
+            try:
+                data = json.loads(candidate, strict=False)
+                result = validate(self.schema, data)
+            except Exception as e:
+                error = e
+                continue
+
+            if num_fixes > 0:
+                REPAIR_STATS["local"] += 1
+                logger.info(f"Repaired {self.schema.__name__} output locally")
+            return result, data, None
+        return None, data, error
+
+    @staticmethod
+    def _repair_config(config: RunnableConfig | None) -> RunnableConfig:
+        """Keep the caller's stage attribution and mark the call as a repair for telemetry."""
+        config = dict(config or {})
+        config["metadata"] = {**config.get("metadata", {}), "repair": True}
+        return config
+
+    def _repair_prompt(self, text: str, error: Exception) -> str:
+        return PT_REPAIR_STRUCTURED_OUTPUT.format(
+            response_format=self.response_format, errors=str(error), output=text
+        )
+
+    def parse(self, message: BaseMessage, config: RunnableConfig | None = None) -> Any:
+        text = message.content
+        for attempt in range(self.max_llm_repairs + 1):
+            result, data, error = self.parse_locally(text)
+            if result is not None:
+                return result
+            if attempt == self.max_llm_repairs:
+                break
+
+            logger.warning(f"Requesting repair of invalid {self.schema.__name__} output: {error}")
+            REPAIR_STATS["llm"] += 1
+            text = self.model.invoke(
+                self._repair_prompt(text, error), config=self._repair_config(config)
+            ).content
+        raise OutputRepairError(f"Could not repair {self.schema.__name__} output: {error}", data)
+
+    async def aparse(self, message: BaseMessage, config: RunnableConfig | None = None) -> Any:
+        text = message.content
+        for attempt in range(self.max_llm_repairs + 1):
+            result, data, error = self.parse_locally(text)
+            if result is not None:
+                return result
+
+            if data is not None and self.regenerate_items is not None and attempt == 0:
+                logger.warning(f"Regenerating failing items of {self.schema.__name__} output: {error}")
+                REPAIR_STATS["items"] += 1
+                try:
+                    result = await self.regenerate_items(data, error)
+                except Exception as e:
+                    logger.warning(f"Item regeneration failed: {e}")
+                    result = None
+                if result is not None:
+                    return result
+
+            if attempt == self.max_llm_repairs:
+                break
+
+            logger.warning(f"Requesting repair of invalid {self.schema.__name__} output: {error}")
+            REPAIR_STATS["llm"] += 1
+            response = await self.model.ainvoke(
+                self._repair_prompt(text, error), config=self._repair_config(config)
+            )
+            text = response.content
+        raise OutputRepairError(f"Could not repair {self.schema.__name__} output: {error}", data)
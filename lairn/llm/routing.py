@@ -0,0 +1,102 @@
+"""Size-aware routing of LLM requests to models per pipeline stage.
+
+A ``RoutingPolicy`` maps pipeline stages to routes. A route lists tiers of a prompt token limit
+and a model: a request goes to the model of the first tier its prompt fits into, and larger
+prompts go to the model the caller created (``LLM`` by default). Repair requests, which are only
+sent after a response failed validation (see ``OutputRepairer``), go to the ``escalate`` model of
+the route, so a stronger model is only paid for when the routed one actually failed. Requests of
+stages without a route are not routed.
+
+A policy is a JSON object of stage names to routes, e.g.::
+
+    {"parse": {"tiers": [[1500, "gpt-4.1-nano"]], "escalate": "gpt-4.1"}}
+
+Enable it with ``--routing`` of the CLI or with ``LLM_ROUTING``, either ``default`` for
+``DEFAULT_ROUTES`` or the path of a JSON file.
+"""
+
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from lairn import config
+from lairn.common import count_tokens
+
+# Small prompts of the routine stages go to the cheapest model, failed validations to a strong one.
+# Structure analysis and overview see whole curricula and always use the caller's model.
+DEFAULT_ROUTES = {
+    "page_summary": {"tiers": [[1500, "gpt-4.1-nano"]]},
+    "structure_analysis": {"escalate": "gpt-4.1"},
+    "parse": {"tiers": [[1500, "gpt-4.1-nano"]], "escalate": "gpt-4.1"},
+    "examples": {"tiers": [[1000, "gpt-4.1-nano"]], "escalate": "gpt-4.1"},
+    "quiz": {"escalate": "gpt-4.1"},
+    "week_listing": {"tiers": [[2500, "gpt-4.1-nano"]], "escalate": "gpt-4.1"},
+    "week_summary": {"tiers": [[2000, "gpt-4.1-nano"]]},
+}
+
+
+@dataclass(frozen=True)
+class Route:
+    # (maximum prompt tokens, model) by increasing limit
+    tiers: tuple[tuple[int, str], ...] = ()
+    escalate: str | None = None
+
+    def select(self, prompt: str, repair: bool = False) -> str | None:
+        """Model for a request with ``prompt``, None for the caller's model."""
+        if repair:
+            return self.escalate
+        if not self.tiers:
+            return None
+        prompt_tokens = count_tokens(prompt)
+        for max_tokens, model_name in self.tiers:
+            if prompt_tokens <= max_tokens:
+                return model_name
+        return None
+
+
+class RoutingPolicy:
+    def __init__(self, routes: dict[str, Route]):
+        self.routes = routes
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RoutingPolicy":
+        return cls(
+            {
+                stage: Route(
+                    tiers=tuple(
+                        sorted((int(limit), model_name) for limit, model_name in route.get("tiers", []))
+                    ),
+                    escalate=route.get("escalate"),
+                )
+                for stage, route in data.items()
+            }
+        )
+
+    @classmethod
+    def load(cls, spec: str) -> "RoutingPolicy":
+        """``default`` for ``DEFAULT_ROUTES``, otherwise the path of a JSON policy."""
+        if spec == "default":
+            return cls.from_dict(DEFAULT_ROUTES)
+        return cls.from_dict(json.loads(Path(spec).read_text()))
+
+    def select(self, stage: str, prompt: str, repair: bool = False) -> str | None:
+        """Model for a request of ``stage``, None for the caller's model."""
+        route = self.routes.get(stage)
+        return route.select(prompt, repair) if route is not None else None
+
+    def describe(self, stages: list[str]) -> dict:
+        """Routes of ``stages`` as JSON, e.g. for fingerprints of outputs that depend on them."""
+        return {stage: asdict(self.routes[stage]) for stage in stages if stage in self.routes}
+
+
+def _policy(spec: str | None) -> RoutingPolicy | None:
+    return RoutingPolicy.load(spec) if spec and spec != "off" else None
+
+
+POLICY: RoutingPolicy | None = _policy(config.LLM_ROUTING)
+
+
+def use_routing(spec: str | None):
+    """Route requests with the policy ``spec`` from now on, ``None`` or ``off`` turns routing off."""
+    global POLICY
+    POLICY = _policy(spec)
@@ -0,0 +1,68 @@
+from typing import Any, Awaitable, Callable, Type
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_function
+
+from lairn.config import NATIVE_STRUCTURED_OUTPUT
+from lairn.llm.repair import OutputRepairer
+
+NATIVE_RESPONSE_FORMAT = "Respond with a JSON object that follows the response schema of this request."
+
+
+def _forbid_additional_properties(schema: dict) -> dict:
+    """Strict mode requires every object to list all properties as required and allow no others."""
+    if schema.get("type") == "object" and "properties" in schema:
+        schema["additionalProperties"] = False
+        schema["required"] = list(schema["properties"])
+    for value in schema.values():
+        if isinstance(value, dict):
+            _forbid_additional_properties(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    _forbid_additional_properties(item)
+    return schema
+
+
+def json_schema_response_format(schema: Type) -> dict:
+    """Build an OpenAI ``response_format`` that enforces the JSON schema of a pydantic model."""
+    function = convert_to_openai_function(schema)
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": function["name"],
+            "schema": _forbid_additional_properties(function["parameters"]),
+            "strict": True,
+        },
+    }
+
+
+def structured_chain(
+    prompt: PromptTemplate,
+    model: BaseChatModel,
+    schema: Type,
+    native: bool | None = None,
+    regenerate_items: Callable[[Any, Exception], Awaitable[Any | None]] | None = None,
+) -> tuple[Runnable, str]:
+    """Build a chain returning an instance of ``schema`` and the text for the ``{response_format}``
+    prompt variable.
+
+    By default the JSON schema is dumped into the prompt via the parser's format instructions.
+    With native structured output, the schema is passed to the API as ``response_format`` instead
+    and the prompt only carries a one-line instruction. In both modes, invalid outputs go through
+    the ``OutputRepairer`` before the chain fails.
+    """
+    if native is None:
+        native = NATIVE_STRUCTURED_OUTPUT
+
+    if native:
+        model = model.bind(response_format=json_schema_response_format(schema))
+        response_format = NATIVE_RESPONSE_FORMAT
+    else:
+        response_format = PydanticOutputParser(pydantic_object=schema).get_format_instructions()
+
+    repairer = OutputRepairer(model, schema, response_format, regenerate_items=regenerate_items)
+    return prompt | model | RunnableLambda(repairer.parse, afunc=repairer.aparse), response_format
@@ -0,0 +1,346 @@
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableConfig
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from lairn.config import LLM_TELEMETRY_DIR
+from lairn.llm.usage import extract_token_usage
+
+UNKNOWN_STAGE = "unknown"
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+}
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def stage_config(stage: str, **metadata) -> RunnableConfig:
+    """Runnable config that attributes all LLM calls of a chain invocation to a pipeline stage."""
+    return {"run_name": stage, "metadata": {"stage": stage, **metadata}}
+
+
+def model_prices(model_name: str | None) -> tuple[float, float, float] | None:
+    """Return the price tuple of the longest matching model name prefix (e.g. dated snapshots)."""
+    if model_name is None:
+        return None
+    matches = [name for name in MODEL_PRICES if model_name.startswith(name)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model_name: str | None, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0):
+    prices = model_prices(model_name)
+    if prices is None:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    return (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * output_price
+    ) / 1e6
+
+
+class LLMCallRecord(BaseModel):
+    stage: str = Field(description="The pipeline stage the call belongs to")
+    model_name: str | None = Field(description="The model that served the call")
+    started_at: float = Field(description="Unix timestamp of the start of the call")
+    latency: float = Field(description="Wall time of the call in seconds")
+    prompt_tokens: int = Field(description="The number of input tokens")
+    completion_tokens: int = Field(description="The number of output tokens")
+    cached_tokens: int = Field(description="The number of input tokens served from the prompt cache")
+    cost: float = Field(description="Estimated cost of the call in USD")
+    repair: bool = Field(description="Whether this call repaired the output of a previous call")
+    error: str | None = Field(description="The error raised by the call, if any")
+
+
+@dataclass
+class _StageStats:
+    """Running totals and latency histogram of the calls of a stage."""
+
+    calls: int = 0
+    errors: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    # Calls per latency bucket, the last one counts the calls slower than all buckets
+    latency_buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    prompt_cache_hits: int = 0
+    cost: float = 0.0
+
+    def add(self, record: LLMCallRecord):
+        self.calls += 1
+        self.errors += record.error is not None
+        self.total_latency += record.latency
+        self.max_latency = max(self.max_latency, record.latency)
+        self.latency_buckets[bisect_left(LATENCY_BUCKETS, record.latency)] += 1
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.cached_tokens += record.cached_tokens
+        self.prompt_cache_hits += record.cached_tokens > 0
+        self.cost += record.cost
+
+    def latency_percentile(self, percentile: float) -> float:
+        """Latency percentile interpolated within its histogram bucket, like Prometheus does."""
+        rank = self.calls * percentile / 100
+        below, lower = 0, 0.0
+        for upper, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+            if count and below + count >= rank:
+                return min(lower + (upper - lower) * (rank - below) / count, self.max_latency)
+            below, lower = below + count, upper
+        return self.max_latency
+
+
+class LLMTelemetry(BaseCallbackHandler):
+    """Records latency, tokens, cost, retries and cache hits of every chat model call.
+
+    Calls are attributed to a stage via the ``stage`` metadata of the runnable config (see
+    ``stage_config``). Only running totals and latency histograms per stage are kept, so memory
+    and the cost of a call stay constant in long-running processes. If ``output_dir`` is set,
+    every call is appended to ``llm_calls.jsonl`` and the Prometheus textfile ``lairn_llm.prom`` is
+    rewritten, so a textfile collector always sees current values. With ``keep_records``, the calls
+    are also kept in ``records``, e.g. for benchmarks.
+    """
+
+    run_inline = True
+
+    def __init__(self, output_dir: str | Path | None = None, keep_records: bool = False):
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.keep_records = keep_records
+        self.records: list[LLMCallRecord] = []
+        self._stages: dict[str, _StageStats] = defaultdict(_StageStats)
+        self.retries = defaultdict(int)
+        self.response_cache_hits = defaultdict(int)
+        self.coalesced_calls = defaultdict(int)
+        self.hedged_requests = defaultdict(int)
+        self._running: dict[UUID, dict] = {}
+
+    def _start(self, run_id: UUID, serialized: dict, metadata: dict | None, invocation_params: dict | None):
+        metadata = metadata or {}
+        invocation_params = invocation_params or {}
+        self._running[run_id] = {
+            "stage": metadata.get("stage", UNKNOWN_STAGE),
+            "model_name": metadata.get("ls_model_name") or invocation_params.get("model_name"),
+            "repair": bool(metadata.get("repair", False)),
+            "started_at": time.time(),
+            "start": time.perf_counter(),
+        }
+
+    def on_chat_model_start(
+        self, serialized: dict, messages: list, *, run_id: UUID, metadata: dict | None = None, **kwargs: Any
+    ) -> None:
+        self._start(run_id, serialized, metadata, kwargs.get("invocation_params"))
+
+    def on_llm_start(
+        self,
+        serialized: dict,
+        prompts: list[str],
+        *,
+        run_id: UUID,
+        metadata: dict | None = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, serialized, metadata, kwargs.get("invocation_params"))
+
+    def _finish(self, run_id: UUID, usage=None, error: BaseException | None = None):
+        run = self._running.pop(run_id, None)
+        if run is None:
+            return
+
+        model_name = (usage.model_name if usage else None) or run["model_name"]
+        prompt_tokens = usage.prompt_tokens if usage else 0
+        completion_tokens = usage.completion_tokens if usage else 0
+        cached_tokens = usage.cached_tokens if usage else 0
+        record = LLMCallRecord(
+            stage=run["stage"],
+            model_name=model_name,
+            started_at=run["started_at"],
+            latency=time.perf_counter() - run["start"],
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            cost=estimate_cost(model_name, prompt_tokens, completion_tokens, cached_tokens),
+            repair=run["repair"],
+            error=repr(error) if error is not None else None,
+        )
+        self._stages[record.stage].add(record)
+        if self.keep_records:
+            self.records.append(record)
+        if record.repair:
+            self.retries[record.stage] += 1
+        self._export(record)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        llm_output = response.llm_output or {}
+        if llm_output.get("response_cache_hit") or llm_output.get("coalesced"):
+            run = self._running.pop(run_id, None)
+            if run is not None and llm_output.get("coalesced"):
+                self.record_coalesced_call(run["stage"])
+            elif run is not None:
+                self.record_response_cache_hit(run["stage"])
+            return
+        self._finish(run_id, usage=extract_token_usage(response))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error=error)
+
+    def record_retry(self, stage: str):
+        """Count a retry that is not visible as a repair call, e.g. a rate limit back-off."""
+        self.retries[stage] += 1
+
+    def record_response_cache_hit(self, stage: str):
+        """Count a call that was answered from a local response cache without reaching the API."""
+        self.response_cache_hits[stage] += 1
+
+    def record_coalesced_call(self, stage: str):
+        """Count a call that waited for an identical request in flight instead of sending its own."""
+        self.coalesced_calls[stage] += 1
+
+    def record_hedged_request(self, stage: str):
+        """Count a duplicate request sent because the original one was slow, its tokens are not recorded."""
+        self.hedged_requests[stage] += 1
+
+    def reset(self):
+        self.records = []
+        self._stages.clear()
+        self.retries.clear()
+        self.response_cache_hits.clear()
+        self.coalesced_calls.clear()
+        self.hedged_requests.clear()
+
+    def stage_summary(self) -> dict[str, dict]:
+        """Aggregate the recorded calls per stage."""
+        summary = {}
+        stages = (
+            set(self._stages)
+            | set(self.retries)
+            | set(self.response_cache_hits)
+            | set(self.coalesced_calls)
+            | set(self.hedged_requests)
+        )
+        for stage in sorted(stages):
+            stats = self._stages.get(stage, _StageStats())
+            summary[stage] = {
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "retries": self.retries.get(stage, 0),
+                "total_latency": stats.total_latency,
+                "p50_latency": stats.latency_percentile(50),
+                "p95_latency": stats.latency_percentile(95),
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens,
+                "cached_tokens": stats.cached_tokens,
+                "prompt_cache_hits": stats.prompt_cache_hits,
+                "prompt_cache_hit_rate": (
+                    stats.cached_tokens / stats.prompt_tokens if stats.prompt_tokens else 0.0
+                ),
+                "response_cache_hits": self.response_cache_hits.get(stage, 0),
+                "coalesced_calls": self.coalesced_calls.get(stage, 0),
+                "hedged_requests": self.hedged_requests.get(stage, 0),
+                "cost": stats.cost,
+            }
+        return summary
+
+    def summary(self) -> str:
+        """Table of the stage summary.
+
+        ``hits`` are calls answered from the local response cache, ``dedup`` are calls that shared
+        the response of an identical request in flight. Neither reached the API. ``hedge`` are
+        duplicate requests sent for slow calls, their tokens and cost are not included.
+        """
+        lines = [
+            f"{'stage':<20} {'calls':>6} {'err':>4} {'retry':>5} {'total s':>8} {'p50 s':>6} {'p95 s':>6} "
+            f"{'prompt':>8} {'cached':>8} {'compl':>7} {'hits':>5} {'dedup':>5} {'hedge':>5} {'cost $':>8}"
+        ]
+        for stage, s in self.stage_summary().items():
+            lines.append(
+                f"{stage:<20} {s['calls']:>6} {s['errors']:>4} {s['retries']:>5} {s['total_latency']:>8.1f} "
+                f"{s['p50_latency']:>6.1f} {s['p95_latency']:>6.1f} {s['prompt_tokens']:>8} "
+                f"{s['cached_tokens']:>8} {s['completion_tokens']:>7} {s['response_cache_hits']:>5} {s['coalesced_calls']:>5} "
+                f"{s['hedged_requests']:>5} "
+                f"{s['cost']:>8.4f}"
+            )
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP lairn_llm_latency_seconds Latency of LLM calls per pipeline stage.",
+            "# TYPE lairn_llm_latency_seconds histogram",
+        ]
+        for stage, stats in sorted(self._stages.items()):
+            count = 0
+            for bucket, bucket_count in zip(LATENCY_BUCKETS, stats.latency_buckets):
+                count += bucket_count
+                lines.append(f'lairn_llm_latency_seconds_bucket{{stage="{stage}",le="{bucket}"}} {count}')
+            lines.append(f'lairn_llm_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats.calls}')
+            lines.append(f'lairn_llm_latency_seconds_sum{{stage="{stage}"}} {stats.total_latency}')
+            lines.append(f'lairn_llm_latency_seconds_count{{stage="{stage}"}} {stats.calls}')
+
+        counters = [
+            ("lairn_llm_calls_total", "LLM calls per stage.", "calls"),
+            ("lairn_llm_errors_total", "Failed LLM calls per stage.", "errors"),
+            ("lairn_llm_retries_total", "Repair calls and retries per stage.", "retries"),
+            ("lairn_llm_prompt_tokens_total", "Prompt tokens per stage.", "prompt_tokens"),
+            ("lairn_llm_completion_tokens_total", "Completion tokens per stage.", "completion_tokens"),
+            ("lairn_llm_cached_tokens_total", "Prompt tokens served from the prompt cache.", "cached_tokens"),
+            ("lairn_llm_prompt_cache_hits_total", "Calls with cached prompt tokens.", "prompt_cache_hits"),
+            (
+                "lairn_llm_response_cache_hits_total",
+                "Calls answered by the response cache.",
+                "response_cache_hits",
+            ),
+            (
+                "lairn_llm_coalesced_calls_total",
+                "Calls that shared the response of an identical request in flight.",
+                "coalesced_calls",
+            ),
+            (
+                "lairn_llm_hedged_requests_total",
+                "Duplicate requests sent for calls slower than the hedging percentile.",
+                "hedged_requests",
+            ),
+            ("lairn_llm_cost_usd_total", "Estimated cost in USD per stage.", "cost"),
+        ]
+        summary = self.stage_summary()
+        for name, help_text, key in counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for stage, s in summary.items():
+                lines.append(f'{name}{{stage="{stage}"}} {s[key]}')
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path: str | Path):
+        path = Path(path)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def _export(self, record: LLMCallRecord):
+        if self.output_dir is None:
+            return
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.output_dir / "llm_calls.jsonl", "a") as f:
+                f.write(record.model_dump_json() + "\n")
+            self.export_prometheus(self.output_dir / "lairn_llm.prom")
+        except OSError:
+            logger.exception("Failed to export LLM telemetry")
+
+
+TELEMETRY = LLMTelemetry(LLM_TELEMETRY_DIR)
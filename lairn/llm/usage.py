@@ -0,0 +1,25 @@
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel, Field
+
+
+class TokenUsage(BaseModel):
+    model_name: str | None = Field(description="The model that served the request")
+    prompt_tokens: int = Field(description="The number of input tokens")
+    completion_tokens: int = Field(description="The number of output tokens")
+    cached_tokens: int = Field(
+        description="The number of input tokens served from the provider's prompt cache"
+    )
+
+
+def extract_token_usage(response: LLMResult) -> TokenUsage:
+    """Read token counts, including cached prompt tokens, from an OpenAI chat result."""
+    llm_output = response.llm_output or {}
+    token_usage = llm_output.get("token_usage") or {}
+    prompt_tokens_details = token_usage.get("prompt_tokens_details") or {}
+
+    return TokenUsage(
+        model_name=llm_output.get("model_name"),
+        prompt_tokens=token_usage.get("prompt_tokens", 0),
+        completion_tokens=token_usage.get("completion_tokens", 0),
+        cached_tokens=prompt_tokens_details.get("cached_tokens", 0) or 0,
+    )
@@ -0,0 +1,200 @@
+import cProfile
+import io
+import pstats
+import runpy
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+from lairn.llm.telemetry import TELEMETRY
+from lairn.tracing import Span, SpanListener, Tracer, disable_tracing, enable_tracing
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+
+
+def resolve_script(script: str) -> Path:
+    """Resolve a script given by name (``summarize_week``) or path."""
+    path = Path(script)
+    if path.is_file():
+        return path
+    path = SCRIPTS_DIR / f"{script.removesuffix('.py')}.py"
+    if not path.is_file():
+        available = ", ".join(sorted(p.stem for p in SCRIPTS_DIR.glob("*.py")))
+        raise FileNotFoundError(f"Unknown script {script}, available scripts: {available}")
+    return path
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+OUTSIDE_STAGES = "<outside stages>"
+
+
+class StageProfiler(SpanListener):
+    """Profiles every stage separately and measures its CPU time and memory.
+
+    One ``cProfile.Profile`` per span name is switched on while the span is the innermost open
+    span, so hot spots are attributed to the innermost stage. Overlapping async stages of one
+    thread are attributed to the stage entered last. Allocations are snapshot whenever a stage
+    ends at a new memory high-water mark.
+    """
+
+    def __init__(self):
+        self.profiles: dict[str, cProfile.Profile] = defaultdict(cProfile.Profile)
+        self.cpu_time: dict[str, float] = defaultdict(float)
+        self.memory_growth: dict[str, int] = defaultdict(int)
+        self.high_water_mark = 0
+        self.snapshot: tracemalloc.Snapshot | None = None
+        self._active = [OUTSIDE_STAGES]
+        self._started: dict[int, tuple[float, int]] = {}
+
+    def enable(self):
+        self.profiles[self._active[-1]].enable()
+
+    def disable(self):
+        self.profiles[self._active[-1]].disable()
+
+    def on_span_start(self, span: Span):
+        self.disable()
+        self._active.append(span.name)
+        self.enable()
+        self._started[span.span_id] = (time.thread_time(), tracemalloc.get_traced_memory()[0])
+
+    def on_span_end(self, span: Span):
+        cpu_start, memory_start = self._started.pop(span.span_id)
+        memory = tracemalloc.get_traced_memory()[0]
+        self.cpu_time[span.name] += time.thread_time() - cpu_start
+        self.memory_growth[span.name] = max(self.memory_growth[span.name], memory - memory_start)
+
+        self.disable()
+        # Async spans do not necessarily end in reverse order of their start
+        self._active.pop(len(self._active) - 1 - self._active[::-1].index(span.name))
+        if memory > self.high_water_mark:
+            self.high_water_mark = memory
+            self.snapshot = tracemalloc.take_snapshot()
+        self.enable()
+
+    def stats(self, name: str | None = None) -> pstats.Stats | None:
+        """Profile of one stage, or of the whole run if ``name`` is None."""
+        profiles = [self.profiles[name]] if name is not None else list(self.profiles.values())
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        return stats
+
+
+@dataclass
+class ProfileResult:
+    tracer: Tracer
+    stages: StageProfiler
+    peak_memory: int
+
+
+class PipelineProfiler:
+    """Runs a script under cProfile, tracemalloc and span tracing, and writes a report per stage.
+
+    Stages are the spans recorded by ``lairn.tracing``. For every stage, the report lists wall and
+    CPU time, memory growth and the CPU hot spots spent in the stage itself, outside nested stages.
+    """
+
+    def __init__(self, top: int = 15, trace_frames: int = 10):
+        self.top = top
+        self.trace_frames = trace_frames
+
+    def run(self, script: str | Path, args: list[str] | None = None) -> ProfileResult:
+        path = resolve_script(str(script))
+        tracer = enable_tracing()
+        stages = StageProfiler()
+        tracer.listeners.append(stages)
+        TELEMETRY.reset()
+
+        argv = sys.argv
+        sys.argv = [str(path), *(args or [])]
+        tracemalloc.start(self.trace_frames)
+        stages.enable()
+        try:
+            runpy.run_path(str(path), run_name="__main__")
+        except SystemExit:
+            pass
+        except Exception:
+            logger.exception(f"{path.name} failed, reporting the partial run")
+        finally:
+            stages.disable()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            sys.argv = argv
+            disable_tracing()
+
+        return ProfileResult(tracer, stages, peak_memory)
+
+    def _hot_spots(self, stats: pstats.Stats) -> str:
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats("tottime").print_stats(self.top)
+        return output.getvalue().strip()
+
+    def report(self, result: ProfileResult) -> str:
+        stages = result.stages
+        lines = [f"Peak traced memory: {_format_size(result.peak_memory)}", "", "## Stages", ""]
+        lines.append(f"{'stage':<60} {'calls':>6} {'wall s':>8} {'cpu s':>8} {'mem growth':>11}")
+        span_stats = result.tracer.summary()["spans"]
+        for name, s in span_stats.items():
+            lines.append(
+                f"{name:<60} {s['count']:>6} {s['total_time']:>8.3f} {stages.cpu_time[name]:>8.3f} "
+                f"{_format_size(stages.memory_growth[name]):>11}"
+            )
+
+        for name in [*span_stats, OUTSIDE_STAGES]:
+            stats = stages.stats(name)
+            if stats is not None:
+                lines += ["", f"## CPU hot spots in {name}", "", self._hot_spots(stats)]
+
+        lines += [
+            "",
+            f"## Allocation sites at the memory high-water mark ({_format_size(stages.high_water_mark)})",
+            "",
+        ]
+        if stages.snapshot is not None:
+            for stat in stages.snapshot.statistics("lineno")[: self.top]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"{_format_size(stat.size):>11} {stat.count:>8}  {frame.filename}:{frame.lineno}"
+                )
+
+        lines += ["", "## LLM calls", "", TELEMETRY.summary()]
+        return "\n".join(lines) + "\n"
+
+    def profile(self, script: str | Path, output_dir: str | Path, args: list[str] | None = None) -> Path:
+        """Profile a script and write ``report.txt``, ``profile.pstats`` and ``trace.json`` to ``output_dir``.
+
+        ``profile.pstats`` is left out if no stage recorded a profile, e.g. when the script failed early.
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        result = self.run(script, args)
+        stats = result.stages.stats()
+        if stats is not None:
+            stats.dump_stats(output_dir / "profile.pstats")
+        else:
+            logger.warning("No stage recorded a profile, not writing profile.pstats")
+        result.tracer.export_chrome_trace(output_dir / "trace.json")
+        report_path = output_dir / "report.txt"
+        report_path.write_text(self.report(result))
+        return report_path
@@ -0,0 +1,80 @@
+"""Deterministic compaction of a week's logs and Sofatutor activities before they enter a prompt.
+
+``str_fmt`` renders every record as its own block: each log message gets a header and each
+Sofatutor activity its properties, categorization and full description, even if the same video
+was watched and tested several times. The compact rendering groups logs by day under one header
+with one line per message, and groups activities by subject and title with their dates, activity
+types and scores aggregated and the description given once, without the boilerplate of the
+Sofatutor texts. The same records always give the same text.
+"""
+
+import re
+from collections import defaultdict
+from itertools import groupby
+
+from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity
+from lairn.learn_log import LearnLogMessage
+
+# Sentences of the Sofatutor descriptions that tell nothing about the content
+BOILERPLATE = [
+    re.compile(r"\s*Teste dein Wissen.*?(?:[.!?]|$)"),
+    re.compile(r"\s*Viel Spaß.*?(?:[.!?]|$)"),
+]
+
+
+def _clean_description(activity: SofatutorLearningActivity) -> str:
+    description = activity.description or ""
+    for pattern in BOILERPLATE:
+        description = pattern.sub("", description)
+    # "In diesem Video lernst du <title>." repeats the title
+    description = re.sub(rf"^In diesem Video lernst du {re.escape(activity.title)}\.\s*", "", description)
+    return description.strip()
+
+
+def _compact_logs(logs: list[LearnLogMessage]) -> str:
+    blocks = []
+    logs = sorted(logs, key=lambda log: log.timestamp)
+    for day, day_logs in groupby(logs, key=lambda log: log.timestamp.date()):
+        lines = [f"### Logs of {day.isoformat()}"]
+        for log in day_logs:
+            text = "\n    ".join(line for line in log.text.strip().splitlines() if line.strip())
+            lines.append(f"  - {log.timestamp:%H:%M} {text}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def _compact_activities(activities: list[SofatutorLearningActivity]) -> str:
+    groups: dict[tuple[str, str], list[SofatutorLearningActivity]] = defaultdict(list)
+    for activity in sorted(activities, key=lambda activity: (activity.date_ref, activity.activity_type)):
+        groups[(activity.subject_label, activity.title)].append(activity)
+
+    blocks = []
+    for (subject, title), group in sorted(groups.items(), key=lambda item: (item[1][0].date_ref, item[0])):
+        types = defaultdict(int)
+        for activity in group:
+            types[activity.activity_type] += 1
+        lines = [
+            f"### Sofatutor: {subject} - {title}",
+            f"  - Dates: {', '.join(sorted({activity.date_ref.isoformat() for activity in group}))}",
+            f"  - Activities: {', '.join(f'{count}x {kind}' for kind, count in types.items())}",
+        ]
+        scored = [activity for activity in group if activity.total_tasks]
+        if scored:
+            completed = sum(activity.tasks_completed for activity in scored)
+            total = sum(activity.total_tasks for activity in scored)
+            scores = ", ".join(f"{activity.tasks_completed}/{activity.total_tasks}" for activity in scored)
+            lines.append(f"  - Score: {completed}/{total} tasks ({scores})")
+        first = group[0]
+        if first.topic_chain:
+            lines.append(f"  - Topic: {first.topic_chain}")
+        if description := _clean_description(first):
+            lines.append(f"  - Description: {description}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def compact_records(records: list[LearnLogMessage | SofatutorLearningActivity]) -> str:
+    """Compact rendering of the logs and activities of a week, for the week listing prompt."""
+    logs = [record for record in records if isinstance(record, LearnLogMessage)]
+    activities = [record for record in records if isinstance(record, SofatutorLearningActivity)]
+    return "\n\n".join(part for part in (_compact_logs(logs), _compact_activities(activities)) if part) + "\n"
@@ -0,0 +1,342 @@
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from hashlib import sha256
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from lairn.curriculum.models import Curriculum
+from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity
+from lairn.learn_log import LearnLogMessage
+from lairn.tracing import traced
+
+TOKEN_PATTERN = re.compile(r"[a-zäöüß]{4,}")
+STEM_LENGTH = 7
+
+STOPWORDS = {
+    "auch",
+    "beim",
+    "dabei",
+    "damit",
+    "dann",
+    "dass",
+    "dein",
+    "deine",
+    "diese",
+    "diesem",
+    "dieser",
+    "eine",
+    "einem",
+    "einen",
+    "einer",
+    "für",
+    "heute",
+    "können",
+    "nach",
+    "oder",
+    "sich",
+    "sind",
+    "über",
+    "und",
+    "video",
+    "werden",
+    "wird",
+    "with",
+    "zwei",
+}
+
+
+def tokenize(text: str | None) -> set[str]:
+    """Lower-case word stems of a text, used to match activities against learning targets."""
+    if not text:
+        return set()
+    return {token[:STEM_LENGTH] for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS}
+
+
+def week_label(d: date) -> str:
+    year, week, _ = d.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def log_identifier(log: LearnLogMessage) -> str:
+    # Edits keep the user and timestamp of a message, so an edited log replaces its old version
+    return f"log_{log.user}_{log.timestamp.isoformat()}"
+
+
+def activity_identifier(activity: SofatutorLearningActivity) -> str:
+    return f"sofa_{activity.default_file_name}"
+
+
+def _content_hash(record: LearnLogMessage | SofatutorLearningActivity) -> str:
+    return sha256(record.model_dump_json().encode()).hexdigest()[:16]
+
+
+def _activity_text(activity: SofatutorLearningActivity) -> str:
+    return " ".join(filter(None, [activity.title, activity.topic_chain, activity.description]))
+
+
+def _curricula_fingerprint(curricula: dict[str, Curriculum]) -> str:
+    content = json.dumps([curricula[subject].model_dump() for subject in sorted(curricula)], sort_keys=True)
+    return sha256(content.encode()).hexdigest()
+
+
+@dataclass
+class CoverageMatrix:
+    """Learning target x ISO week matrix of activity counts and Sofatutor scores.
+
+    Rows are ``(subject, section, learning_target)`` tuples, columns are ISO week labels
+    (``"2024-W31"``). ``tasks_completed`` and ``total_tasks`` only receive contributions from
+    Sofatutor activities; log messages only increase ``counts``.
+
+    ``contributions`` maps the identifier of every ingested log and activity to its content hash
+    and the cell and tasks it added (row -1 if it matched no learning target), so that changed and
+    deleted records can be subtracted again.
+    """
+
+    targets: list[tuple[str, str, str]]
+    weeks: list[str] = field(default_factory=list)
+    counts: np.ndarray | None = None
+    tasks_completed: np.ndarray | None = None
+    total_tasks: np.ndarray | None = None
+    curricula_fingerprint: str = ""
+    contributions: dict[str, tuple[str, int, str, int, int]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        shape = (len(self.targets), len(self.weeks))
+        if self.counts is None:
+            self.counts = np.zeros(shape, dtype=np.int32)
+        if self.tasks_completed is None:
+            self.tasks_completed = np.zeros(shape, dtype=np.int32)
+        if self.total_tasks is None:
+            self.total_tasks = np.zeros(shape, dtype=np.int32)
+
+    @property
+    def scores(self) -> np.ndarray:
+        """Return ``tasks_completed / total_tasks`` per cell, NaN where no tasks were recorded."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.total_tasks > 0, self.tasks_completed / self.total_tasks, np.nan)
+
+    def week_indices(self, labels: list[str]) -> np.ndarray:
+        """Return column indices for the given week labels, appending columns for unknown weeks."""
+        new_weeks = sorted(set(labels) - set(self.weeks))
+        if new_weeks:
+            weeks = sorted(self.weeks + new_weeks)
+            old_columns = np.searchsorted(weeks, self.weeks)
+            self.counts = self._expand(self.counts, len(weeks), old_columns)
+            self.tasks_completed = self._expand(self.tasks_completed, len(weeks), old_columns)
+            self.total_tasks = self._expand(self.total_tasks, len(weeks), old_columns)
+            self.weeks = weeks
+        return np.searchsorted(self.weeks, labels)
+
+    def _expand(self, values: np.ndarray, num_weeks: int, old_columns: np.ndarray) -> np.ndarray:
+        expanded = np.zeros((len(self.targets), num_weeks), dtype=values.dtype)
+        expanded[:, old_columns] = values
+        return expanded
+
+    def to_frame(self, values: str = "counts") -> pd.DataFrame:
+        """Return one of ``counts``, ``tasks_completed``, ``total_tasks`` or ``scores`` as a DataFrame."""
+        index = pd.MultiIndex.from_tuples(self.targets, names=["subject", "section", "learning_target"])
+        return pd.DataFrame(getattr(self, values), index=index, columns=pd.Index(self.weeks, name="week"))
+
+    def to_long_frame(self) -> pd.DataFrame:
+        """Return all non-empty cells in long format, one row per (learning target, week)."""
+        rows, cols = np.nonzero(self.counts)
+        scores = self.scores
+        return pd.DataFrame(
+            {
+                "subject": [self.targets[r][0] for r in rows],
+                "section": [self.targets[r][1] for r in rows],
+                "learning_target": [self.targets[r][2] for r in rows],
+                "week": [self.weeks[c] for c in cols],
+                "count": self.counts[rows, cols],
+                "tasks_completed": self.tasks_completed[rows, cols],
+                "total_tasks": self.total_tasks[rows, cols],
+                "score": scores[rows, cols],
+            }
+        )
+
+    def save(self, path: Path):
+        if not isinstance(path, Path):
+            path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        np.savez_compressed(
+            path / "coverage.npz",
+            counts=self.counts,
+            tasks_completed=self.tasks_completed,
+            total_tasks=self.total_tasks,
+        )
+        with open(path / "coverage.json", "w") as f:
+            json.dump(
+                {
+                    "targets": self.targets,
+                    "weeks": self.weeks,
+                    "curricula_fingerprint": self.curricula_fingerprint,
+                    "contributions": self.contributions,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "CoverageMatrix":
+        if not isinstance(path, Path):
+            path = Path(path)
+
+        with open(path / "coverage.json", "r") as f:
+            meta = json.load(f)
+        arrays = np.load(path / "coverage.npz")
+        return cls(
+            targets=[tuple(target) for target in meta["targets"]],
+            weeks=meta["weeks"],
+            counts=arrays["counts"],
+            tasks_completed=arrays["tasks_completed"],
+            total_tasks=arrays["total_tasks"],
+            curricula_fingerprint=meta["curricula_fingerprint"],
+            contributions={
+                identifier: tuple(contribution) for identifier, contribution in meta["contributions"].items()
+            },
+        )
+
+
+class CoverageEngine:
+    """Maps logs and Sofatutor activities onto curriculum learning targets without calling the LLM.
+
+    Every learning target and every activity is turned into a binary bag of word stems over the
+    vocabulary of all learning targets. Activities are assigned to the learning target with the
+    highest cosine similarity (restricted to the activity's subject where known), if it exceeds
+    ``min_similarity``. Only items that are new or changed since the last update are processed, so
+    updating the persisted matrix with a new week only costs the work for that week.
+    """
+
+    def __init__(self, curricula: dict[str, Curriculum], min_similarity: float = 0.2):
+        self.curricula = curricula
+        self.min_similarity = min_similarity
+        self.fingerprint = _curricula_fingerprint(curricula)
+
+        self.targets = []
+        target_tokens = []
+        for subject in sorted(curricula):
+            for section in curricula[subject].sections:
+                for learning_target in section.learning_targets:
+                    self.targets.append((subject, section.title, learning_target))
+                    target_tokens.append(tokenize(f"{section.title} {learning_target}"))
+
+        self.vocabulary = {token: i for i, token in enumerate(sorted(set().union(*target_tokens)))}
+        self.target_vectors = self._vectorize(target_tokens)
+        self.target_subjects = np.array([subject for subject, _, _ in self.targets], dtype=object)
+
+    def _vectorize(self, token_sets: list[set[str]]) -> np.ndarray:
+        vectors = np.zeros((len(token_sets), len(self.vocabulary)), dtype=np.float32)
+        for row, tokens in enumerate(token_sets):
+            columns = [self.vocabulary[token] for token in tokens if token in self.vocabulary]
+            vectors[row, columns] = 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    @traced()
+    def assign(self, texts: list[str], subjects: list[str | None]) -> np.ndarray:
+        """Return the index of the best matching learning target per text, or -1 if none matches."""
+        if not texts or not self.targets:
+            return np.full(len(texts), -1, dtype=np.int64)
+
+        similarity = self._vectorize([tokenize(text) for text in texts]) @ self.target_vectors.T
+
+        item_subjects = np.array(subjects, dtype=object)
+        subject_known = np.array([subject in self.curricula for subject in subjects])
+        subject_mask = (item_subjects[:, None] == self.target_subjects[None, :]) | ~subject_known[:, None]
+        similarity = np.where(subject_mask, similarity, 0.0)
+
+        best = similarity.argmax(axis=1)
+        best_similarity = similarity[np.arange(len(texts)), best]
+        return np.where(best_similarity >= self.min_similarity, best, -1)
+
+    def new_matrix(self) -> CoverageMatrix:
+        return CoverageMatrix(targets=list(self.targets), curricula_fingerprint=self.fingerprint)
+
+    @traced()
+    def update(
+        self,
+        matrix: CoverageMatrix | None,
+        logs: list[LearnLogMessage],
+        activities: list[SofatutorLearningActivity],
+    ) -> CoverageMatrix:
+        """Bring ``matrix`` up to date with all current ``logs`` and ``activities`` and return it.
+
+        New records are added, the old contributions of changed records are replaced and those of
+        records that are no longer passed are removed. A matrix built from different curricula is
+        discarded and rebuilt from scratch.
+        """
+        if matrix is None or matrix.curricula_fingerprint != self.fingerprint:
+            matrix = self.new_matrix()
+
+        records = {log_identifier(log): log for log in logs}
+        records.update((activity_identifier(a), a) for a in activities)
+        hashes = {identifier: _content_hash(record) for identifier, record in records.items()}
+        removed = [identifier for identifier in matrix.contributions if identifier not in records]
+        changed = [
+            identifier
+            for identifier in records
+            if identifier in matrix.contributions
+            and matrix.contributions[identifier][0] != hashes[identifier]
+        ]
+        added = [identifier for identifier in records if identifier not in matrix.contributions]
+        if not removed and not changed and not added:
+            return matrix
+
+        logger.info(
+            f"Updating coverage matrix with {len(added)} new, {len(changed)} changed and {len(removed)} "
+            "removed logs and activities"
+        )
+        self._subtract(matrix, [matrix.contributions.pop(identifier) for identifier in removed + changed])
+
+        pending = added + changed
+        new_records = [records[identifier] for identifier in pending]
+        texts = [
+            record.text if isinstance(record, LearnLogMessage) else _activity_text(record)
+            for record in new_records
+        ]
+        subjects = [
+            None if isinstance(record, LearnLogMessage) else record.subject_label for record in new_records
+        ]
+        weeks = [
+            week_label(record.timestamp.date() if isinstance(record, LearnLogMessage) else record.date_ref)
+            for record in new_records
+        ]
+        is_activity = [not isinstance(record, LearnLogMessage) for record in new_records]
+        completed = np.array(
+            [record.tasks_completed if activity else 0 for record, activity in zip(new_records, is_activity)],
+            dtype=np.int32,
+        )
+        total = np.array(
+            [record.total_tasks if activity else 0 for record, activity in zip(new_records, is_activity)],
+            dtype=np.int32,
+        )
+
+        rows = self.assign(texts, subjects)
+        columns = matrix.week_indices(weeks)
+        matched = rows >= 0
+
+        np.add.at(matrix.counts, (rows[matched], columns[matched]), 1)
+        np.add.at(matrix.tasks_completed, (rows[matched], columns[matched]), completed[matched])
+        np.add.at(matrix.total_tasks, (rows[matched], columns[matched]), total[matched])
+
+        for identifier, row, week, record_completed, record_total in zip(
+            pending, rows.tolist(), weeks, completed.tolist(), total.tolist()
+        ):
+            matrix.contributions[identifier] = (hashes[identifier], row, week, record_completed, record_total)
+        return matrix
+
+    @staticmethod
+    def _subtract(matrix: CoverageMatrix, contributions: list[tuple[str, int, str, int, int]]):
+        contributions = [contribution for contribution in contributions if contribution[1] >= 0]
+        if not contributions:
+            return
+        _, rows, weeks, completed, total = (np.array(values) for values in zip(*contributions))
+        columns = matrix.week_indices(list(weeks))
+        np.subtract.at(matrix.counts, (rows, columns), 1)
+        np.subtract.at(matrix.tasks_completed, (rows, columns), completed.astype(np.int32))
+        np.subtract.at(matrix.total_tasks, (rows, columns), total.astype(np.int32))
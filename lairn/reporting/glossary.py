@@ -0,0 +1,102 @@
+"""Glossary of the additional explanations, filtered to the terms a prompt actually needs.
+
+``additional_explanations.md`` lists terms as ``## Term`` sections, aliases follow the term in
+parentheses, separated by commas or slashes, e.g. ``## Anton (Anton-App, ANTON)``. Text before the
+first section is a preamble and kept with any selection. A section is relevant when the text
+contains its term or one of its aliases at the start of a word, case-insensitive, so German
+compounds like ``Einmaleinsreihe`` find ``Einmaleins``. All terms are matched in a single pass with
+one regex built from a trie of the terms.
+"""
+
+import re
+from dataclasses import dataclass
+
+from lairn.common import count_tokens
+
+ENTRY_HEADING = re.compile(r"^## +(.+?) *$", re.MULTILINE)
+ALIASES = re.compile(r"^(.*?)\s*\((.*)\)$")
+
+
+@dataclass(frozen=True)
+class GlossaryEntry:
+    terms: tuple[str, ...]
+    text: str
+
+
+def _trie_pattern(words: list[str]) -> str:
+    """Regex alternation of ``words`` with shared prefixes factored out, longest words tried first."""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def pattern(node: dict) -> str:
+        ends = "" in node
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        group = branches[0] if len(branches) == 1 and not ends else f"(?:{'|'.join(branches)})"
+        return f"{group}?" if ends else group
+
+    return pattern(trie)
+
+
+class Glossary:
+    def __init__(self, preamble: str, entries: list[GlossaryEntry]):
+        self.preamble = preamble
+        self.entries = entries
+        self._entries_by_term = {term.lower(): entry for entry in entries for term in entry.terms}
+        terms = list(self._entries_by_term)
+        self._matcher = re.compile(rf"\b(?:{_trie_pattern(terms)})", re.IGNORECASE) if terms else None
+
+    @classmethod
+    def parse(cls, markdown: str) -> "Glossary":
+        headings = list(ENTRY_HEADING.finditer(markdown))
+        preamble = markdown[: headings[0].start()] if headings else markdown
+        entries = []
+        for heading, next_heading in zip(headings, headings[1:] + [None]):
+            title = heading.group(1)
+            terms = [title]
+            if match := ALIASES.match(title):
+                terms = [match.group(1)] + re.split(r"[,/]", match.group(2))
+            end = next_heading.start() if next_heading else len(markdown)
+            entries.append(
+                GlossaryEntry(
+                    terms=tuple(term.strip() for term in terms if term.strip()),
+                    text=markdown[heading.start() : end].strip(),
+                )
+            )
+        return cls(preamble.strip(), entries)
+
+    def matching_entries(self, text: str) -> list[GlossaryEntry]:
+        """Entries mentioned in ``text``, the most mentioned first."""
+        if self._matcher is None:
+            return []
+        mentions: dict[GlossaryEntry, int] = {}
+        for match in self._matcher.finditer(text):
+            entry = self._entries_by_term.get(match.group(0).lower())
+            if entry is not None:
+                mentions[entry] = mentions.get(entry, 0) + 1
+        return sorted(mentions, key=lambda entry: -mentions[entry])
+
+    def select(self, text: str, max_tokens: int | None = None) -> str:
+        """Markdown of the preamble and the entries mentioned in ``text``, in glossary order.
+
+        The preamble is always kept, a glossary without ``## Term`` sections is all preamble. With
+        ``max_tokens`` the most mentioned entries that fit into the cap are kept.
+        """
+        entries = self.matching_entries(text)
+        if max_tokens:
+            kept, tokens = [], count_tokens(self.preamble)
+            for entry in entries:
+                entry_tokens = count_tokens(entry.text)
+                if tokens + entry_tokens <= max_tokens:
+                    kept.append(entry)
+                    tokens += entry_tokens
+            entries = kept
+        selected = set(entries)
+        return "\n\n".join(
+            [self.preamble] + [entry.text for entry in self.entries if entry in selected]
+        ).strip()
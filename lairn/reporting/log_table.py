@@ -0,0 +1,216 @@
+"""Columnar in-memory tables of logs and Sofatutor activities for date range queries.
+
+A list of pydantic models costs several hundred bytes of object overhead per record and a date
+range query has to visit and convert every record. The tables keep the records sorted by time in
+a few flat arrays instead: a NumPy ``datetime64`` column, categorical codes for the user or subject,
+and the text of all records in a single UTF-8 buffer addressed by offsets. A range query is two
+binary searches with ``searchsorted``, and models are only materialized for the records in the
+range while they are iterated. Every record carries an integer id, so that changed records can be
+replaced without converting the others again.
+"""
+
+import copy
+from abc import ABC, abstractmethod
+from datetime import date, timedelta, tzinfo
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity
+from lairn.learn_log import LearnLogMessage
+
+
+def _code_dtype(num_categories: int) -> type:
+    return np.int8 if num_categories <= 2**7 else np.int16 if num_categories <= 2**15 else np.int32
+
+
+def _categorical(values: list) -> tuple[list, np.ndarray]:
+    """Distinct values and the code of every value in them."""
+    categories: dict = {}
+    codes = np.fromiter((categories.setdefault(value, len(categories)) for value in values), np.int32)
+    return list(categories), codes.astype(_code_dtype(len(categories)))
+
+
+def _record_ids(ids: Iterable[int] | None, num_records: int) -> np.ndarray:
+    return np.arange(num_records, dtype=np.int64) if ids is None else np.fromiter(ids, np.int64, num_records)
+
+
+def _buffer(texts: list[str]) -> tuple[bytes, np.ndarray]:
+    """All texts in one UTF-8 buffer, text ``i`` is ``buffer[offsets[i]:offsets[i + 1]]``."""
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(chunk) for chunk in encoded], out=offsets[1:])
+    return b"".join(encoded), offsets
+
+
+class _ColumnarTable(ABC):
+    """Records sorted by a ``datetime64`` key, with range queries by binary search."""
+
+    # Code columns of the subclass and the attributes with their categories
+    CATEGORICALS: dict[str, str] = {}
+
+    def __init__(self, keys: np.ndarray, buffer: bytes, offsets: np.ndarray, ids: np.ndarray):
+        self.keys = keys
+        self.buffer = buffer
+        self.offsets = offsets
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _text(self, i: int) -> str:
+        return self.buffer[self.offsets[i] : self.offsets[i + 1]].decode("utf-8")
+
+    @abstractmethod
+    def _records(self, indices: range) -> Iterator:
+        """Models of the records at ``indices``, materialized while iterated."""
+
+    def range_indices(self, start_date: date, end_date: date) -> range:
+        """Positions of the records from ``start_date`` to ``end_date``, both inclusive."""
+        start = np.datetime64(start_date).astype(self.keys.dtype)
+        end = np.datetime64(end_date + timedelta(days=1)).astype(self.keys.dtype)
+        return range(
+            int(np.searchsorted(self.keys, start, side="left")),
+            int(np.searchsorted(self.keys, end, side="left")),
+        )
+
+    def between(self, start_date: date, end_date: date) -> Iterator:
+        """Lazily materialized records from ``start_date`` to ``end_date``, both inclusive, in time order."""
+        return self._records(self.range_indices(start_date, end_date))
+
+    def __iter__(self) -> Iterator:
+        return self._records(range(len(self)))
+
+    def replace_rows(self, removed_ids: Iterable[int], added: "_ColumnarTable") -> "_ColumnarTable":
+        """Table without the records of ``removed_ids`` and with the records of ``added``.
+
+        The records that stay are copied column by column, only ``added`` was built from models.
+        """
+        keep = np.flatnonzero(~np.isin(self.ids, np.fromiter(removed_ids, np.int64)))
+        keys = np.concatenate([self.keys[keep], added.keys])
+        # Stable, so records with equal keys keep their order
+        order = np.argsort(keys, kind="stable")
+
+        table = copy.copy(self)
+        table.keys = keys[order]
+        table.ids = np.concatenate([self.ids[keep], added.ids])[order]
+        for codes_name, categories_name in self.CATEGORICALS.items():
+            categories = list(getattr(self, categories_name))
+            positions = {category: code for code, category in enumerate(categories)}
+            for category in getattr(added, categories_name):
+                if category not in positions:
+                    positions[category] = len(categories)
+                    categories.append(category)
+            added_codes = np.array(
+                [positions[category] for category in getattr(added, categories_name)], dtype=np.int32
+            )[getattr(added, codes_name)]
+            codes = np.concatenate([getattr(self, codes_name)[keep].astype(np.int32), added_codes])[order]
+            setattr(table, categories_name, categories)
+            setattr(table, codes_name, codes.astype(_code_dtype(len(categories))))
+
+        # Gather the bytes of every record in the new order into one buffer
+        data = np.frombuffer(self.buffer + added.buffer, dtype=np.uint8)
+        starts = np.concatenate([self.offsets[keep], added.offsets[:-1] + len(self.buffer)])[order]
+        lengths = np.concatenate([np.diff(self.offsets)[keep], np.diff(added.offsets)])[order]
+        table.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=table.offsets[1:])
+        positions = np.repeat(starts - table.offsets[:-1], lengths) + np.arange(table.offsets[-1])
+        table.buffer = data[positions].tobytes()
+        return table
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the columns of the table."""
+        return sum(column.nbytes for column in vars(self).values() if isinstance(column, np.ndarray)) + len(
+            self.buffer
+        )
+
+
+class LogTable(_ColumnarTable):
+    """Learn log messages in columns: timestamps, user codes and a text buffer.
+
+    Timestamps are stored as wall clock times, aware timestamps keep the code of their time zone,
+    so the date of a record is the date of its own timestamp, like ``log.timestamp.date()``.
+    """
+
+    CATEGORICALS = {"user_codes": "users", "timezone_codes": "timezones"}
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        buffer: bytes,
+        offsets: np.ndarray,
+        ids: np.ndarray,
+        users: list[str],
+        user_codes: np.ndarray,
+        timezones: list[tzinfo | None],
+        timezone_codes: np.ndarray,
+    ):
+        super().__init__(keys, buffer, offsets, ids)
+        self.users = users
+        self.user_codes = user_codes
+        self.timezones = timezones
+        self.timezone_codes = timezone_codes
+
+    @classmethod
+    def from_logs(cls, logs: Iterable[LearnLogMessage], ids: Iterable[int] | None = None) -> "LogTable":
+        """Table of ``logs``, ``ids`` are the ids of the logs, by default their positions."""
+        logs = list(logs)
+        ids = _record_ids(ids, len(logs))
+        order = sorted(range(len(logs)), key=lambda i: logs[i].timestamp.replace(tzinfo=None))
+        logs = [logs[i] for i in order]
+        keys = np.array([log.timestamp.replace(tzinfo=None) for log in logs], dtype="datetime64[us]")
+        users, user_codes = _categorical([log.user for log in logs])
+        timezones, timezone_codes = _categorical([log.timestamp.tzinfo for log in logs])
+        buffer, offsets = _buffer([log.text for log in logs])
+        return cls(keys, buffer, offsets, ids[order], users, user_codes, timezones, timezone_codes)
+
+    def _records(self, indices: range) -> Iterator[LearnLogMessage]:
+        timestamps = self.keys[indices.start : indices.stop].tolist()
+        for i, timestamp in zip(indices, timestamps):
+            timezone = self.timezones[self.timezone_codes[i]]
+            # The records were validated when the table was built
+            yield LearnLogMessage.model_construct(
+                user=self.users[self.user_codes[i]],
+                timestamp=timestamp if timezone is None else timestamp.replace(tzinfo=timezone),
+                text=self._text(i),
+            )
+
+
+class ActivityTable(_ColumnarTable):
+    """Sofatutor activities in columns: dates, subject codes and a buffer of the serialized activities."""
+
+    CATEGORICALS = {"subject_codes": "subjects"}
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        buffer: bytes,
+        offsets: np.ndarray,
+        ids: np.ndarray,
+        subjects: list[str],
+        subject_codes: np.ndarray,
+    ):
+        super().__init__(keys, buffer, offsets, ids)
+        self.subjects = subjects
+        self.subject_codes = subject_codes
+
+    @classmethod
+    def from_activities(
+        cls, activities: Iterable[SofatutorLearningActivity], ids: Iterable[int] | None = None
+    ) -> "ActivityTable":
+        """Table of ``activities``, ``ids`` are the ids of the activities, by default their positions."""
+        activities = list(activities)
+        ids = _record_ids(ids, len(activities))
+        order = sorted(range(len(activities)), key=lambda i: activities[i].date_ref)
+        activities = [activities[i] for i in order]
+        keys = np.array([activity.date_ref for activity in activities], dtype="datetime64[D]")
+        subjects, subject_codes = _categorical([activity.subject_label for activity in activities])
+        buffer, offsets = _buffer([activity.model_dump_json() for activity in activities])
+        return cls(keys, buffer, offsets, ids[order], subjects, subject_codes)
+
+    def _records(self, indices: range) -> Iterator[SofatutorLearningActivity]:
+        for i in indices:
+            yield SofatutorLearningActivity.model_validate_json(
+                self.buffer[self.offsets[i] : self.offsets[i + 1]]
+            )
@@ -0,0 +1,77 @@
+from datetime import date
+
+from pydantic import BaseModel, Field
+
+
+class WeekSubjectActivities(BaseModel):
+    subject: str = Field(description="The school subject")
+    activities: list[str] = Field(description="The activities of the week for this subject")
+
+
+class WeekActivities(BaseModel):
+    activities: list[WeekSubjectActivities] = Field(
+        description="The learning activities of the week per subject"
+    )
+
+    def str_fmt(self) -> str:
+        formatted_activities = ""
+        for subject_activity in self.activities:
+            formatted_activities += f"## {subject_activity.subject}\n"
+            for sub_activity in subject_activity.activities:
+                formatted_activities += f"  - {sub_activity}\n"
+            formatted_activities += "\n"
+        return formatted_activities
+
+
+class WeekActivitiesWithDateInfo(BaseModel):
+    week_number: int = Field(description="The week number")
+    year: int = Field(description="The year")
+    start_date: date = Field(description="The start date of the week")
+    end_date: date = Field(description="The end date of the week")
+    summary: str = Field(description="The summary of the week's activities")
+    activities: list[WeekSubjectActivities] = Field(
+        description="The learning activities of the week per subject"
+    )
+
+    def str_fmt(self) -> str:
+        formatted_activities = ""
+        for subject_activity in self.activities:
+            formatted_activities += f"## {subject_activity.subject}\n"
+            for sub_activity in subject_activity.activities:
+                formatted_activities += f"  - {sub_activity}\n"
+            formatted_activities += "\n"
+        return f"""
+# {self.year}/{self.week_number} ({self.start_date} - {self.end_date})
+
+{self.summary}
+
+{formatted_activities}
+"""
+
+
+class PeriodReport(BaseModel):
+    level: str = Field(description="The reporting level: month, term or year")
+    label: str = Field(description="The label of the period, e.g. 2024-07, 2024/25-1 or 2024/25")
+    start_date: date = Field(description="The first day of the period")
+    end_date: date = Field(description="The last day of the period")
+    summary: str = Field(description="The summary of the period")
+    activities: list[WeekSubjectActivities] = Field(
+        description="The learning activities of the period per subject, merged from the weeks"
+    )
+    sources: list[str] = Field(description="Labels of the weeks or reports this report was built from")
+    fingerprint: str = Field(description="Hash of the inputs, the report is rebuilt when it changes")
+
+    def str_fmt(self) -> str:
+        formatted_activities = ""
+        for subject_activity in self.activities:
+            formatted_activities += f"## {subject_activity.subject} ({len(subject_activity.activities)})\n"
+            for sub_activity in subject_activity.activities:
+                formatted_activities += f"  - {sub_activity}\n"
+            formatted_activities += "\n"
+        return f"""
+# {self.label} ({self.start_date} - {self.end_date})
+
+{self.summary}
+
+{formatted_activities}
+"""
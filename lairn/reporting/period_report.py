@@ -0,0 +1,291 @@
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+
+from langchain_core.prompts import PromptTemplate
+from loguru import logger
+
+from lairn.config import LLM, OUTPUT_LANGUAGE
+from lairn.context_mixin import ContextMixinClassLevel2
+from lairn.fanout import fan_out
+from lairn.llm.chat import create_chat_model
+from lairn.llm.telemetry import stage_config
+from lairn.reporting.models import PeriodReport, WeekActivitiesWithDateInfo, WeekSubjectActivities
+from lairn.tracing import traced
+
+LEVELS = ("month", "term", "year")
+LEVEL_NAMES = {"week": "week", "month": "month", "term": "school term", "year": "school year"}
+
+# The school year starts in August, its first term ends in January
+SCHOOL_YEAR_START_MONTH = 8
+SECOND_TERM_START_MONTH = 2
+
+PT_SUMMARIZE_PERIOD = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Expert home schooling learning assistant
+
+    You receive the summaries of the {child_level}s of a {level} of homeschooling of a single student
+    with age {age}, and the number of activities per school subject during the {level}. Write a short
+    summary to explain what progress the student made during the {level}. The target reader is an
+    external instructor who monitors the student's progress and uses this to give advice to the parents.
+
+    |USER|
+
+    ## Summaries of the {child_level}s of {label}
+
+    {child_summaries}
+
+    ## Number of activities per subject
+
+    {activity_counts}
+
+    ## Further instructions
+      - Start with an overview of the subject composition of the {level}.
+      - Describe the development over the {level}, not each {child_level} one after another.
+      - Respond with an unstructured text summary (no sections, paragraphs, bullet points or lists).
+      - Do not judge or evaluate the activities, just summarize them.
+      - Do not make anything up that is not in the summaries.
+
+    ## Response language
+
+    {response_language}
+
+""",
+    input_variables=[
+        "age",
+        "level",
+        "child_level",
+        "label",
+        "child_summaries",
+        "activity_counts",
+        "response_language",
+    ],
+)
+
+
+def _school_year(day: date) -> int:
+    """Calendar year in which the school year of ``day`` started."""
+    return day.year if day.month >= SCHOOL_YEAR_START_MONTH else day.year - 1
+
+
+def _month_end(first: date) -> date:
+    return (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+@dataclass(frozen=True)
+class Period:
+    level: str
+    start_date: date
+    end_date: date
+    label: str
+
+    @classmethod
+    def of(cls, level: str, day: date) -> "Period":
+        """The period of ``level`` that contains ``day``."""
+        if level == "month":
+            first = day.replace(day=1)
+            return cls("month", first, _month_end(first), f"{first:%Y-%m}")
+
+        school_year = _school_year(day)
+        year_label = f"{school_year}/{(school_year + 1) % 100:02d}"
+        if level == "year":
+            return cls(
+                "year",
+                date(school_year, SCHOOL_YEAR_START_MONTH, 1),
+                date(school_year + 1, SCHOOL_YEAR_START_MONTH, 1) - timedelta(days=1),
+                year_label,
+            )
+        if level == "term":
+            second_term_start = date(school_year + 1, SECOND_TERM_START_MONTH, 1)
+            if day < second_term_start:
+                return cls(
+                    "term",
+                    date(school_year, SCHOOL_YEAR_START_MONTH, 1),
+                    second_term_start - timedelta(days=1),
+                    f"{year_label}-1",
+                )
+            return cls(
+                "term",
+                second_term_start,
+                date(school_year + 1, SCHOOL_YEAR_START_MONTH, 1) - timedelta(days=1),
+                f"{year_label}-2",
+            )
+        raise ValueError(f"Unknown reporting level {level}, expected one of {', '.join(LEVELS)}")
+
+    @property
+    def child_level(self) -> str:
+        return {"month": "week", "term": "month", "year": "term"}[self.level]
+
+    def children(self) -> list["Period"]:
+        """The periods of the level below, weeks are not periods and are assigned by ``week_month``."""
+        children = []
+        day = self.start_date
+        while day <= self.end_date:
+            child = Period.of(self.child_level, day)
+            children.append(child)
+            day = child.end_date + timedelta(days=1)
+        return children
+
+    @property
+    def file_stem(self) -> str:
+        return f"{self.level}_{self.label.replace('/', '-')}"
+
+
+def week_month(start_date: date) -> date:
+    """First day of the month a week belongs to, the month of its Thursday as for ISO weeks."""
+    return (start_date + timedelta(days=3)).replace(day=1)
+
+
+def merge_subject_activities(
+    activity_lists: list[list[WeekSubjectActivities]],
+) -> list[WeekSubjectActivities]:
+    """Merge activities per subject, keeping the first occurrence of repeated activities."""
+    merged: dict[str, dict[str, None]] = {}
+    for activities in activity_lists:
+        for subject_activities in activities:
+            subject = merged.setdefault(subject_activities.subject, {})
+            for activity in subject_activities.activities:
+                subject.setdefault(activity, None)
+    return [
+        WeekSubjectActivities(subject=subject, activities=list(items)) for subject, items in merged.items()
+    ]
+
+
+def _week_label(week: WeekActivitiesWithDateInfo) -> str:
+    return f"{week.year}-W{week.week_number:02d}"
+
+
+class PeriodReporter(ContextMixinClassLevel2):
+    """Builds month, term and year reports by reducing the saved weekly summaries.
+
+    A report merges the activities of its weeks per subject locally and costs one small LLM call,
+    which summarizes the summaries of the level below: months summarize weeks, terms summarize
+    months, years summarize terms. Independent reports of a level are built concurrently. Every
+    report is saved with the fingerprint of its inputs and only rebuilt when they change, so a year
+    report costs at most one call per month, term and year, and none if nothing changed.
+    """
+
+    def __init__(self, model_name: str | None = None, reports_dir: Path | None = None):
+        self.model_name = model_name or LLM
+        self.model = create_chat_model(self.model_name)
+        self.reports_dir = reports_dir or self.PERIOD_REPORTS_PATH
+        self._weeks: list[WeekActivitiesWithDateInfo] | None = None
+        self._reports: dict[Period, asyncio.Task] = {}
+
+    def load_week_summaries(self) -> list[WeekActivitiesWithDateInfo]:
+        if self._weeks is None:
+            self._weeks = [
+                WeekActivitiesWithDateInfo.model_validate_json(path.read_text())
+                for path in sorted(self.WEEKLY_SUMMARIES_PATH.glob("*.json"))
+            ]
+        return self._weeks
+
+    def _path(self, period: Period) -> Path:
+        return self.reports_dir / f"{period.file_stem}.json"
+
+    def load_report(self, period: Period) -> PeriodReport | None:
+        path = self._path(period)
+        if not path.is_file():
+            return None
+        return PeriodReport.model_validate_json(path.read_text())
+
+    def _save(self, report: PeriodReport, period: Period):
+        self.reports_dir.mkdir(parents=True, exist_ok=True)
+        self._path(period).write_text(report.model_dump_json(indent=2))
+        self._path(period).with_suffix(".md").write_text(report.str_fmt().replace("## Other", "## Weiteres"))
+
+    async def _sources(
+        self, period: Period, force: bool
+    ) -> list[tuple[str, str, list[WeekSubjectActivities]]]:
+        """Label, summary and activities of the weeks or reports the report of ``period`` is built from."""
+        if period.level == "month":
+            weeks = [
+                week
+                for week in self.load_week_summaries()
+                if week_month(week.start_date) == period.start_date
+            ]
+            return [
+                (_week_label(week), week.summary, week.activities)
+                for week in sorted(weeks, key=lambda w: w.start_date)
+            ]
+
+        # Reports of the children that succeeded are saved, so a rerun only rebuilds the failed ones
+        outcome = await fan_out(period.children(), lambda child: self.areport(child, force))
+        outcome.raise_for_failures(f"reports of {period.level} {period.label}")
+        reports = outcome.results.values()
+        return [(report.label, report.summary, report.activities) for report in reports if report is not None]
+
+    def _fingerprint(self, period: Period, sources: list) -> str:
+        # The age at the start of the period, so that birthdays do not change past reports
+        inputs = {
+            "model_name": self.model_name,
+            "prompt": PT_SUMMARIZE_PERIOD.template,
+            "age": self.student_age_on(period.start_date),
+            "response_language": OUTPUT_LANGUAGE,
+            "sources": [
+                (label, summary, [activities.model_dump() for activities in activity_list])
+                for label, summary, activity_list in sources
+            ],
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+    @traced()
+    async def _build(self, period: Period, force: bool) -> PeriodReport | None:
+        sources = await self._sources(period, force)
+        if not sources:
+            logger.info(f"No weekly summaries for {period.level} {period.label}")
+            return None
+
+        fingerprint = self._fingerprint(period, sources)
+        cached = self.load_report(period)
+        if cached is not None and cached.fingerprint == fingerprint and not force:
+            return cached
+
+        activities = merge_subject_activities([activity_list for _, _, activity_list in sources])
+        logger.info(
+            f"Building {period.level} report {period.label} from {len(sources)} {period.child_level}s"
+        )
+        summary = (
+            await self.model.ainvoke(
+                PT_SUMMARIZE_PERIOD.template.format(
+                    age=self.student_age_on(period.start_date),
+                    level=LEVEL_NAMES[period.level],
+                    child_level=LEVEL_NAMES[period.child_level],
+                    label=period.label,
+                    child_summaries="\n\n".join(f"### {label}\n\n{summary}" for label, summary, _ in sources),
+                    activity_counts="\n".join(
+                        f"  - {subject.subject}: {len(subject.activities)}" for subject in activities
+                    ),
+                    response_language=OUTPUT_LANGUAGE,
+                ),
+                config=stage_config(f"report_{period.level}"),
+            )
+        ).content
+
+        report = PeriodReport(
+            level=period.level,
+            label=period.label,
+            start_date=period.start_date,
+            end_date=period.end_date,
+            summary=summary,
+            activities=activities,
+            sources=[label for label, _, _ in sources],
+            fingerprint=fingerprint,
+        )
+        self._save(report, period)
+        return report
+
+    async def areport(self, period: Period, force: bool = False) -> PeriodReport | None:
+        """Report of ``period``, None if it has no weekly summaries.
+
+        Every period is built once per run, a build that failed is started again by the next call.
+        """
+        task = self._reports.get(period)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            self._reports[period] = asyncio.ensure_future(self._build(period, force))
+        return await self._reports[period]
@@ -0,0 +1,274 @@
+import asyncio
+import itertools
+import os
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterable
+
+from loguru import logger
+
+from lairn.context_mixin import ContextMixinClassLevel2
+from lairn.reporting.log_table import ActivityTable, LogTable
+from lairn.reporting.week_summarizer import WeekSummarizer, load_week_fingerprint, week_start
+from lairn.tracing import span
+
+# File signature used by the polling backend to detect changes
+Signature = tuple[int, int]
+
+
+class WatchedWeekSummarizer(WeekSummarizer):
+    """Week summarizer reading the records indexed by a ``WeekWatcher`` instead of rescanning the data."""
+
+    def __init__(self, watcher: "WeekWatcher", **kwargs):
+        self.watcher = watcher
+        super().__init__(**kwargs)
+
+    def load_logs(self):
+        return self.watcher.records(self.LOGS_PATH)
+
+    def load_sofa_activities(self):
+        return self.watcher.records(self.SOFA_PATH)
+
+    def log_table(self):
+        return self.watcher.table(self.LOGS_PATH)
+
+    def activity_table(self):
+        return self.watcher.table(self.SOFA_PATH)
+
+
+class WeekWatcher(ContextMixinClassLevel2):
+    """Keeps the weekly summaries up to date while logs and activities arrive.
+
+    Every log and Sofatutor activity file is parsed once into the rows of a columnar table per
+    directory, and the ISO weeks of every file are indexed. File events are debounced, only the
+    changed files are parsed again and only their rows are replaced in the tables, and the weeks affected by the old or new content of a file are re-summarized
+    in the background. A week that changes again while it is summarized is summarized once more
+    afterwards. At startup, the weeks whose inputs changed while nobody watched are summarized.
+
+    Events come from ``watchfiles`` (inotify and its equivalents) when it is installed, otherwise
+    the watched directories are polled for changed modification times and sizes.
+    """
+
+    def __init__(
+        self,
+        debounce: float = 5.0,
+        poll_interval: float = 2.0,
+        force_polling: bool = False,
+        output_dir: Path | None = None,
+        **summarizer_kwargs,
+    ):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling
+        self.output_dir = output_dir
+        self.summarizer_kwargs = summarizer_kwargs
+
+        self._tables: dict[Path, LogTable | ActivityTable] = {}
+        # Id of the rows of every file in the table of its directory
+        self._row_ids: dict[Path, int] = {}
+        self._next_row_id = itertools.count()
+        self._weeks: dict[Path, set[date]] = {}
+        self._signatures: dict[Path, Signature] = {}
+        self._summarizing: dict[date, asyncio.Task] = {}
+        self._outdated: set[date] = set()
+        self._summarizer: WatchedWeekSummarizer | None = None
+        # Incremented on every change of the index, for caches of derived data
+        self.version = 0
+
+    @property
+    def watched_dirs(self) -> list[Path]:
+        # Artifacts are not part of the weekly summaries, so changes to them do not affect any week
+        return [self.LOGS_PATH, self.SOFA_PATH]
+
+    def records(self, directory: Path) -> list:
+        return list(self.table(directory))
+
+    def _new_table(self, directory: Path, records: list, ids: list[int]) -> LogTable | ActivityTable:
+        if directory == self.LOGS_PATH:
+            return LogTable.from_logs(records, ids)
+        return ActivityTable.from_activities(records, ids)
+
+    def table(self, directory: Path) -> LogTable | ActivityTable:
+        """Columnar table of the records of ``directory``."""
+        if directory not in self._tables:
+            self._tables[directory] = self._new_table(directory, [], [])
+        return self._tables[directory]
+
+    def _parse(self, path: Path) -> tuple[list, set[date]]:
+        if path.parent == self.LOGS_PATH:
+            from lairn.learn_log import LearnLogMessage
+
+            log = LearnLogMessage.from_json_file(path)
+            return [log], {week_start(log.timestamp.date())}
+
+        from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity
+
+        activity = SofatutorLearningActivity.from_json_file(path)
+        return [activity], {week_start(activity.date_ref)}
+
+    def _update_files(self, paths: Iterable[Path]) -> set[date]:
+        """Index the current content of ``paths`` and return the weeks of their old and new records."""
+        affected = set()
+        # Per directory: ids of the rows to remove, records to add and their ids
+        changes: dict[Path, tuple[list[int], list, list[int]]] = {}
+        for path in paths:
+            removed, added, added_ids = changes.setdefault(path.parent, ([], [], []))
+            affected |= self._weeks.pop(path, set())
+            if path in self._row_ids:
+                removed.append(self._row_ids.pop(path))
+            if not path.is_file():
+                continue
+            try:
+                records, weeks = self._parse(path)
+            except Exception:
+                # Most likely still being written, the next event of the file brings it in
+                logger.warning(f"Could not parse {path}, ignoring it until it changes")
+                continue
+            self._row_ids[path] = next(self._next_row_id)
+            added += records
+            added_ids += [self._row_ids[path]] * len(records)
+            self._weeks[path] = weeks
+            affected |= weeks
+
+        for directory, (removed, added, added_ids) in changes.items():
+            self._tables[directory] = self.table(directory).replace_rows(
+                removed, self._new_table(directory, added, added_ids)
+            )
+        if changes:
+            self.version += 1
+        return affected
+
+    def _scan(self) -> dict[Path, Signature]:
+        signatures = {}
+        for directory in self.watched_dirs:
+            if not directory.is_dir():
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json") and entry.is_file():
+                        stat = entry.stat()
+                        signatures[Path(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    def build_index(self):
+        with span("watcher_build_index"):
+            self._signatures = self._scan()
+            self._update_files(self._signatures)
+        logger.info(f"Indexed {len(self._weeks)} files in {len(self.weeks())} weeks")
+
+    def weeks(self) -> set[date]:
+        return set().union(*self._weeks.values())
+
+    def _changed_files(self) -> set[Path]:
+        signatures = self._scan()
+        changed = {
+            path
+            for path in signatures.keys() | self._signatures.keys()
+            if signatures.get(path) != self._signatures.get(path)
+        }
+        self._signatures = signatures
+        return changed
+
+    def _outdated_weeks(self) -> set[date]:
+        """Weeks whose fingerprint differs from the one of their saved summary, or that have none."""
+        outdated = set()
+        for monday in self.weeks():
+            records = self._summarizer.get_records_for_date_range(monday, monday + timedelta(days=6))
+            fingerprint = self._summarizer.week_fingerprint(monday, records)["fingerprint"]
+            if fingerprint != load_week_fingerprint(self.output_dir, monday):
+                outdated.add(monday)
+        return outdated
+
+    def refresh(self) -> set[date]:
+        """Index the files changed since the last scan, returns the affected weeks."""
+        return self._update_files(self._changed_files())
+
+    async def _poll(self, queue: asyncio.Queue):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for path in self._changed_files():
+                queue.put_nowait(path)
+
+    async def _watch(self, queue: asyncio.Queue):
+        try:
+            from watchfiles import awatch
+        except ImportError:
+            awatch = None
+        if awatch is None or self.force_polling:
+            logger.info(f"Polling {', '.join(map(str, self.watched_dirs))} every {self.poll_interval}s")
+            await self._poll(queue)
+            return
+
+        logger.info(f"Watching {', '.join(map(str, self.watched_dirs))}")
+        # Events carry resolved paths, map them back to the paths of the index
+        directories = {
+            directory.resolve(): directory for directory in self.watched_dirs if directory.is_dir()
+        }
+        async for changes in awatch(*directories):
+            for _, changed_path in changes:
+                changed_path = Path(changed_path)
+                if changed_path.suffix == ".json" and changed_path.parent in directories:
+                    queue.put_nowait(directories[changed_path.parent] / changed_path.name)
+
+    async def _debounced(self, queue: asyncio.Queue):
+        """Yield the set of changed files once no further event arrived for ``debounce`` seconds."""
+        while True:
+            changed = {await queue.get()}
+            while True:
+                try:
+                    changed.add(await asyncio.wait_for(queue.get(), timeout=self.debounce))
+                except asyncio.TimeoutError:
+                    break
+            yield changed
+
+    def _schedule(self, monday: date):
+        if monday in self._summarizing:
+            self._outdated.add(monday)
+            return
+        task = asyncio.create_task(self._summarize(monday))
+        self._summarizing[monday] = task
+        task.add_done_callback(lambda _: self._summarized(monday))
+
+    def _summarized(self, monday: date):
+        del self._summarizing[monday]
+        if monday in self._outdated:
+            self._outdated.discard(monday)
+            self._schedule(monday)
+
+    async def _summarize(self, monday: date):
+        year, week_number, _ = monday.isocalendar()
+        try:
+            summary = await self._summarizer.aupdate_week(monday, self.output_dir)
+        except ValueError as e:
+            logger.warning(f"Not summarizing week {year}-W{week_number}: {e}")
+            return
+        except Exception:
+            logger.exception(f"Summarizing week {year}-W{week_number} failed")
+            return
+        if summary is not None:
+            logger.info(f"Updated week {year}-W{week_number}")
+
+    async def run(self):
+        """Watch until cancelled, summarizing the weeks affected by every batch of changes."""
+        self.output_dir = self.output_dir or self.WEEKLY_SUMMARIES_PATH
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._summarizer = WatchedWeekSummarizer(self, **self.summarizer_kwargs)
+        self.build_index()
+
+        queue = asyncio.Queue()
+        watch_task = asyncio.create_task(self._watch(queue))
+        try:
+            outdated = self._outdated_weeks()
+            logger.info(f"{len(outdated)} weeks changed since their summaries were saved")
+            for monday in sorted(outdated):
+                self._schedule(monday)
+            async for changed in self._debounced(queue):
+                affected = self._update_files(changed)
+                logger.info(f"{len(changed)} changed files affect {len(affected)} weeks")
+                for monday in sorted(affected):
+                    self._schedule(monday)
+        finally:
+            watch_task.cancel()
+            self._outdated.clear()
+            for task in self._summarizing.values():
+                task.cancel()
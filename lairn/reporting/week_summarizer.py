@@ -1,15 +1,31 @@
-from datetime import date
+import asyncio
+import hashlib
+import json
+import re
+from datetime import date, timedelta
+from pathlib import Path
 
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
-from pydantic import BaseModel, Field
 
-from lairn.config import LLM, OUTPUT_LANGUAGE
+from lairn.common import count_tokens
+from lairn.config import COMPACT_LOGS, GLOSSARY_MAX_TOKENS, LLM, OUTPUT_LANGUAGE
 from lairn.context_mixin import ContextMixinClassLevel2
 from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity
+from lairn.llm import routing
+from lairn.llm.chat import create_chat_model
+from lairn.llm.prompt_layout import select_prompt
+from lairn.llm.structured import structured_chain
+from lairn.llm.telemetry import stage_config
 
 from lairn.learn_log import LearnLogMessage
+from lairn.reporting.compaction import compact_records
+from lairn.reporting.glossary import Glossary
+from lairn.reporting.log_table import ActivityTable, LogTable
+from lairn.reporting.models import WeekActivities, WeekActivitiesWithDateInfo, WeekSubjectActivities
+from lairn.tracing import traced
+from loguru import logger
+
+WEEK_STAGES = ["week_listing", "week_summary"]
 
 PT_LIST_WEEK_ACTIVITIES = PromptTemplate(
     template="""
@@ -114,71 +130,331 @@ PT_SUMMARIZE_WEEK = PromptTemplate(
 )
 
 
-class WeekSubjectActivities(BaseModel):
-    subject: str = Field(description="The school subject")
-    activities: list[str] = Field(description="The activities of the week for this subject")
+PT_LIST_WEEK_ACTIVITIES_PREFIX_STABLE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Expert home schooling learning assistant
+
+    You receive a list of homeschooling activities of a single student logged during the week.
+    List the week's activities in a clear and readable format. Group the activities by
+    school subject, using only the known subjects from the list provided in the user instructions. If the
+    activity is not related to a school subject, group it under the "Other" category. Not all subjects need
+    to be present in the logs.
+    
+    Take into account the context information for common terms and tools in the user instructions to know
+    what they mean when they appear in the logs.
+
+    ## Further instructions
+      - Only provide responses for subjects that really occur in the logs
+      - Stick close to the actual logs, making only edits to improve readability and to give 
+        a standardized format
+      - Do not make anything up
+
+    ## Response format
+
+    {response_format}
+
+    ## Response language
+
+    {response_language}
+
+    |USER|
+
+    ## Context information
+
+    {additional_explanations}
+
+    ## Known subjects
+
+    {known_subjects}
+
+    ## Age of the student
+
+    {age}
+
+    ## Logs for the week
+
+    {logs}
+
+""",
+    input_variables=[
+        "age",
+        "additional_explanations",
+        "logs",
+        "known_subjects",
+        "response_format",
+        "response_language",
+    ],
+)
+
+
+PT_SUMMARIZE_WEEK_PREFIX_STABLE = PromptTemplate(
+    template="""
+    |SYSTEM|
+
+    # Expert home schooling learning assistant
+
+    You receive a list of homeschooling activities of a single student logged during the week.
+    Write a short summary to explain what progress the student made during the week. The summary should be
+    concise but informative. The target reader is an external instructor who monitors the student's progress
+    and uses this to give advice to the parents. 
+    
+    Take into account the context information for common terms and tools in the user instructions to know
+    what they mean when they appear in the logs.
+
+    ## Further instructions
+      - Start the summary with an subject composition overview statement, for example 'This week was 
+        dominated by math and science activities' or 'This week was very diverse with activities in
+        multiple subjects'. Do not use exactly these examples to avoid boring repetition.
+      - Respond with an unstructured text summary (no sections, paragraphs, bullet points or lists).
+      - Do not judge or evaluate the activities, just summarize them.
+      - Do not list the activities again, except to give examples. You should rather describe general 
+        categories and the progress that was made. Be concise.
+      - Do not mention exact time durations of activities. For example, if the activity notes 'reading 
+        10min...' just mention 'reading' in the summary. Do not write "He read for 10 minutes".
+      - Make sure major activities are emphasized over small details. For example, if the student
+        completed a major project, mention that before mentioning smaller tasks. Do not exaggerate
+        the importance of small tasks that last only few minutes.
+
+    ## Response language
+
+    {response_language}
+
+    |USER|
+
+    ## Context information
+
+    {additional_explanations}
+
+    ## Age of the student
+
+    {age}
+
+    ## Activities
+
+    {activities}
+
+""",
+    input_variables=[
+        "age",
+        "additional_explanations",
+        "activities",
+        "response_language",
+    ],
+)
+
+
+def week_start(day: date) -> date:
+    """Monday of the ISO week of ``day``, the key of a week."""
+    return day - timedelta(days=day.weekday())
+
+
+def parse_week(value: str) -> date:
+    """Monday of an ISO week given as ``2024-W27`` or as any date of the week."""
+    if match := re.fullmatch(r"(\d{4})-?W(\d{1,2})", value, flags=re.IGNORECASE):
+        return date.fromisocalendar(int(match[1]), int(match[2]), 1)
+    try:
+        return week_start(date.fromisoformat(value))
+    except ValueError:
+        raise ValueError(f"{value} is neither an ISO week (2024-W27) nor a date (2024-07-01)")
+
+
+def _week_file_stem(start_date: date) -> str:
+    end_date = start_date + timedelta(days=6)
+    year, week_number, _ = start_date.isocalendar()
+    return f"{year}_week_{week_number}_{start_date}-{end_date}"
+
+
+def week_summary_paths(out_dir: Path, start_date: date) -> tuple[Path, Path]:
+    """JSON and markdown path of the summary of the week starting on ``start_date``."""
+    file_stem = _week_file_stem(start_date)
+    return out_dir / f"{file_stem}.json", out_dir / f"{file_stem}.md"
+
+
+def week_fingerprint_path(out_dir: Path, start_date: date) -> Path:
+    # Not *.json, so that the sidecars are not mistaken for summaries
+    return out_dir / f"{_week_file_stem(start_date)}.fingerprint"
+
 
+def week_summary_markdown(summary: WeekActivitiesWithDateInfo) -> str:
+    return summary.str_fmt().replace("## Other", "## Weiteres")
 
-class WeekActivities(BaseModel):
-    activities: list[WeekSubjectActivities] = Field(
-        description="The learning activities of the week per subject"
-    )
 
-    def str_fmt(self) -> str:
-        formatted_activities = ""
-        for subject_activity in self.activities:
-            formatted_activities += f"## {subject_activity.subject}\n"
-            for sub_activity in subject_activity.activities:
-                formatted_activities += f"  - {sub_activity}\n"
-            formatted_activities += "\n"
-        return formatted_activities
+def save_week_summary(
+    summary: WeekActivitiesWithDateInfo, out_dir: Path, fingerprint: dict | None = None
+) -> Path:
+    json_path, md_path = week_summary_paths(out_dir, summary.start_date)
+    json_path.write_text(summary.json())
+    md_path.write_text(week_summary_markdown(summary))
+    fingerprint_path = week_fingerprint_path(out_dir, summary.start_date)
+    if fingerprint is not None:
+        fingerprint_path.write_text(json.dumps(fingerprint, indent=2, ensure_ascii=False))
+    else:
+        # A summary without its inputs must not look up to date
+        fingerprint_path.unlink(missing_ok=True)
+    return json_path
 
 
-class WeekActivitiesWithDateInfo(BaseModel):
-    week_number: int = Field(description="The week number")
-    year: int = Field(description="The year")
-    start_date: date = Field(description="The start date of the week")
-    end_date: date = Field(description="The end date of the week")
-    summary: str = Field(description="The summary of the week's activities")
-    activities: list[WeekSubjectActivities] = Field(
-        description="The learning activities of the week per subject"
-    )
+def load_week_fingerprint(out_dir: Path, start_date: date) -> str | None:
+    """Fingerprint of the inputs of the saved summary, None if there is no summary or it is unknown."""
+    json_path, _ = week_summary_paths(out_dir, start_date)
+    fingerprint_path = week_fingerprint_path(out_dir, start_date)
+    if not json_path.is_file() or not fingerprint_path.is_file():
+        return None
+    return json.loads(fingerprint_path.read_text())["fingerprint"]
 
-    def str_fmt(self) -> str:
-        formatted_activities = ""
-        for subject_activity in self.activities:
-            formatted_activities += f"## {subject_activity.subject}\n"
-            for sub_activity in subject_activity.activities:
-                formatted_activities += f"  - {sub_activity}\n"
-            formatted_activities += "\n"
-        return f"""
-# {self.year}/{self.week_number} ({self.start_date} - {self.end_date})
 
-{self.summary}
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
 
-{formatted_activities}
-"""
+
+def _record_id(record: LearnLogMessage | SofatutorLearningActivity) -> str:
+    if isinstance(record, LearnLogMessage):
+        return f"log/{record.timestamp.isoformat()}"
+    return f"sofatutor/{record.default_file_name}"
+
+
+def _full_text(records: list[LearnLogMessage | SofatutorLearningActivity]) -> str:
+    return "".join([record.str_fmt() for record in records])
 
 
 class WeekSummarizer(ContextMixinClassLevel2):
-    def __init__(self, model_name: str | None = None):
+    def __init__(
+        self,
+        model_name: str | None = None,
+        prompt_layout: str | None = None,
+        native_structured_output: bool | None = None,
+        glossary_max_tokens: int | None = None,
+        compact_logs: bool | None = None,
+    ):
         self.model_name = model_name or LLM
+        self.prompt_layout = prompt_layout
+        self.native_structured_output = native_structured_output
+        self.glossary_max_tokens = GLOSSARY_MAX_TOKENS if glossary_max_tokens is None else glossary_max_tokens
+        self.compact_logs = COMPACT_LOGS if compact_logs is None else compact_logs
 
-        self.model = ChatOpenAI(model_name=self.model_name, temperature=0.0)
+        self.model = create_chat_model(self.model_name)
         self.additional_explanations = self.load_additional_explanations()
-
+        self.glossary = Glossary.parse(self.additional_explanations)
+        self._log_table: LogTable | None = None
+        self._activity_table: ActivityTable | None = None
+
+    def log_table(self) -> LogTable:
+        """Columnar table of the logs, loaded once per summarizer."""
+        if self._log_table is None:
+            self._log_table = LogTable.from_logs(self.load_logs())
+        return self._log_table
+
+    def activity_table(self) -> ActivityTable:
+        """Columnar table of the Sofatutor activities, loaded once per summarizer."""
+        if self._activity_table is None:
+            self._activity_table = ActivityTable.from_activities(self.load_sofa_activities())
+        return self._activity_table
+
+    @traced()
     def get_logs_for_date_range(self, start_date: date, end_date: date) -> list[LearnLogMessage]:
-        logs = self.load_logs()
-        return [log for log in logs if start_date <= log.timestamp.date() <= end_date]
+        return list(self.log_table().between(start_date, end_date))
 
+    @traced()
     def get_sofa_activities_for_date_range(
         self, start_date: date, end_date: date
     ) -> list[SofatutorLearningActivity]:
-        logs = self.load_sofa_activities()
-        return [log for log in logs if start_date <= log.date_ref <= end_date]
+        return list(self.activity_table().between(start_date, end_date))
+
+    def get_records_for_date_range(
+        self, start_date: date, end_date: date
+    ) -> list[LearnLogMessage | SofatutorLearningActivity]:
+        records = self.get_logs_for_date_range(start_date, end_date)
+        records += self.get_sofa_activities_for_date_range(start_date, end_date)
+        if len(records) == 0:
+            raise ValueError("No logs found for the given date range")
+        return records
+
+    def _listing_chain(self):
+        prompt = select_prompt(
+            PT_LIST_WEEK_ACTIVITIES, PT_LIST_WEEK_ACTIVITIES_PREFIX_STABLE, self.prompt_layout
+        )
+        chain, response_format = structured_chain(
+            prompt, self.model, WeekActivities, self.native_structured_output
+        )
+        return prompt, chain, response_format
+
+    def _records_text(self, records: list[LearnLogMessage | SofatutorLearningActivity]) -> str:
+        if self.compact_logs:
+            return compact_records(records)
+        return _full_text(records)
+
+    def relevant_explanations(self, records: list[LearnLogMessage | SofatutorLearningActivity]) -> str:
+        """The entries of the additional explanations whose terms appear in ``records``."""
+        return self.glossary.select(self._records_text(records), self.glossary_max_tokens)
+
+    def _known_subjects(self) -> str:
+        return str(list(sorted(self.load_curricula().keys())))
+
+    def week_fingerprint(
+        self, start_date: date, records: list[LearnLogMessage | SofatutorLearningActivity]
+    ) -> dict:
+        """Everything the summary of the week of ``start_date`` depends on, and the fingerprint hashing it.
+
+        Records are listed with identifier and content hash, so that comparing the inputs of two
+        fingerprints shows which logs or activities changed. The age is the student's age at
+        the start of the week, so that birthdays do not change the fingerprints of past weeks.
+        """
+        listing_prompt, _, response_format = self._listing_chain()
+        summary_prompt = select_prompt(PT_SUMMARIZE_WEEK, PT_SUMMARIZE_WEEK_PREFIX_STABLE, self.prompt_layout)
+        inputs = {
+            "model_name": self.model_name,
+            "model": json.loads(json.dumps(self.model._identifying_params, sort_keys=True, default=str)),
+            "prompts": _sha256(listing_prompt.template + response_format + summary_prompt.template),
+            "additional_explanations": _sha256(self.relevant_explanations(records)),
+            "context": {
+                "age": self.student_age_on(start_date),
+                "known_subjects": self._known_subjects(),
+                "response_language": OUTPUT_LANGUAGE,
+                "compact_logs": self.compact_logs,
+            },
+            "records": sorted([_record_id(record), _sha256(record.model_dump_json())] for record in records),
+        }
+        if routing.POLICY is not None:
+            # Routed weeks may be summarized by other models than ``model_name``
+            inputs["routes"] = routing.POLICY.describe(WEEK_STAGES)
+        return {"fingerprint": _sha256(json.dumps(inputs, sort_keys=True)), "inputs": inputs}
+
+    @traced()
+    async def aupdate_week(
+        self, start_date: date, out_dir: Path, force: bool = False, save: bool = True
+    ) -> WeekActivitiesWithDateInfo | None:
+        """Summarize the week starting on ``start_date`` unless its inputs are unchanged.
+
+        Returns None, without calling the LLM, if the saved summary was made from the same inputs.
+        Otherwise the week is summarized and, with ``save``, saved with its fingerprint.
+        """
+        end_date = start_date + timedelta(days=6)
+        year, week_number, _ = start_date.isocalendar()
+        records = self.get_records_for_date_range(start_date, end_date)
+        fingerprint = self.week_fingerprint(start_date, records)
+        if not force and load_week_fingerprint(out_dir, start_date) == fingerprint["fingerprint"]:
+            logger.info(f"Week {year}-W{week_number} is unchanged, keeping its summary")
+            return None
+
+        summary = await self.asummarize_week(start_date, end_date, records)
+        if save:
+            save_week_summary(summary, out_dir, fingerprint)
+        return summary
 
     def summarize_week(self, start_date: date, end_date: date) -> WeekActivitiesWithDateInfo:
-        print(f"Summarizing week from {start_date} to {end_date}")
+        return asyncio.run(self.asummarize_week(start_date, end_date))
+
+    @traced()
+    async def asummarize_week(
+        self,
+        start_date: date,
+        end_date: date,
+        records: list[LearnLogMessage | SofatutorLearningActivity] | None = None,
+    ) -> WeekActivitiesWithDateInfo:
+        """Summarize a week, ``records`` are its logs and activities if already loaded."""
+        logger.info(f"Summarizing week from {start_date} to {end_date}")
 
         iso_cal = start_date.isocalendar()
         assert iso_cal[2] == 1, "Start date must be a Monday"
@@ -188,34 +464,40 @@ class WeekSummarizer(ContextMixinClassLevel2):
         assert week_number == end_date.isocalendar()[1], "Start and end date must be in the same week"
         year = iso_cal[0]
 
-        logs = self.get_logs_for_date_range(start_date, end_date)
-        sofa_activities = self.get_sofa_activities_for_date_range(start_date, end_date)
-        logs = logs + sofa_activities
-        if len(logs) == 0:
-            raise ValueError("No logs found for the given date range")
-
-        # Set up a parser + inject instructions into the prompt template.
-        parser = PydanticOutputParser(pydantic_object=WeekActivities)
-
-        chain = PT_LIST_WEEK_ACTIVITIES | self.model | parser
+        if records is None:
+            records = self.get_records_for_date_range(start_date, end_date)
+        _, chain, response_format = self._listing_chain()
+        logs = self._records_text(records)
+        if self.compact_logs:
+            full_tokens, compact_tokens = count_tokens(_full_text(records)), count_tokens(logs)
+            logger.info(
+                f"Compacted {len(records)} records of week {year}-W{week_number} from {full_tokens} to "
+                f"{compact_tokens} tokens ({1 - compact_tokens / max(full_tokens, 1):.0%} less)"
+            )
+        additional_explanations = self.glossary.select(logs, self.glossary_max_tokens)
 
-        activities = chain.invoke(
+        activities = await chain.ainvoke(
             {
-                "age": self.student_age,
-                "additional_explanations": self.additional_explanations,
-                "logs": "".join([log.str_fmt() for log in logs]),
-                "known_subjects": str(list(sorted(self.load_curricula().keys()))),
-                "response_format": parser.get_format_instructions(),
+                "age": self.student_age_on(start_date),
+                "additional_explanations": additional_explanations,
+                "logs": logs,
+                "known_subjects": self._known_subjects(),
+                "response_format": response_format,
                 "response_language": OUTPUT_LANGUAGE,
-            }
+            },
+            config=stage_config("week_listing"),
         )
 
-        summary = self.model.invoke(
-            PT_SUMMARIZE_WEEK.template.format(
-                age=self.student_age,
-                additional_explanations=self.additional_explanations,
-                activities=activities.str_fmt(),
-                response_language=OUTPUT_LANGUAGE,
+        summary_prompt = select_prompt(PT_SUMMARIZE_WEEK, PT_SUMMARIZE_WEEK_PREFIX_STABLE, self.prompt_layout)
+        summary = (
+            await self.model.ainvoke(
+                summary_prompt.template.format(
+                    age=self.student_age_on(start_date),
+                    additional_explanations=additional_explanations,
+                    activities=activities.str_fmt(),
+                    response_language=OUTPUT_LANGUAGE,
+                ),
+                config=stage_config("week_summary"),
             )
         ).content
 
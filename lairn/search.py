@@ -0,0 +1,255 @@
+"""Full-text search over logs, artifacts, Sofatutor activities and the crawled Sofatutor videos.
+
+Documents live in an SQLite database with an FTS5 index, ranked with BM25 and titles weighted
+above texts. The index remembers the modification time and size of every source file and only
+re-reads new, changed and removed files on ``update``, so keeping it current while logs and
+activities arrive costs a directory scan. The video sheet is a single file with all crawled
+videos and is only read again when it changed.
+
+Queries are plain words by default, every word must match as a prefix of a token, so ``Einmaleins``
+also finds ``Einmaleinsreihe``. Tokens are case and diacritic insensitive.
+"""
+
+import os
+import sqlite3
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Callable, Iterator
+
+from loguru import logger
+from pydantic import BaseModel
+
+from lairn.tracing import traced
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    signature TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    path TEXT NOT NULL,
+    key TEXT NOT NULL,
+    date TEXT,
+    title TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_path ON documents (path);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5 (
+    title, text, content='documents', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS documents_insert AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, title, text) VALUES (new.id, new.title, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_delete AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+END;
+"""
+
+# Weights of the title and text columns in the BM25 rank
+TITLE_WEIGHT = 2.0
+TEXT_WEIGHT = 1.0
+
+# (key, date, title, text) of a document
+Document = tuple[str, str | None, str, str]
+
+
+class SearchHit(BaseModel):
+    source: str
+    path: str
+    key: str
+    date: str | None
+    title: str
+    snippet: str
+    score: float
+
+
+@dataclass(frozen=True)
+class Source:
+    """Files of one kind, ``parse`` returns the documents of a file."""
+
+    name: str
+    directory: Path
+    pattern: str
+    parse: Callable[[Path], list[Document]]
+
+
+def _join(*parts: str | None, separator: str = "\n") -> str:
+    return separator.join(part for part in parts if part)
+
+
+def parse_log(path: Path) -> list[Document]:
+    from lairn.learn_log import LearnLogMessage
+
+    log = LearnLogMessage.from_json_file(path)
+    return [(path.name, log.timestamp.date().isoformat(), log.user, log.text)]
+
+
+def parse_artifact(path: Path) -> list[Document]:
+    from lairn.learn_artifact import LearnLogArtifact
+
+    artifact = LearnLogArtifact.model_validate_json(path.read_text())
+    title = _join(artifact.school_subject, ", ".join(artifact.tags), separator=" | ")
+    return [(path.name, artifact.date, title, artifact.content)]
+
+
+def parse_activity(path: Path) -> list[Document]:
+    from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity
+
+    activity = SofatutorLearningActivity.from_json_file(path)
+    title = _join(activity.subject_label, activity.title, separator=" | ")
+    return [
+        (path.name, activity.date_ref.isoformat(), title, _join(activity.topic_chain, activity.description))
+    ]
+
+
+def parse_video_sheet(path: Path) -> list[Document]:
+    from lairn.integrations.sofatutor.ingest import load_sofa_videos
+
+    videos = load_sofa_videos(path.parent)
+    documents = {}
+    for video in videos.to_dict("records"):
+        text = [str(video.get(column) or "") for column in ("topic_chain", "description", "transcript")]
+        # A video is listed once per school year it relates to
+        documents[video["url"]] = (
+            video["url"],
+            None,
+            _join(video["subject"], video["title"], separator=" | "),
+            _join(*text),
+        )
+    return list(documents.values())
+
+
+def default_sources(context) -> list[Source]:
+    """The searchable sources of a ``ContextMixinClassLevel2``."""
+    from lairn.integrations import sofatutor
+
+    return [
+        Source("log", context.LOGS_PATH, "*.json", parse_log),
+        Source("artifact", context.ARTIFACTS_PATH, "*.json", parse_artifact),
+        Source("sofatutor", context.SOFA_PATH, "*.json", parse_activity),
+        Source("video", sofatutor.SOFA_DIR / "sofatutor_parsed", "sofatutor_videos.xlsx", parse_video_sheet),
+    ]
+
+
+def _signatures(source: Source) -> dict[str, str]:
+    if not source.directory.is_dir():
+        return {}
+    signatures = {}
+    with os.scandir(source.directory) as entries:
+        for entry in entries:
+            if Path(entry.name).match(source.pattern) and entry.is_file():
+                stat = entry.stat()
+                signatures[entry.path] = f"{stat.st_mtime_ns}:{stat.st_size}"
+    return signatures
+
+
+def match_expression(query: str) -> str:
+    """FTS5 expression requiring every word of ``query`` as a token prefix."""
+    words = [word.replace('"', '""') for word in query.split()]
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class SearchIndex:
+    def __init__(self, db_path: Path, sources: list[Source]):
+        self.db_path = Path(db_path)
+        self.sources = sources
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _update_source(self, source: Source) -> int:
+        signatures = _signatures(source)
+        indexed = dict(
+            self.connection.execute("SELECT path, signature FROM files WHERE source = ?", (source.name,))
+        )
+        changed = [
+            path for path in signatures.keys() | indexed.keys() if signatures.get(path) != indexed.get(path)
+        ]
+        for path in changed:
+            self.connection.execute("DELETE FROM documents WHERE path = ?", (path,))
+            self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            if path not in signatures:
+                continue
+            try:
+                documents = source.parse(Path(path))
+            except Exception:
+                # Not indexed, so the next update tries again
+                logger.warning(f"Could not index {path}")
+                continue
+            self.connection.executemany(
+                "INSERT INTO documents (source, path, key, date, title, text) VALUES (?, ?, ?, ?, ?, ?)",
+                [(source.name, path, *document) for document in documents],
+            )
+            self.connection.execute(
+                "INSERT INTO files (path, source, signature) VALUES (?, ?, ?)",
+                (path, source.name, signatures[path]),
+            )
+        return len(changed)
+
+    @traced()
+    def update(self) -> int:
+        """Index new and changed files and drop removed ones, returns the number of files updated."""
+        with self.connection:
+            updated = sum(self._update_source(source) for source in self.sources)
+        if updated:
+            logger.info(f"Updated {updated} files in the search index")
+        return updated
+
+    def _hits(self, rows) -> Iterator[SearchHit]:
+        for source, path, key, day, title, snippet, score in rows:
+            yield SearchHit(
+                source=source, path=path, key=key, date=day, title=title, snippet=snippet, score=-score
+            )
+
+    def search(
+        self,
+        query: str,
+        sources: list[str] | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        limit: int = 20,
+        raw: bool = False,
+    ) -> list[SearchHit]:
+        """Documents matching ``query``, best first.
+
+        ``raw`` passes ``query`` to FTS5 as it is, for its syntax of phrases, ``OR``, ``NOT`` and
+        column filters. Documents without a date, like videos, are excluded by date filters.
+        """
+        expression = query if raw else match_expression(query)
+        if not expression:
+            return []
+        conditions, parameters = ["documents_fts MATCH ?"], [expression]
+        if sources:
+            conditions.append(f"d.source IN ({', '.join('?' * len(sources))})")
+            parameters.extend(sources)
+        if start_date is not None:
+            conditions.append("d.date >= ?")
+            parameters.append(start_date.isoformat())
+        if end_date is not None:
+            # Dates are ISO dates, timestamps of the end date sort after it
+            conditions.append("substr(d.date, 1, 10) <= ?")
+            parameters.append(end_date.isoformat())
+        rows = self.connection.execute(
+            f"""
+            SELECT d.source, d.path, d.key, d.date, d.title,
+                   snippet(documents_fts, 1, '[', ']', ' … ', 12),
+                   bm25(documents_fts, {TITLE_WEIGHT}, {TEXT_WEIGHT}) AS rank
+            FROM documents_fts JOIN documents AS d ON d.id = documents_fts.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (*parameters, limit),
+        )
+        return list(self._hits(rows))
+
+    def stats(self) -> dict[str, int]:
+        """Number of documents per source."""
+        return dict(self.connection.execute("SELECT source, count(*) FROM documents GROUP BY source"))
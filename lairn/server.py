@@ -0,0 +1,227 @@
+"""Local HTTP API for weekly summaries, curricula and activities.
+
+Logs and activities are parsed once into the index of a ``WeekWatcher`` and kept in memory; the
+index is refreshed from changed files at most every ``refresh_interval`` seconds. Responses carry
+an ETag, so clients polling unchanged data get ``304 Not Modified``. Concurrent requests to
+summarize the same week share one LLM job.
+
+Routes:
+
+- ``GET /weeks``: weeks with logs or activities, and whether a summary exists
+- ``GET /weeks/{week}``: saved summary of a week (``2024-W27`` or any date of the week)
+- ``POST /weeks/{week}/summarize``: summarize a week if its inputs changed (or ``?force=true``),
+  ``409 Conflict`` for ``?force=true`` while an unforced job of the week is running
+- ``GET /activities?start=2024-07-01&end=2024-07-07``: logs and Sofatutor activities in a date range
+- ``GET /curricula`` and ``GET /curricula/{subject}``
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable
+
+from aiohttp import web
+from loguru import logger
+
+from lairn.context_mixin import ContextMixinClassLevel2
+from lairn.llm.gateway import llm_priority
+from lairn.reporting.watcher import WatchedWeekSummarizer, WeekWatcher
+from lairn.reporting.week_summarizer import parse_week, week_summary_paths
+
+MAX_CACHED_RESPONSES = 256
+
+
+def _etag(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+@web.middleware
+async def etag_middleware(request: web.Request, handler) -> web.StreamResponse:
+    response = await handler(request)
+    if request.method != "GET" or response.status != 200 or not isinstance(response, web.Response):
+        return response
+    if response.etag is None:
+        response.etag = _etag(response.body)
+    if request.if_none_match and any(tag.value == response.etag.value for tag in request.if_none_match):
+        return web.Response(status=304, headers={"ETag": response.headers["ETag"]})
+    return response
+
+
+def _week_param(request: web.Request) -> date:
+    try:
+        return parse_week(request.match_info["week"])
+    except ValueError as e:
+        raise web.HTTPBadRequest(reason=str(e))
+
+
+def _date_param(request: web.Request, name: str) -> date:
+    try:
+        return date.fromisoformat(request.query[name])
+    except KeyError:
+        raise web.HTTPBadRequest(reason=f"Missing query parameter {name}")
+    except ValueError:
+        raise web.HTTPBadRequest(reason=f"{name} must be an ISO date like 2024-07-01")
+
+
+class LairnServer(ContextMixinClassLevel2):
+    def __init__(self, refresh_interval: float = 2.0, model_name: str | None = None):
+        self.refresh_interval = refresh_interval
+        self.model_name = model_name
+        self.watcher = WeekWatcher()
+        self.summaries_dir = self.WEEKLY_SUMMARIES_PATH
+
+        self.curricula = {}
+        self._summarizer: WatchedWeekSummarizer | None = None
+        self._refreshed_at = 0.0
+        self._responses: OrderedDict[str, tuple[Any, bytes, str]] = OrderedDict()
+        self._summary_files: dict[Path, tuple[int, dict]] = {}
+        # Running summary job and its force flag by week
+        self._jobs: dict[date, tuple[asyncio.Task, bool]] = {}
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[etag_middleware])
+        app.on_startup.append(self._startup)
+        app.add_routes(
+            [
+                web.get("/weeks", self.list_weeks),
+                web.get("/weeks/{week}", self.get_week),
+                web.post("/weeks/{week}/summarize", self.summarize_week),
+                web.get("/activities", self.list_activities),
+                web.get("/curricula", self.list_curricula),
+                web.get("/curricula/{subject}", self.get_curriculum),
+            ]
+        )
+        return app
+
+    async def _startup(self, app: web.Application):
+        self.summaries_dir.mkdir(parents=True, exist_ok=True)
+        self.watcher.build_index()
+        self.curricula = self.load_curricula()
+        self._summarizer = WatchedWeekSummarizer(self.watcher, model_name=self.model_name)
+        self._refreshed_at = time.monotonic()
+
+    def _refresh(self):
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        self._refreshed_at = time.monotonic()
+        if weeks := self.watcher.refresh():
+            logger.info(f"Reloaded changed files of {len(weeks)} weeks")
+
+    def _json(self, key: str, version: Any, build: Callable[[], Any]) -> web.Response:
+        """JSON response of ``build()``, serialized again only when ``version`` changes.
+
+        The ``MAX_CACHED_RESPONSES`` most recently used responses are kept, so clients asking for
+        ever new date ranges do not grow the cache without bound.
+        """
+        cached = self._responses.get(key)
+        if cached is None or cached[0] != version:
+            body = json.dumps(build(), ensure_ascii=False).encode()
+            cached = (version, body, _etag(body))
+            self._responses[key] = cached
+        self._responses.move_to_end(key)
+        while len(self._responses) > MAX_CACHED_RESPONSES:
+            self._responses.popitem(last=False)
+        response = web.Response(body=cached[1], content_type="application/json")
+        response.etag = cached[2]
+        return response
+
+    def _saved_summary(self, monday: date) -> dict | None:
+        path, _ = week_summary_paths(self.summaries_dir, monday)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._summary_files.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, json.loads(path.read_text()))
+            self._summary_files[path] = cached
+        return cached[1]
+
+    async def list_weeks(self, request: web.Request) -> web.Response:
+        self._refresh()
+        summaries = {path.name for path in self.summaries_dir.glob("*.json")}
+
+        def build():
+            weeks = []
+            for monday in sorted(self.watcher.weeks()):
+                year, week_number, _ = monday.isocalendar()
+                weeks.append(
+                    {
+                        "week": f"{year}-W{week_number:02d}",
+                        "start_date": monday.isoformat(),
+                        "end_date": (monday + timedelta(days=6)).isoformat(),
+                        "summary": week_summary_paths(self.summaries_dir, monday)[0].name in summaries,
+                    }
+                )
+            return weeks
+
+        return self._json("weeks", (self.watcher.version, frozenset(summaries)), build)
+
+    async def get_week(self, request: web.Request) -> web.Response:
+        summary = self._saved_summary(_week_param(request))
+        if summary is None:
+            raise web.HTTPNotFound(reason="No summary for this week, POST to /weeks/{week}/summarize")
+        return web.json_response(summary)
+
+    async def _summarize(self, monday: date, force: bool) -> dict:
+        # A client waits for the response, its requests go ahead of backfills sharing the API quota
+        with llm_priority("interactive"):
+            summary = await self._summarizer.aupdate_week(monday, self.summaries_dir, force=force)
+        if summary is None:
+            return self._saved_summary(monday)
+        return summary.model_dump(mode="json")
+
+    async def summarize_week(self, request: web.Request) -> web.Response:
+        monday = _week_param(request)
+        force = request.query.get("force", "false").lower() == "true"
+        self._refresh()
+        # Requests for a week that is already being summarized wait for the running job
+        if monday not in self._jobs:
+            job = asyncio.create_task(self._summarize(monday, force))
+            job.add_done_callback(lambda _: self._jobs.pop(monday, None))
+            self._jobs[monday] = (job, force)
+        job, job_forced = self._jobs[monday]
+        if force and not job_forced:
+            # The running job may keep the saved summary, which is not what a forced request asked for
+            raise web.HTTPConflict(reason="The week is being summarized without force, retry when it is done")
+        try:
+            summary = await asyncio.shield(job)
+        except ValueError as e:
+            raise web.HTTPNotFound(reason=str(e))
+        return web.json_response(summary)
+
+    async def list_activities(self, request: web.Request) -> web.Response:
+        start_date, end_date = _date_param(request, "start"), _date_param(request, "end")
+        self._refresh()
+
+        def build():
+            logs = self._summarizer.get_logs_for_date_range(start_date, end_date)
+            sofa_activities = self._summarizer.get_sofa_activities_for_date_range(start_date, end_date)
+            return {
+                "logs": [log.model_dump(mode="json") for log in sorted(logs, key=lambda log: log.timestamp)],
+                "sofatutor": [
+                    activity.model_dump(mode="json")
+                    for activity in sorted(sofa_activities, key=lambda activity: activity.date_ref)
+                ],
+            }
+
+        return self._json(f"activities/{start_date}/{end_date}", self.watcher.version, build)
+
+    async def list_curricula(self, request: web.Request) -> web.Response:
+        return self._json("curricula", None, lambda: sorted(self.curricula))
+
+    async def get_curriculum(self, request: web.Request) -> web.Response:
+        subject = request.match_info["subject"]
+        if subject not in self.curricula:
+            raise web.HTTPNotFound(reason=f"Unknown subject {subject}")
+        return self._json(
+            f"curricula/{subject}", None, lambda: self.curricula[subject].model_dump(mode="json")
+        )
+
+
+def serve(host: str = "127.0.0.1", port: int = 8080, **kwargs):
+    web.run_app(LairnServer(**kwargs).app(), host=host, port=port)
@@ -0,0 +1,285 @@
+import atexit
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable
+
+from lairn.config import TRACE_FILE
+
+
+class Span:
+    __slots__ = ("name", "category", "span_id", "parent", "start", "end", "attributes", "thread_id")
+
+    def __init__(self, name: str, category: str, span_id: int, parent: "Span | None", attributes: dict):
+        self.name = name
+        self.category = category
+        self.span_id = span_id
+        self.parent = parent
+        self.attributes = attributes
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def is_descendant_of(self, other: "Span") -> bool:
+        parent = self.parent
+        while parent is not None:
+            if parent is other:
+                return True
+            parent = parent.parent
+        return False
+
+
+class SpanListener:
+    """Receives spans as they start and end, e.g. to measure resources per span."""
+
+    def on_span_start(self, span: Span):
+        pass
+
+    def on_span_end(self, span: Span):
+        pass
+
+
+_current_span: ContextVar[Span | None] = ContextVar("lairn_current_span", default=None)
+
+
+class Tracer:
+    """Collects spans in memory and exports them as a Chrome trace (``chrome://tracing``, Perfetto)."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self.origin = time.perf_counter()
+        self.listeners: list[SpanListener] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, category: str, attributes: dict) -> Span:
+        span = Span(name, category, next(self._ids), _current_span.get(), attributes)
+        with self._lock:
+            self.spans.append(span)
+        for listener in self.listeners:
+            listener.on_span_start(span)
+        return span
+
+    def end_span(self, span: Span):
+        span.end = time.perf_counter()
+        for listener in self.listeners:
+            listener.on_span_end(span)
+
+    def _lanes(self, spans: list[Span]) -> dict[int, int]:
+        """Assign spans to display lanes so that spans within a lane are properly nested.
+
+        Concurrent asyncio tasks run on one thread, but trace viewers require the events of one
+        ``tid`` to nest. A span stays in its parent's lane unless a concurrent sibling occupies it.
+        """
+        lanes: list[list[Span]] = []
+        assignment = {}
+        for span in sorted(spans, key=lambda s: (s.start, -(s.end or 0))):
+            for lane_id, stack in enumerate(lanes):
+                while stack and stack[-1].end is not None and stack[-1].end <= span.start:
+                    stack.pop()
+                if not stack or span.is_descendant_of(stack[-1]):
+                    stack.append(span)
+                    assignment[span.span_id] = lane_id
+                    break
+            else:
+                lanes.append([span])
+                assignment[span.span_id] = len(lanes) - 1
+        return assignment
+
+    def critical_path(self) -> list[Span]:
+        """Return the spans that determined the wall time of the longest root span.
+
+        Within a span, the path walks back from its end: the child that finished last, then the
+        child that finished last before that one started, and so on. Concurrent siblings that
+        finished earlier are off the path. The same is applied recursively to every child on it.
+        """
+        finished = [span for span in self.spans if span.end is not None]
+        children: dict[int, list[Span]] = {}
+        for span in finished:
+            if span.parent is not None:
+                children.setdefault(span.parent.span_id, []).append(span)
+
+        def path_of(span: Span) -> list[Span]:
+            blocking = []
+            until = span.end
+            candidates = children.get(span.span_id, [])
+            while True:
+                preceding = [child for child in candidates if child.end <= until]
+                if not preceding:
+                    break
+                child = max(preceding, key=lambda s: s.end)
+                blocking.append(child)
+                until = child.start
+            return [span] + [s for child in reversed(blocking) for s in path_of(child)]
+
+        roots = [span for span in finished if span.parent is None]
+        if not roots:
+            return []
+        return path_of(max(roots, key=lambda s: s.duration))
+
+    def peak_concurrency(self) -> dict[str, int]:
+        """Maximum number of simultaneously open spans per span name."""
+        events = []
+        for span in self.spans:
+            if span.end is not None:
+                events.append((span.start, 1, span.name))
+                events.append((span.end, -1, span.name))
+
+        open_spans: dict[str, int] = {}
+        peak: dict[str, int] = {}
+        for _, delta, name in sorted(events, key=lambda e: (e[0], e[1])):
+            open_spans[name] = open_spans.get(name, 0) + delta
+            peak[name] = max(peak.get(name, 0), open_spans[name])
+        return peak
+
+    def summary(self) -> dict:
+        stats: dict[str, dict] = {}
+        for span in self.spans:
+            if span.end is None:
+                continue
+            entry = stats.setdefault(span.name, {"count": 0, "total_time": 0.0, "max_time": 0.0})
+            entry["count"] += 1
+            entry["total_time"] += span.duration
+            entry["max_time"] = max(entry["max_time"], span.duration)
+
+        for name, peak in self.peak_concurrency().items():
+            stats[name]["peak_concurrency"] = peak
+
+        return {
+            "spans": stats,
+            "critical_path": [
+                {"name": span.name, "duration": span.duration, **span.attributes}
+                for span in self.critical_path()
+            ],
+        }
+
+    def export_chrome_trace(self, path: str | Path):
+        spans = [span for span in self.spans if span.end is not None]
+        lanes = self._lanes(spans)
+        events = [
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": (span.start - self.origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": os.getpid(),
+                "tid": lanes[span.span_id],
+                "args": {key: str(value) for key, value in span.attributes.items()},
+            }
+            for span in spans
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "otherData": self.summary()}, f)
+
+
+_TRACER: Tracer | None = None
+
+
+class _NullSpan:
+    """Returned by ``span`` while tracing is disabled, so that disabled tracing costs one check."""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ActiveSpan:
+    __slots__ = ("tracer", "name", "category", "attributes", "span", "token")
+
+    def __init__(self, tracer: Tracer, name: str, category: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        self.span = self.tracer.start_span(self.name, self.category, self.attributes)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.span.attributes["error"] = exc_type.__name__
+        self.tracer.end_span(self.span)
+        _current_span.reset(self.token)
+        return False
+
+
+def span(name: str, category: str = "lairn", **attributes):
+    """Context manager recording a span around a block of code, nested under the current span."""
+    tracer = _TRACER
+    if tracer is None:
+        return _NULL_SPAN
+    return _ActiveSpan(tracer, name, category, attributes)
+
+
+def traced(name: str | None = None) -> Callable:
+    """Decorator recording a span around every call of a (sync or async) function."""
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+        category = func.__module__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                tracer = _TRACER
+                if tracer is None:
+                    return await func(*args, **kwargs)
+                with _ActiveSpan(tracer, span_name, category, {}):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> Any:
+            tracer = _TRACER
+            if tracer is None:
+                return func(*args, **kwargs)
+            with _ActiveSpan(tracer, span_name, category, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def enable_tracing(trace_file: str | Path | None = None) -> Tracer:
+    """Start collecting spans. If ``trace_file`` is given, the trace is written there at exit."""
+    global _TRACER
+    _TRACER = Tracer()
+    if trace_file is not None:
+        atexit.register(_TRACER.export_chrome_trace, trace_file)
+    return _TRACER
+
+
+def disable_tracing() -> Tracer | None:
+    """Stop collecting spans and return the tracer holding the spans collected so far."""
+    global _TRACER
+    tracer, _TRACER = _TRACER, None
+    return tracer
+
+
+def get_tracer() -> Tracer | None:
+    return _TRACER
+
+
+if TRACE_FILE:
+    enable_tracing(TRACE_FILE)
@@ -0,0 +1,417 @@
+import json
+import subprocess
+import sys
+
+import click
+
+from lairn.common import count_tokens
+from lairn.curriculum.models import Curriculum, LearningTargetExamples
+from lairn.curriculum.quiz import MultipleChoiceQuiz
+from lairn.llm.structured import NATIVE_RESPONSE_FORMAT, json_schema_response_format
+from lairn.reporting.models import WeekActivities
+
+STRUCTURED_OUTPUT_SCHEMAS = [Curriculum, LearningTargetExamples, WeekActivities, MultipleChoiceQuiz]
+
+# Import time budgets in seconds for modules that short commands depend on
+IMPORT_TIME_BUDGETS = {
+    "lairn.config": 0.05,
+    "lairn.common": 0.05,
+    "lairn.context_mixin": 0.05,
+    "lairn.tracing": 0.05,
+    "lairn.cli": 0.1,
+    "lairn.learn_log": 0.3,
+    "lairn.learn_artifact": 0.3,
+    "lairn.reporting.models": 0.3,
+    "lairn.integrations.sofatutor.activity_list_parser": 0.3,
+}
+
+_IMPORT_TIMER = (
+    "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+)
+
+
+@click.group()
+def cli():
+    """Benchmarks for the LLM pipelines."""
+
+
+@cli.command()
+def structured_output():
+    """Input tokens per call spent on response format instructions, parser vs. native mode."""
+    from langchain_core.output_parsers import PydanticOutputParser
+
+    native_tokens = count_tokens(NATIVE_RESPONSE_FORMAT)
+
+    click.echo(f"{'schema':<24} {'parser':>8} {'native':>8} {'saved':>8} {'schema':>8}")
+    for schema in STRUCTURED_OUTPUT_SCHEMAS:
+        parser_tokens = count_tokens(PydanticOutputParser(pydantic_object=schema).get_format_instructions())
+        schema_tokens = count_tokens(json.dumps(json_schema_response_format(schema)["json_schema"]["schema"]))
+        click.echo(
+            f"{schema.__name__:<24} {parser_tokens:>8} {native_tokens:>8} "
+            f"{parser_tokens - native_tokens:>8} {schema_tokens:>8}"
+        )
+    click.echo(
+        "\nparser/native: prompt tokens for the {response_format} variable per call. "
+        "schema: size of the JSON schema sent as response_format in native mode."
+    )
+
+
+def _import_time(module: str) -> float:
+    """Import time of a module in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-c", _IMPORT_TIMER.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+@cli.command()
+@click.option("--repeat", type=int, default=3, help="Imports per module, the fastest one counts")
+@click.option("--detail", default=None, help="Also list the slowest imports pulled in by this module")
+def import_time(repeat, detail):
+    """Import time of the lairn modules against their budgets, exits with 1 on a regression."""
+    failed = []
+    click.echo(f"{'module':<52} {'seconds':>8} {'budget':>8}")
+    for module, budget in IMPORT_TIME_BUDGETS.items():
+        seconds = min(_import_time(module) for _ in range(repeat))
+        marker = "" if seconds <= budget else "  OVER BUDGET"
+        click.echo(f"{module:<52} {seconds:>8.3f} {budget:>8.3f}{marker}")
+        if seconds > budget:
+            failed.append(module)
+
+    if detail is not None:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {detail}"], capture_output=True, text=True
+        )
+        # Lines look like "import time:   self [us] |  cumulative | imported package"
+        rows = []
+        for line in result.stderr.splitlines()[1:]:
+            _, self_us, cumulative_us, name = [part.strip() for part in line.replace(":", "|", 1).split("|")]
+            rows.append((int(cumulative_us), int(self_us), name))
+        click.echo(f"\n{'cumulative s':>12} {'self s':>8}  import (slowest below {detail})")
+        for cumulative_us, self_us, name in sorted(rows, reverse=True)[:15]:
+            click.echo(f"{cumulative_us / 1e6:>12.3f} {self_us / 1e6:>8.3f}  {name}")
+
+    if failed:
+        raise click.ClickException(f"Import time over budget: {', '.join(failed)}")
+
+
+@cli.command()
+def glossary():
+    """Tokens of the additional explanations per weekly prompt, whole file vs. entries relevant to the week."""
+    from datetime import timedelta
+
+    from lairn.reporting.week_summarizer import WeekSummarizer, week_start
+
+    summarizer = WeekSummarizer()
+    full_tokens = count_tokens(summarizer.additional_explanations)
+    mondays = sorted({week_start(log.timestamp.date()) for log in summarizer.load_logs()})
+
+    click.echo(f"{'week':<10} {'records':>8} {'full':>8} {'relevant':>8}")
+    for monday in mondays:
+        records = summarizer.get_records_for_date_range(monday, monday + timedelta(days=6))
+        relevant_tokens = count_tokens(summarizer.relevant_explanations(records))
+        click.echo(f"{monday.isoformat():<10} {len(records):>8} {full_tokens:>8} {relevant_tokens:>8}")
+    click.echo("\nTokens are counted once per prompt, the week listing and the week summary each send them.")
+
+
+@cli.command()
+def compaction():
+    """Tokens of the logs and activities in the week listing prompt, one block per record vs. compacted."""
+    from datetime import timedelta
+
+    from lairn.reporting.compaction import compact_records
+    from lairn.reporting.week_summarizer import WeekSummarizer, week_start
+
+    summarizer = WeekSummarizer()
+    mondays = sorted({week_start(log.timestamp.date()) for log in summarizer.load_logs()})
+
+    click.echo(f"{'week':<10} {'records':>8} {'full':>8} {'compact':>8} {'saved':>6}")
+    totals = [0, 0]
+    for monday in mondays:
+        records = summarizer.get_records_for_date_range(monday, monday + timedelta(days=6))
+        full = count_tokens("".join(record.str_fmt() for record in records))
+        compact = count_tokens(compact_records(records))
+        totals = [totals[0] + full, totals[1] + compact]
+        click.echo(
+            f"{monday.isoformat():<10} {len(records):>8} {full:>8} {compact:>8} {1 - compact / full:>6.0%}"
+        )
+    click.echo(
+        f"{'total':<10} {'':>8} {totals[0]:>8} {totals[1]:>8} {1 - totals[1] / max(totals[0], 1):>6.0%}"
+    )
+
+
+def _latency_percentiles(latencies: list[float]) -> tuple[float, float, float]:
+    import numpy as np
+
+    return tuple(float(value) for value in np.percentile(latencies, [50, 95, 99]))
+
+
+@cli.command()
+@click.option("--requests", "num_requests", type=int, default=1000, help="Requests per run")
+@click.option("--concurrency", type=int, default=20, help="Requests in flight at the same time")
+@click.option("--percentile", type=float, default=95.0, help="Hedging percentile")
+@click.option("--budget", type=float, default=0.05, help="Hedges per request")
+@click.option("--straggler-rate", type=float, default=0.03, help="Share of requests that are 10x slower")
+@click.option("--scale", type=float, default=0.01, help="Median latency of the simulated model in seconds")
+def hedging(num_requests, concurrency, percentile, budget, straggler_rate, scale):
+    """p50/p95/p99 latency of LLM requests with and without hedging, against a model with stragglers."""
+    import asyncio
+    import random
+    import time
+
+    from lairn.llm.fake import FakeChatModel
+    from lairn.llm.gateway import LLMGateway
+    from lairn.llm.telemetry import TELEMETRY
+    from langchain_core.messages import HumanMessage
+
+    class StragglingModel(FakeChatModel):
+        """Log-normal latencies, with a share of requests that stall as if queued at the provider."""
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            latency = scale * random.lognormvariate(0, 0.3)
+            if random.random() < straggler_rate:
+                latency *= 10
+            await asyncio.sleep(latency)
+            return self._respond(messages, kwargs.get("response_format"))
+
+    async def run(hedge_percentile: float) -> tuple[list[float], float]:
+        random.seed(0)
+        gateway = LLMGateway(concurrency=0, hedge_percentile=hedge_percentile, hedge_budget=budget)
+        model = StragglingModel()
+        latencies = []
+
+        # Workers send their requests one after another, like the calls of a stage under a concurrency limit
+        async def worker(requests: range):
+            for i in requests:
+                start = time.monotonic()
+                await gateway.agenerate(model, [HumanMessage(content=f"request {i}")], stage="benchmark")
+                latencies.append(time.monotonic() - start)
+
+        start = time.monotonic()
+        await asyncio.gather(*[worker(range(w, num_requests, concurrency)) for w in range(concurrency)])
+        return latencies, time.monotonic() - start
+
+    click.echo(
+        f"{'':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'total s':>8} {'hedges':>7}"
+    )
+    for label, hedge_percentile in (("plain", 0.0), ("hedged", percentile)):
+        TELEMETRY.reset()
+        latencies, total = asyncio.run(run(hedge_percentile))
+        p50, p95, p99 = _latency_percentiles(latencies)
+        click.echo(
+            f"{label:<10} {p50 * 1e3:>8.1f} {p95 * 1e3:>8.1f} {p99 * 1e3:>8.1f} {max(latencies) * 1e3:>8.1f} "
+            f"{total:>8.2f} {TELEMETRY.hedged_requests['benchmark']:>7}"
+        )
+    click.echo(f"\nHedging at p{percentile:g} with a budget of {budget:.0%} extra requests.")
+
+
+@cli.command()
+@click.option("--backfill", "num_backfill", type=int, default=400, help="Queued backfill requests")
+@click.option(
+    "--interactive", "num_interactive", type=int, default=10, help="On-demand jobs during the backfill"
+)
+@click.option("--concurrency", type=int, default=8, help="Concurrency limit of the gateway")
+@click.option("--rpm", type=int, default=0, help="Requests per minute limit of the gateway, 0 for none")
+@click.option("--latency", type=float, default=0.02, help="Latency of the simulated model in seconds")
+def priority(num_backfill, num_interactive, concurrency, rpm, latency):
+    """Latency of on-demand jobs of two requests each while a backfill queues, with and without priorities."""
+    import asyncio
+    import time
+
+    from lairn.llm.fake import FakeChatModel
+    from lairn.llm.gateway import LLMGateway, llm_priority
+    from langchain_core.messages import HumanMessage
+
+    model = FakeChatModel(latency=latency)
+
+    async def run(backfill_priority: str | None) -> tuple[list[float], float]:
+        gateway = LLMGateway(concurrency=concurrency, rpm=rpm)
+
+        async def request(text: str):
+            await gateway.agenerate(model, [HumanMessage(content=text)], stage="benchmark")
+
+        async def backfill():
+            with llm_priority(backfill_priority or "normal"):
+                await asyncio.gather(*[request(f"backfill {i}") for i in range(num_backfill)])
+
+        async def interactive(i: int) -> float:
+            # Spread over the first half of the backfill, each like summarize_week: a listing, then a summary
+            await asyncio.sleep(i / num_interactive * latency * num_backfill / concurrency / 2)
+            with llm_priority("interactive" if backfill_priority else "normal"):
+                start = time.monotonic()
+                await request(f"listing {i}")
+                await request(f"summary {i}")
+                return time.monotonic() - start
+
+        start = time.monotonic()
+        backfill_task = asyncio.ensure_future(backfill()) if backfill_priority != "none" else None
+        latencies = await asyncio.gather(*[interactive(i) for i in range(num_interactive)])
+        if backfill_task is not None:
+            await backfill_task
+        return list(latencies), time.monotonic() - start
+
+    click.echo(f"{'':<14} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'total s':>8}")
+    runs = (("idle", "none"), ("fifo", None), ("prioritized", "backfill"))
+    for label, backfill_priority in runs:
+        latencies, total = asyncio.run(run(backfill_priority))
+        p50, p95, _ = _latency_percentiles(latencies)
+        click.echo(
+            f"{label:<14} {p50 * 1e3:>8.1f} {p95 * 1e3:>8.1f} {max(latencies) * 1e3:>8.1f} {total:>8.2f}"
+        )
+    click.echo(
+        f"\nLatency of {num_interactive} on-demand jobs while {num_backfill} backfill requests queue for "
+        f"{concurrency} slots; idle runs the jobs alone, fifo gives both the same priority."
+    )
+
+
+# Simulated response time per model: (seconds to the first token, seconds per output token)
+SIMULATED_SPEEDS = {
+    "gpt-4.1-nano": (0.3, 0.004),
+    "gpt-4o-mini": (0.5, 0.008),
+    "gpt-4.1-mini": (0.5, 0.008),
+    "gpt-4o": (0.7, 0.012),
+    "gpt-4.1": (0.7, 0.012),
+}
+
+
+@cli.command()
+@click.option("--model", "model_name", default="gpt-4o-mini", help="Model of the requests without routing")
+@click.option("--policy", default="default", help="Routing policy, default or a JSON policy file")
+@click.option("--scale", type=float, default=0.01, help="Factor for the simulated latencies")
+@click.option("--failure-rate", type=float, default=0.1, help="Share of invalid outputs of the nano model")
+def routing(model_name, policy, scale, failure_rate):
+    """Latency and cost of all weekly summaries with one model vs. routed by stage and prompt size.
+
+    The weeks of MAIN_DIR run against a simulated model with the speed of the model each request is
+    routed to, whose smallest model fails validation at ``failure_rate`` to exercise escalation.
+    """
+    import asyncio
+    import random
+    import time
+    from datetime import timedelta
+
+    from lairn.llm.fake import FakeChatModel
+    from lairn.llm.gateway import GatewayChatModel, LLMGateway
+    from lairn.llm.routing import use_routing
+    from lairn.llm.telemetry import LLMTelemetry
+    from lairn.reporting.week_summarizer import WeekSummarizer, week_start
+
+    class SimulatedModel(FakeChatModel):
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            result = self._respond(messages, kwargs.get("response_format"))
+            first_token, per_token = SIMULATED_SPEEDS.get(self.model_name, SIMULATED_SPEEDS["gpt-4o-mini"])
+            completion_tokens = result.llm_output["token_usage"]["completion_tokens"]
+            await asyncio.sleep((first_token + per_token * completion_tokens) * scale)
+            message = result.generations[0].message
+            repair = "JSON output repair" in str(messages[0].content)
+            if self.model_name.endswith("nano") and not repair and random.random() < failure_rate:
+                # A truncated object, as from a model that lost track of the schema
+                message.content = message.content[: len(message.content) // 2]
+            return result
+
+    summarizer = WeekSummarizer()
+    mondays = sorted({week_start(log.timestamp.date()) for log in summarizer.load_logs()})
+
+    async def run(telemetry: LLMTelemetry) -> float:
+        random.seed(0)
+        summarizer.model = GatewayChatModel(
+            model=SimulatedModel(model_name=model_name), gateway=LLMGateway(), callbacks=[telemetry]
+        )
+        start = time.monotonic()
+        await asyncio.gather(
+            *[summarizer.asummarize_week(monday, monday + timedelta(days=6)) for monday in mondays]
+        )
+        return time.monotonic() - start
+
+    click.echo(
+        f"{'':<8} {'calls':>6} {'repairs':>8} {'p50 ms':>8} {'p95 ms':>8} {'total s':>8} {'cost $':>9}  models"
+    )
+    for label, spec in (("single", None), ("routed", policy)):
+        use_routing(spec)
+        telemetry = LLMTelemetry(keep_records=True)
+        total = asyncio.run(run(telemetry))
+        records = telemetry.records
+        p50, p95, _ = _latency_percentiles([record.latency for record in records])
+        models = {}
+        for record in records:
+            models[record.model_name] = models.get(record.model_name, 0) + 1
+        click.echo(
+            f"{label:<8} {len(records):>6} {sum(record.repair for record in records):>8} {p50 * 1e3:>8.1f} "
+            f"{p95 * 1e3:>8.1f} {total:>8.2f} {sum(record.cost for record in records):>9.5f}  "
+            + ", ".join(f"{count}x {name}" for name, count in sorted(models.items()))
+        )
+    use_routing(None)
+    click.echo(f"\n{len(mondays)} weeks, latencies simulated at {scale:g}x the modelled response times.")
+
+
+def _synthetic_logs(years: int) -> list:
+    from datetime import datetime, timedelta
+
+    from lairn.learn_log import LearnLogMessage
+
+    start = datetime(2024 - years, 8, 1, 8)
+    # Five logs per school day, like a busy homeschooling log
+    return [
+        LearnLogMessage(
+            user=("Anna", "Ben")[i % 2],
+            timestamp=start + timedelta(days=i // 5, hours=i % 5),
+            text=f"Mathe: Aufgabe {i} zu Brüchen gelöst",
+        )
+        for i in range(years * 365 * 5)
+    ]
+
+
+@cli.command()
+@click.option("--years", type=int, default=5, help="Years of synthetic logs")
+@click.option("--queries", type=int, default=200, help="Week queries to time")
+def log_table(years, queries):
+    """Memory per log and week query time of a list of log models vs. the columnar log table."""
+    import time
+    import tracemalloc
+    from datetime import timedelta
+
+    from lairn.reporting.log_table import LogTable
+
+    tracemalloc.start()
+    logs = _synthetic_logs(years)
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    table = LogTable.from_logs(logs)
+    tracemalloc.stop()
+
+    first = logs[0].timestamp.date()
+    weeks = [first + timedelta(weeks=i % (years * 52)) for i in range(queries)]
+
+    start = time.perf_counter()
+    for monday in weeks:
+        end = monday + timedelta(days=6)
+        [log for log in logs if monday <= log.timestamp.date() <= end]
+    list_seconds = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    for monday in weeks:
+        table.range_indices(monday, monday + timedelta(days=6))
+    search_seconds = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    for monday in weeks:
+        list(table.between(monday, monday + timedelta(days=6)))
+    table_seconds = (time.perf_counter() - start) / queries
+
+    click.echo(f"{len(logs)} logs over {years} years, {queries} week queries")
+    click.echo(f"{'':<8} {'bytes/log':>10} {'ms/query':>10} {'ms/search':>10}")
+    click.echo(
+        f"{'list':<8} {list_bytes / len(logs):>10.0f} {list_seconds * 1e3:>10.3f} {list_seconds * 1e3:>10.3f}"
+    )
+    click.echo(
+        f"{'table':<8} {table.nbytes / len(logs):>10.0f} {table_seconds * 1e3:>10.3f} {search_seconds * 1e3:>10.3f}"
+    )
+    click.echo(
+        "\nms/query: including the models of the week, ms/search: finding the records of the week only."
+    )
+
+
+if __name__ == "__main__":
+    cli()
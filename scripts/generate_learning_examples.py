@@ -2,26 +2,12 @@ import asyncio
 import json
 import os
 
-import openai
+from loguru import logger
 
 from lairn.config import MAIN_DIR
-from lairn.curriculum.generate_learning_examples import LearningExampleGenerator
+from lairn.curriculum.generate_learning_examples import LearningExampleGenerator, results_to_markdown_string
 from lairn.curriculum.load import load_curricula
-from lairn.curriculum.models import LearningTargetExamples
-
-
-def results_to_markdown_string(subject: str, results: list[LearningTargetExamples]) -> str:
-    md_str = f"# {subject}\n\n"
-    section = ""
-    for res in results:
-        if res.section != section:
-            md_str += f"\n## {res.section}\n\n"
-            section = res.section
-
-        md_str += f"\n### {res.learning_target}\n\n"
-        for example in res.examples:
-            md_str += f"  - {example}\n"
-    return md_str
+from lairn.llm.telemetry import TELEMETRY
 
 
 async def main():
@@ -45,6 +31,7 @@ async def main():
         results = await generator.create_examples(
             curriculum=curriculum,
             num_examples=5,
+            batched=True,
         )
 
         md = results_to_markdown_string(subject, results)
@@ -52,19 +39,9 @@ async def main():
         with open(out_path, "w") as f:
             f.write(md)
 
-
-async def main_safe():
-    """Same as main, but waits 5seconds and retries in case of
-    openai.RateLimitError"""
-    while True:
-        try:
-            await main()
-            break
-        except openai.RateLimitError:
-            print("Rate limit error, waiting 5 seconds")
-            await asyncio.sleep(5)
+    logger.info(TELEMETRY.summary())
 
 
 # Run the main function using asyncio
 if __name__ == "__main__":
-    asyncio.run(main_safe())
+    asyncio.run(main())
@@ -1,10 +1,11 @@
 import asyncio
 import os
 
-import openai
+from loguru import logger
 
 from lairn.config import MAIN_DIR
 from lairn.curriculum.curriculum_parser import CurriculumParser
+from lairn.llm.telemetry import TELEMETRY
 
 
 async def main():
@@ -26,19 +27,9 @@ async def main():
         curriculum = await parser.parse_curriculum(summary)
         out_path.write_text(curriculum.json())
 
-
-async def main_safe():
-    """Same as main, but waits 5seconds and retries in case of
-    openai.RateLimitError"""
-    while True:
-        try:
-            await main()
-            break
-        except openai.RateLimitError:
-            print("Rate limit error, waiting 5 seconds")
-            await asyncio.sleep(5)
+    logger.info(TELEMETRY.summary())
 
 
 # Run the main function using asyncio
 if __name__ == "__main__":
-    asyncio.run(main_safe())
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import click
+from dotenv import load_dotenv
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("script")
+@click.argument("script_args", nargs=-1, type=click.UNPROCESSED)
+@click.option(
+    "--output-dir", type=click.Path(path_type=Path), default=None, help="Defaults to profiles/<script>-<time>"
+)
+@click.option("--live", is_flag=True, help="Call the configured LLM instead of the offline fake model")
+@click.option(
+    "--latency", type=float, default=0.0, help="Simulated response time of the fake model in seconds"
+)
+@click.option(
+    "--in-place", is_flag=True, help="Run on MAIN_DIR itself instead of a scratch copy (outputs are kept)"
+)
+@click.option("--top", type=int, default=15, help="Number of hot spots and allocation sites per section")
+def main(script, script_args, output_dir, live, latency, in_place, top):
+    """Profile SCRIPT (e.g. summarize_week) for CPU hot spots and memory per pipeline stage."""
+    # The configuration is read on import, so it is adjusted before importing lairn
+    load_dotenv()
+    if not live:
+        os.environ["LLM"] = "fake"
+        os.environ["FAKE_LLM_LATENCY"] = str(latency)
+    if not in_place:
+        # Scripts write their results next to their inputs, keep dummy outputs out of the real data
+        scratch_dir = Path(tempfile.mkdtemp(prefix="lairn-profile-")) / "data"
+        shutil.copytree(os.environ["MAIN_DIR"], scratch_dir)
+        os.environ["MAIN_DIR"] = str(scratch_dir)
+
+    from lairn.profiling import PipelineProfiler
+
+    if output_dir is None:
+        output_dir = Path("profiles") / f"{Path(script).stem}-{datetime.now():%Y%m%d-%H%M%S}"
+
+    report_path = PipelineProfiler(top=top).profile(script, output_dir, list(script_args))
+    click.echo(report_path.read_text())
+    click.echo(f"Report, pstats and Chrome trace written to {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
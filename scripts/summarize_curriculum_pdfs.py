@@ -1,10 +1,11 @@
 import asyncio
 import os
 
-import openai
+from loguru import logger
 
 from lairn.config import MAIN_DIR
 from lairn.curriculum.summarize_curriculum import CurriculumSummarizer
+from lairn.llm.telemetry import TELEMETRY
 
 
 async def main():
@@ -23,19 +24,9 @@ async def main():
         with open(out_path, "w") as f:
             f.write(result)
 
-
-async def main_safe():
-    """Same as main, but waits 5seconds and retries in case of
-    openai.RateLimitError"""
-    while True:
-        try:
-            await main()
-            break
-        except openai.RateLimitError:
-            print("Rate limit error, waiting 5 seconds")
-            await asyncio.sleep(5)
+    logger.info(TELEMETRY.summary())
 
 
 # Run the main function using asyncio
 if __name__ == "__main__":
-    asyncio.run(main_safe())
+    asyncio.run(main())
@@ -1,7 +1,9 @@
+import asyncio
 import traceback
 from datetime import date
 
 from lairn.config import MAIN_DIR
+from lairn.llm.telemetry import TELEMETRY
 from lairn.reporting.week_summarizer import WeekSummarizer
 
 
@@ -22,24 +24,14 @@ def main(use_this_week=False):
     target_week = this_week if use_this_week else last_week
 
     start_date = date.fromisocalendar(year, target_week, 1)
-    end_date = date.fromisocalendar(year, target_week, 7)
-    json_file_name = f"{year}_week_{target_week}_{start_date}-{end_date}.json"
-    md_file_name = f"{year}_week_{target_week}_{start_date}-{end_date}.md"
 
     try:
-        json_out_path = out_dir / json_file_name
-        if json_out_path.exists():
-            raise FileExistsError(f"File {json_out_path} already exists")
-
-        summary = summarizer.summarize_week(start_date, end_date)
-
-        with open(json_out_path, "w") as f:
-            f.write(summary.json())
-        with open(out_dir / md_file_name, "w") as f:
-            md_str = summary.str_fmt()
-            if "## Other" in md_str:
-                md_str = md_str.replace("## Other", "## Weiteres")
-            f.write(md_str)
+        # Only calls the LLM if the logs or activities of the week changed since its last summary
+        summary = asyncio.run(summarizer.aupdate_week(start_date, out_dir))
+        if summary is None:
+            print(f"Week {target_week} is unchanged")
+
+        print(TELEMETRY.summary())
     except Exception as e:
         print(f"Error summarizing week {target_week}:\n {traceback.format_exc()}\n\n")
 
@@ -17,16 +17,17 @@ EXPORTS_DIR = SOFA_DIR / "sofatutor_exports"
 PARSED_DIR = SOFA_DIR / "sofatutor_parsed"
 ACTIVITIES_OUTPUT_DIR = Path("/home/carlo/private/lairn/tmp/")
 
-DF_SOFA = pd.read_excel(PARSED_DIR / "sofatutor_videos.xlsx")
 
-# Example usage
-file_path = SOFA_DIR / "sofatutor_exports" / "20240729_export" / "Mein Sofa.html"
-activities = parse_html_file(file_path)
+@lru_cache
+def load_sofa_videos() -> pd.DataFrame:
+    # Read on first use, not on import: the sheet takes seconds to load
+    return pd.read_excel(PARSED_DIR / "sofatutor_videos.xlsx")
 
 
 @lru_cache
 def find_video_row(url: str) -> Tuple[int, pd.Series]:
-    rows = DF_SOFA[DF_SOFA.url.str.contains(url)]
+    df_sofa = load_sofa_videos()
+    rows = df_sofa[df_sofa.url.str.contains(url)]
     related_years = rows.year.unique()
     return related_years, rows.iloc[0]
 
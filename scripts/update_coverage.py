@@ -0,0 +1,13 @@
+from lairn.context_mixin import ContextMixinClassLevel2
+
+
+def main():
+    context = ContextMixinClassLevel2()
+    matrix = context.update_coverage()
+
+    print(f"Coverage matrix: {len(matrix.targets)} learning targets x {len(matrix.weeks)} weeks")
+    print(matrix.to_frame("counts").sum(axis=1).groupby(level="subject").sum())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+from datetime import date, datetime
+
+import numpy as np
+
+from lairn.curriculum.models import Curriculum, CurriculumSection
+from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity
+from lairn.learn_log import LearnLogMessage
+from lairn.reporting.coverage import CoverageEngine, CoverageMatrix
+
+CURRICULA = {
+    "Mathematik": Curriculum(
+        subject="Mathematik",
+        grades=[1, 2],
+        sections=[
+            CurriculumSection(
+                title="Zahlen und Operationen",
+                learning_targets=["Einmaleins auswendig können", "Schriftliche Addition anwenden"],
+            )
+        ],
+    )
+}
+
+
+def _log(text: str, day: int = 1) -> LearnLogMessage:
+    return LearnLogMessage(user="U1", timestamp=datetime(2024, 7, day, 9), text=text)
+
+
+def _activity(tasks_completed: int) -> SofatutorLearningActivity:
+    return SofatutorLearningActivity(
+        date_ref=date(2024, 7, 2),
+        subject_label="Mathematik",
+        title="Einmaleins üben",
+        activity_type="practice",
+        total_tasks=10,
+        tasks_completed=tasks_completed,
+        url="https://www.sofatutor.com/mathematik/einmaleins",
+        related_years=[2],
+        year_type="grade",
+        topic_chain=None,
+        description=None,
+    )
+
+
+def _cell(matrix: CoverageMatrix, values: str = "counts") -> int:
+    return int(getattr(matrix, values)[0, matrix.weeks.index("2024-W27")])
+
+
+def test_update_replaces_edited_logs_instead_of_counting_them_twice():
+    engine = CoverageEngine(CURRICULA)
+    matrix = engine.update(None, [_log("Einmaleins geübt")], [])
+
+    matrix = engine.update(matrix, [_log("Einmaleins auswendig geübt")], [])
+
+    assert _cell(matrix) == 1
+    assert len(matrix.contributions) == 1
+
+
+def test_update_replaces_changed_sofatutor_scores():
+    engine = CoverageEngine(CURRICULA)
+    matrix = engine.update(None, [], [_activity(tasks_completed=4)])
+
+    matrix = engine.update(matrix, [], [_activity(tasks_completed=9)])
+
+    assert _cell(matrix) == 1
+    assert _cell(matrix, "tasks_completed") == 9
+    assert _cell(matrix, "total_tasks") == 10
+
+
+def test_update_removes_deleted_records():
+    engine = CoverageEngine(CURRICULA)
+    matrix = engine.update(None, [_log("Einmaleins geübt"), _log("Einmaleins wiederholt", day=2)], [])
+
+    matrix = engine.update(matrix, [_log("Einmaleins geübt")], [])
+
+    assert _cell(matrix) == 1
+    assert matrix.counts.sum() == 1
+
+
+def test_update_of_saved_matrix_matches_a_rebuild(tmp_path):
+    engine = CoverageEngine(CURRICULA)
+    saved = engine.update(None, [_log("Einmaleins geübt"), _log("Addition geübt", day=3)], [_activity(3)])
+    saved.save(tmp_path)
+
+    logs, activities = [_log("Schriftliche Addition geübt", day=3)], [_activity(7)]
+    updated = engine.update(CoverageMatrix.load(tmp_path), logs, activities)
+    rebuilt = engine.update(None, logs, activities)
+
+    assert np.array_equal(updated.counts, rebuilt.counts)
+    assert np.array_equal(updated.tasks_completed, rebuilt.tasks_completed)
+    assert np.array_equal(updated.total_tasks, rebuilt.total_tasks)
@@ -0,0 +1,36 @@
+import asyncio
+from collections import Counter
+
+from lairn.fanout import fan_out
+
+
+def test_fan_out_retries_only_failed_items():
+    runs = Counter()
+
+    async def run(item: int) -> int:
+        runs[item] += 1
+        if item == 2 and runs[item] == 1:
+            raise RuntimeError("flaky")
+        return item * 10
+
+    outcome = asyncio.run(fan_out(range(4), run))
+
+    assert outcome.results == {0: 0, 1: 10, 2: 20, 3: 30}
+    assert not outcome.failures
+    assert runs == {0: 1, 1: 1, 2: 2, 3: 1}
+
+
+def test_nested_fan_out_failures_are_not_retried_again():
+    runs = Counter()
+
+    async def leaf(item: int) -> int:
+        runs[item] += 1
+        raise RuntimeError("down")
+
+    async def branch(items: tuple[int, ...]) -> None:
+        (await fan_out(items, leaf)).raise_for_failures()
+
+    outcome = asyncio.run(fan_out([(1, 2), (3,)], branch))
+
+    assert set(outcome.failures) == {(1, 2), (3,)}
+    assert runs == {1: 2, 2: 2, 3: 2}
@@ -0,0 +1,133 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage
+
+from lairn.llm.fake import FakeChatModel
+from lairn.llm.gateway import FairScheduler, LLMGateway, llm_priority
+
+
+class CountingModel(FakeChatModel):
+    calls: int = 0
+    prompts: list[str] = []
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        self.prompts.append(messages[0].content)
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+def _request(text: str) -> list:
+    return [HumanMessage(content=text)]
+
+
+def test_identical_concurrent_requests_share_one_call():
+    model = CountingModel(latency=0.01)
+    gateway = LLMGateway()
+
+    async def run():
+        return await asyncio.gather(*[gateway.agenerate(model, _request("same")) for _ in range(3)])
+
+    results = asyncio.run(run())
+
+    assert model.calls == 1
+    assert [bool(result.llm_output.get("coalesced")) for result in results] == [False, True, True]
+    assert len({result.generations[0].message.content for result in results}) == 1
+
+
+def test_different_and_sequential_requests_are_not_coalesced():
+    model = CountingModel(latency=0.01)
+    gateway = LLMGateway()
+
+    async def run():
+        await asyncio.gather(gateway.agenerate(model, _request("a")), gateway.agenerate(model, _request("b")))
+        await gateway.agenerate(model, _request("a"))
+
+    asyncio.run(run())
+
+    assert model.calls == 3
+
+
+def test_cancelled_first_caller_does_not_cancel_the_shared_request():
+    model = CountingModel(latency=0.05)
+    gateway = LLMGateway()
+
+    async def run():
+        first = asyncio.ensure_future(gateway.agenerate(model, _request("same")))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(gateway.agenerate(model, _request("same")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    result = asyncio.run(run())
+
+    assert model.calls == 1
+    assert result.llm_output["coalesced"]
+
+
+async def _admission_order(requests: list[tuple[str, str]]) -> list[str]:
+    scheduler = FairScheduler(concurrency=1, rate_limiter=None)
+    order = []
+
+    async def request(name: str, priority: str):
+        async with scheduler.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    # Hold the only slot until all requests are queued
+    await scheduler.acquire("normal")
+    tasks = [asyncio.ensure_future(request(name, priority)) for name, priority in requests]
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_scheduler_admits_waiting_classes_in_proportion_to_their_weights():
+    requests = [(f"b{i}", "backfill") for i in range(8)] + [(f"n{i}", "normal") for i in range(8)]
+
+    order = asyncio.run(_admission_order(requests))
+
+    # Normal has four times the weight of backfill
+    assert sorted(order[:10]) == ["b0", "b1", *[f"n{i}" for i in range(8)]]
+
+
+def test_interactive_requests_overtake_a_queued_backfill():
+    requests = [(f"b{i}", "backfill") for i in range(6)] + [("i0", "interactive"), ("i1", "interactive")]
+
+    order = asyncio.run(_admission_order(requests))
+
+    assert order[:2] == ["i0", "i1"]
+
+
+def test_coalesced_interactive_caller_raises_the_priority_of_a_queued_backfill_request():
+    model = CountingModel(latency=0.01)
+    gateway = LLMGateway(concurrency=1)
+
+    async def run():
+        with llm_priority("backfill"):
+            backfill = [asyncio.ensure_future(gateway.agenerate(model, _request(f"b{i}"))) for i in range(5)]
+            backfill.append(asyncio.ensure_future(gateway.agenerate(model, _request("shared"))))
+        await asyncio.sleep(0.001)
+        with llm_priority("interactive"):
+            await gateway.agenerate(model, _request("shared"))
+        await asyncio.gather(*backfill)
+
+    asyncio.run(run())
+
+    assert model.calls == 6
+    assert model.prompts.index("shared") == 1
+
+
+def test_sync_requests_are_only_rate_limited():
+    gateway = LLMGateway(concurrency=1, rpm=60_000)
+
+    async def run():
+        # A sync request does not wait for the concurrency slot held by an async one
+        await gateway.scheduler().acquire("backfill")
+        return gateway.generate(FakeChatModel(), _request("sync"))
+
+    result = asyncio.run(run())
+
+    assert result.generations[0].message.content
+    assert gateway.rate_limiter._next_slot > 0
@@ -0,0 +1,35 @@
+from lairn.reporting.glossary import Glossary
+
+EXPLANATIONS = """Wichtig: Alle Zeiten sind in Minuten angegeben.
+
+## Anton (Anton-App)
+
+Anton ist eine Lern-App.
+
+## Einmaleins
+
+Die Malreihen von 1 bis 10.
+"""
+
+
+def test_select_keeps_the_preamble_without_matching_entries():
+    glossary = Glossary.parse(EXPLANATIONS)
+
+    assert glossary.select("Heute Mathe") == "Wichtig: Alle Zeiten sind in Minuten angegeben."
+
+
+def test_select_keeps_the_whole_file_without_headings():
+    markdown = "Wichtig: Alle Zeiten sind in Minuten angegeben.\n\nAnton ist eine Lern-App."
+    glossary = Glossary.parse(markdown)
+
+    assert glossary.select("Heute Mathe") == markdown
+
+
+def test_select_adds_the_mentioned_entries():
+    glossary = Glossary.parse(EXPLANATIONS)
+
+    selected = glossary.select("Einmaleinsreihe mit der Anton-App geübt")
+
+    assert selected.startswith("Wichtig:")
+    assert "## Anton (Anton-App)" in selected
+    assert "## Einmaleins" in selected
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timedelta, timezone
+
+from lairn.integrations.sofatutor.activity_list_parser import SofatutorLearningActivity
+from lairn.learn_log import LearnLogMessage
+from lairn.reporting.log_table import ActivityTable, LogTable
+
+
+def _log(timestamp: datetime, text: str = "geübt", user: str = "U1") -> LearnLogMessage:
+    return LearnLogMessage(user=user, timestamp=timestamp, text=text)
+
+
+def _activity(day: date, subject: str = "Mathematik") -> SofatutorLearningActivity:
+    return SofatutorLearningActivity(
+        date_ref=day,
+        subject_label=subject,
+        title="Einmaleins üben",
+        activity_type="practice",
+        total_tasks=10,
+        tasks_completed=4,
+        url="https://www.sofatutor.com/mathematik/einmaleins",
+        related_years=[2],
+        year_type="grade",
+        topic_chain=None,
+        description=None,
+    )
+
+
+def _texts(records) -> list[str]:
+    return [record.text for record in records]
+
+
+def test_range_includes_the_whole_end_date_and_nothing_after_it():
+    table = LogTable.from_logs(
+        [
+            _log(datetime(2024, 7, 1, 0, 0), "start"),
+            _log(datetime(2024, 6, 30, 23, 59, 59, 999999), "before"),
+            _log(datetime(2024, 7, 7, 23, 59, 59, 999999), "last"),
+            _log(datetime(2024, 7, 8, 0, 0), "after"),
+        ]
+    )
+
+    assert _texts(table.between(date(2024, 7, 1), date(2024, 7, 7))) == ["start", "last"]
+    assert _texts(table.between(date(2024, 7, 8), date(2024, 7, 8))) == ["after"]
+    assert _texts(table.between(date(2024, 7, 2), date(2024, 7, 6))) == []
+    assert _texts(table.between(date(2024, 7, 7), date(2024, 7, 1))) == []
+
+
+def test_aware_timestamps_are_queried_by_their_own_date():
+    plus_two = timezone(timedelta(hours=2))
+    late = datetime(2024, 7, 7, 23, 30, tzinfo=plus_two)
+    table = LogTable.from_logs([_log(late, "late"), _log(datetime(2024, 7, 8, 0, 30, tzinfo=timezone.utc))])
+
+    (record,) = table.between(date(2024, 7, 1), date(2024, 7, 7))
+
+    assert record.timestamp == late
+    assert record.timestamp.tzinfo == plus_two
+
+
+def test_activity_range_includes_both_dates():
+    table = ActivityTable.from_activities(
+        [_activity(date(2024, 7, 8)), _activity(date(2024, 7, 1)), _activity(date(2024, 6, 30))]
+    )
+
+    assert [a.date_ref for a in table.between(date(2024, 7, 1), date(2024, 7, 7))] == [date(2024, 7, 1)]
+
+
+def test_replace_rows_matches_a_table_built_from_scratch():
+    logs = {
+        1: [_log(datetime(2024, 7, 1, 9), "a1"), _log(datetime(2024, 7, 3, 9), "a2")],
+        2: [_log(datetime(2024, 7, 2, 9), "b1", user="U2")],
+    }
+    table = LogTable.from_logs(logs[1] + logs[2], [1, 1, 2])
+
+    edited = [_log(datetime(2024, 7, 2, 8), "a1 geändert", user="U3")]
+    table = table.replace_rows([1], LogTable.from_logs(edited, [3]))
+
+    assert _texts(table) == ["a1 geändert", "b1"]
+    assert [log.user for log in table] == ["U3", "U2"]
+    assert list(table.ids) == [3, 2]
+    assert list(table) == list(LogTable.from_logs(edited + logs[2]))
+
+
+def test_replace_rows_of_activities_keeps_the_order_of_equal_dates():
+    day = date(2024, 7, 1)
+    table = ActivityTable.from_activities([_activity(day, "Deutsch"), _activity(day, "Mathematik")], [1, 2])
+
+    table = table.replace_rows([], ActivityTable.from_activities([_activity(day, "Englisch")], [3]))
+    table = table.replace_rows([1], ActivityTable.from_activities([], []))
+
+    assert [a.subject_label for a in table] == ["Mathematik", "Englisch"]
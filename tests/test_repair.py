@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import PydanticOutputParser
+from pydantic import BaseModel
+
+from lairn.llm.fake import FakeChatModel
+from lairn.llm.repair import REPAIR_STATS, OutputRepairError, OutputRepairer
+
+
+class Item(BaseModel):
+    name: str
+    count: int
+
+
+class Items(BaseModel):
+    items: list[Item]
+
+
+def _repairer(**kwargs) -> OutputRepairer:
+    response_format = PydanticOutputParser(pydantic_object=Items).get_format_instructions()
+    return OutputRepairer(FakeChatModel(), Items, response_format, **kwargs)
+
+
+def _stats_after(parse) -> tuple:
+    before = REPAIR_STATS.copy()
+    result = parse()
+    return result, REPAIR_STATS - before
+
+
+def test_local_fixes_repair_fences_trailing_commas_and_quotes():
+    text = 'Hier ist das Ergebnis:\n```json\n{“items”: [{"name": "„Igel“", "count": 2},]}\n```'
+
+    result, stats = _stats_after(lambda: _repairer().parse(AIMessage(content=text)))
+
+    assert result == Items(items=[Item(name="„Igel“", count=2)])
+    assert stats == {"local": 1}
+
+
+def test_invalid_items_are_regenerated_without_a_repair_request():
+    async def regenerate_items(data: dict, error: Exception) -> Items:
+        return Items(items=[item for item in data["items"] if isinstance(item["count"], int)])
+
+    text = '{"items": [{"name": "a", "count": 1}, {"name": "b", "count": "viele"}]}'
+
+    result, stats = _stats_after(
+        lambda: asyncio.run(_repairer(regenerate_items=regenerate_items).aparse(AIMessage(content=text)))
+    )
+
+    assert result == Items(items=[Item(name="a", count=1)])
+    assert stats == {"items": 1}
+
+
+def test_unrepairable_output_is_repaired_by_the_model():
+    text = "Ich kann diese Anfrage leider nicht beantworten."
+
+    result, stats = _stats_after(lambda: asyncio.run(_repairer().aparse(AIMessage(content=text))))
+
+    assert isinstance(result, Items)
+    assert stats == {"llm": 1}
+
+
+def test_failed_repair_keeps_the_decoded_json():
+    text = '{"items": [{"name": "a", "count": "viele"}]}'
+
+    with pytest.raises(OutputRepairError) as raised:
+        _repairer(max_llm_repairs=0).parse(AIMessage(content=text))
+
+    assert raised.value.data == {"items": [{"name": "a", "count": "viele"}]}
@@ -0,0 +1,30 @@
+from uuid import uuid4
+
+from langchain_core.outputs import LLMResult
+
+from lairn.llm.telemetry import LLMTelemetry
+
+
+def _call(telemetry: LLMTelemetry, stage: str, latency: float):
+    run_id = uuid4()
+    telemetry.on_llm_start({}, ["prompt"], run_id=run_id, metadata={"stage": stage})
+    telemetry._running[run_id]["start"] -= latency
+    telemetry.on_llm_end(LLMResult(generations=[]), run_id=run_id)
+
+
+def test_stage_summary_keeps_totals_without_records(tmp_path):
+    telemetry = LLMTelemetry(tmp_path)
+    for latency in (0.05, 0.3, 0.4, 3.0):
+        _call(telemetry, "parse", latency)
+
+    summary = telemetry.stage_summary()["parse"]
+
+    assert telemetry.records == []
+    assert summary["calls"] == 4
+    assert 0.25 <= summary["p50_latency"] <= 0.5
+    assert 2.0 <= summary["p95_latency"] <= 3.1
+    assert len((tmp_path / "llm_calls.jsonl").read_text().splitlines()) == 4
+    assert (
+        'lairn_llm_latency_seconds_bucket{stage="parse",le="0.5"} 3'
+        in (tmp_path / "lairn_llm.prom").read_text()
+    )
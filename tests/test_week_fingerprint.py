@@ -0,0 +1,63 @@
+import asyncio
+import json
+from datetime import date
+
+import pytest
+
+from lairn import config
+from lairn.reporting.week_summarizer import WeekSummarizer
+
+MONDAY = date(2024, 7, 1)
+CURRICULUM = {
+    "subject": "Mathematik",
+    "grades": [1, 2],
+    "sections": [{"title": "Zahlen", "learning_targets": ["Einmaleins auswendig können"]}],
+}
+
+
+def _write_log(main_dir, name: str, text: str):
+    log = {"User": "carlo", "timestamp": "2024-07-02T09:00:00", "text": text}
+    (main_dir / "slack_log_messages" / name).write_text(json.dumps(log))
+
+
+@pytest.fixture
+def main_dir(tmp_path, monkeypatch):
+    curricula_dir = tmp_path / "Schullehrplan_Grundschule_Zusammenfassungen" / "Schuljahre 1-2" / "pydantic"
+    curricula_dir.mkdir(parents=True)
+    (curricula_dir / "Mathematik.json").write_text(json.dumps(CURRICULUM))
+    (tmp_path / "slack_log_messages").mkdir()
+    (tmp_path / "weekly_summaries").mkdir()
+    (tmp_path / "additional_explanations.md").write_text("## Anton\n\nEine Lern-App.\n")
+    _write_log(tmp_path, "log_0.json", "Einmaleins mit Anton geübt")
+    monkeypatch.setenv("MAIN_DIR", str(tmp_path))
+    monkeypatch.setenv("STUDENT_BIRTH_DATE", "2017-03-01")
+    config.refresh()
+    yield tmp_path
+    config.refresh()
+
+
+def _update(main_dir, force: bool = False):
+    summarizer = WeekSummarizer(model_name="fake")
+    return asyncio.run(summarizer.aupdate_week(MONDAY, main_dir / "weekly_summaries", force=force))
+
+
+def test_unchanged_week_is_skipped(main_dir):
+    assert _update(main_dir) is not None
+    assert _update(main_dir) is None
+    assert _update(main_dir, force=True) is not None
+
+
+def test_changed_log_is_summarized_again(main_dir):
+    _update(main_dir)
+
+    _write_log(main_dir, "log_0.json", "Einmaleins mit Anton wiederholt")
+
+    assert _update(main_dir) is not None
+
+
+def test_birthday_does_not_change_past_weeks(main_dir, monkeypatch):
+    _update(main_dir)
+
+    monkeypatch.setattr("lairn.common.get_student_age_today", lambda: 99)
+
+    assert _update(main_dir) is None